@@ -0,0 +1,274 @@
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from Classifier import DEFAULT_BATCH_SIZE
+from Stats import Stats
+
+# seconds the first request of a batch may wait for others to join it
+DEFAULT_MAX_DELAY = 0.005
+# number of most recent requests the latency percentiles are taken over
+LATENCY_WINDOW = 10000
+# longest request line a connection accepts, in bytes
+MAX_LINE_SIZE = 1 << 20
+
+
+class ClassificationServer:
+    # Serves a loaded classifier over a Unix or TCP socket, one JSON object per line each way. A request is either
+    # {"tweet": "..."}, answered with the language, its score and the score of every language, or {"command": "stats"},
+    # answered with the queue depth, batch counts and latency percentiles. Any "id" in a request is sent back with its
+    # response, and every connection gets its responses in the order it sent the requests.
+    # Requests from every connection wait in one queue and are scored together by Classifier.predict_batch: a batch is
+    # sent as soon as it has batch_size tweets or its first tweet has waited max_delay seconds. Batches are scored one
+    # at a time on a worker thread, so the model is never used by two batches at once and requests keep being read
+    # while one is scored
+    def __init__(self, classifier, batch_size=DEFAULT_BATCH_SIZE, max_delay=DEFAULT_MAX_DELAY):
+        self.classifier = classifier
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.queue = None
+        # set once enough requests are queued to fill the batch being gathered
+        self.batch_full = None
+        self.batch_task = None
+        self.connection_tasks = set()
+        self.executor = ThreadPoolExecutor(1)
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.request_count = 0
+        self.batch_count = 0
+        self.scoring = 0
+
+    async def start(self, path=None, host='127.0.0.1', port=0):
+        # listens on the Unix socket at path, or else on host and port (any free port for 0), and returns the
+        # asyncio server, whose sockets give the address it is listening on
+        if not self.classifier.training_model.frozen:
+            self.classifier.training_model.freeze()
+        self.queue = asyncio.Queue()
+        self.batch_full = asyncio.Event()
+        self.batch_task = asyncio.create_task(self.run_batches())
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle_connection, path, limit=MAX_LINE_SIZE)
+        return await asyncio.start_server(self.handle_connection, host, port, limit=MAX_LINE_SIZE)
+
+    async def serve_forever(self, path=None, host='127.0.0.1', port=0):
+        server = await self.start(path, host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def stop(self, server):
+        # stops listening and drops the open connections along with the requests they are waiting for
+        server.close()
+        for task in self.connection_tasks:
+            task.cancel()
+        await asyncio.gather(*self.connection_tasks, return_exceptions=True)
+        await server.wait_closed()
+        self.batch_task.cancel()
+        self.executor.shutdown()
+
+    async def classify(self, tweet):
+        # the in-process client: (language, score, {language: score}) for a tweet, batched like a socket request
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((tweet, future, time.perf_counter()))
+        if self.queue.qsize() >= self.batch_size - 1:
+            self.batch_full.set()
+        return await future
+
+    async def run_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            self.batch_full.clear()
+            if self.queue.qsize() < self.batch_size - 1:
+                try:
+                    await asyncio.wait_for(self.batch_full.wait(), batch[0][2] + self.max_delay - time.perf_counter())
+                except asyncio.TimeoutError:
+                    pass
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            self.scoring = len(batch)
+            try:
+                predictions = await loop.run_in_executor(self.executor, self.predict_batch,
+                                                         [tweet for tweet, _, _ in batch])
+            finally:
+                self.scoring = 0
+
+            now = time.perf_counter()
+            languages = self.classifier.training_model.languages
+            for (_, future, arrival), prediction in zip(batch, predictions):
+                self.latencies.append(now - arrival)
+                if future.done():
+                    continue
+                if isinstance(prediction, Exception):
+                    future.set_exception(prediction)
+                else:
+                    language, score, scores = prediction
+                    future.set_result((language, score, dict(zip(languages, scores.tolist()))))
+            self.request_count += len(batch)
+            self.batch_count += 1
+            if Stats.enabled:
+                Stats.count('served_requests', len(batch))
+                Stats.count('served_batches')
+
+    def predict_batch(self, tweets):
+        # the prediction of every tweet, or the exception scoring it raised. A batch that fails is scored again one
+        # tweet at a time, so that a bad request only fails itself and not the others it was batched with
+        try:
+            return self.classifier.predict_batch(tweets)
+        except Exception as error:
+            if len(tweets) == 1:
+                return [error]
+        predictions = []
+        for tweet in tweets:
+            try:
+                predictions.append(self.classifier.predict_batch([tweet])[0])
+            except Exception as error:
+                predictions.append(error)
+        return predictions
+
+    async def handle_connection(self, reader, writer):
+        # requests are read as they come, and their responses written in order as they are ready
+        task = asyncio.current_task()
+        self.connection_tasks.add(task)
+        responses = asyncio.Queue()
+        writer_task = asyncio.create_task(ClassificationServer.write_responses(responses, writer))
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    await responses.put(ClassificationServer.get_error_response(None, 'request line too long'))
+                    break
+                if not line:
+                    break
+                if line.strip():
+                    await responses.put(self.respond(line))
+            await responses.put(None)
+            await writer_task
+        except asyncio.CancelledError:
+            # dropped by stop. Not raised again, as the stream callback of some Python versions logs a cancelled
+            # connection handler as an error
+            pass
+        finally:
+            writer_task.cancel()
+            self.connection_tasks.discard(task)
+
+    @staticmethod
+    async def write_responses(responses, writer):
+        try:
+            while True:
+                response = await responses.get()
+                if response is None:
+                    break
+                writer.write(ClassificationServer.encode(await response))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def respond(self, line):
+        # the response to a request line, as an awaitable, so that the next line can be read before it is ready
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return ClassificationServer.get_error_response(None, 'request is not valid JSON')
+        if not isinstance(request, dict):
+            return ClassificationServer.get_error_response(None, 'request is not a JSON object')
+
+        request_id = request.get('id')
+        if request.get('command') == 'stats':
+            return ClassificationServer.get_stats_response(request_id, self.get_report())
+
+        tweet = request.get('tweet')
+        if not isinstance(tweet, str) or not tweet.strip():
+            return ClassificationServer.get_error_response(request_id, 'request has no tweet')
+        return asyncio.ensure_future(self.get_classification_response(request_id, tweet))
+
+    async def get_classification_response(self, request_id, tweet):
+        try:
+            language, score, scores = await self.classify(tweet)
+        except Exception as error:
+            return {'id': request_id, 'error': str(error)}
+        # a language left out by top1 has no score
+        scores = {language: None if score != score else score for language, score in scores.items()}
+        return {'id': request_id, 'language': language, 'score': score, 'scores': scores}
+
+    @staticmethod
+    async def get_stats_response(request_id, report):
+        return dict(report, id=request_id)
+
+    @staticmethod
+    async def get_error_response(request_id, message):
+        return {'id': request_id, 'error': message}
+
+    @staticmethod
+    def encode(response):
+        return (json.dumps(response) + '\n').encode('utf-8')
+
+    def get_report(self):
+        # the queue depth counts the requests waiting for a batch and those of the batch being scored, and a
+        # classifier with a score cache adds its counters
+        report = {
+            'queue_depth': self.queue.qsize() + self.scoring,
+            'requests': self.request_count,
+            'batches': self.batch_count,
+            'mean_batch_size': self.request_count / self.batch_count if self.batch_count else None,
+            'p50_ms': None,
+            'p99_ms': None,
+        }
+        if self.latencies:
+            p50, p99 = np.percentile(np.array(self.latencies), [50, 99]) * 1000
+            report['p50_ms'] = float(p50)
+            report['p99_ms'] = float(p99)
+        if self.classifier.score_cache is not None:
+            report['cache'] = self.classifier.score_cache.get_report()
+        return report
+
+
+class ClassificationClient:
+    # Sends requests to a ClassificationServer over its socket. Requests can be sent before the previous responses
+    # have come back, which is how one client gets its tweets batched together
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @staticmethod
+    async def connect(path=None, host='127.0.0.1', port=None):
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path, limit=MAX_LINE_SIZE)
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit=MAX_LINE_SIZE)
+        return ClassificationClient(reader, writer)
+
+    async def request(self, request):
+        return (await self.request_many([request]))[0]
+
+    async def request_many(self, requests):
+        # every request is written before any response is read
+        for request in requests:
+            self.writer.write(ClassificationServer.encode(request))
+        await self.writer.drain()
+        responses = []
+        for _ in requests:
+            line = await self.reader.readline()
+            if not line:
+                raise ConnectionError('the server closed the connection')
+            responses.append(json.loads(line))
+        return responses
+
+    async def classify(self, tweet):
+        return await self.request({'tweet': tweet})
+
+    async def classify_many(self, tweets):
+        return await self.request_many([{'id': index, 'tweet': tweet} for index, tweet in enumerate(tweets)])
+
+    async def get_stats(self):
+        return await self.request({'command': 'stats'})
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
@@ -1,19 +1,54 @@
-from math import log10
+from itertools import tee
 
+import numpy as np
+
+from CorpusReader import CorpusReader
 from Evaluation import Eval
-from TrainingModelFactory import TrainingModelFactory, BYOMTrainingModel
+from ModelStorage import ModelStorage
+from QuantizedModel import QuantizedModel
+from ScoreCache import ScoreCache
+from Stats import Stats
+from TrainingModelFactory import TrainingModelFactory, TrainingModel, BYOMTrainingModel
 from VocabularyFactory import VocabularyFactory, CaseInsensitiveAlphabetChars, IsAlphaChars
 
 
+DEFAULT_BATCH_SIZE = 256
+
+
 class Classifier:
-    def __init__(self, training_file, test_file, byom, vocabulary=None, ngram_size=None, smoothing_value=None):
+    def __init__(self, training_file, test_file, byom, vocabulary=None, ngram_size=None, smoothing_value=None,
+                 backend='dict', model_file=None, top1=False, cache_size=0):
         self.test_file = test_file
+        self.model_file = model_file
+        # only score the languages that can still be the most likely one, the others are left out of the scores
+        self.top1 = top1
+        # predictions of the last cache_size distinct tweets, none are kept for 0
+        self.score_cache = ScoreCache(cache_size) if cache_size else None
+
+        if model_file is not None:
+            # a quantized export is scored like the model it was made from
+            if ModelStorage.read_header(model_file).get('model') == QuantizedModel.model_type:
+                self.training_model = QuantizedModel.load(model_file)
+            else:
+                self.training_model = TrainingModel.load(model_file)
+            self.vocabulary = self.training_model.vocabulary
+            if self.training_model.model_type == BYOMTrainingModel.model_type:
+                self.trace_file = 'trace_myModel.txt'
+                self.eval_file = 'eval_myModel.txt'
+            else:
+                suffix = str.join('_', [self.vocabulary.vocabulary_type, str(self.training_model.ngram_size),
+                                        str(self.training_model.smoothing_value)])
+                self.trace_file = 'trace_' + suffix + '.txt'
+                self.eval_file = 'eval_' + suffix + '.txt'
 
-        if byom:
+        elif byom:
             self.vocabulary = IsAlphaChars()
             self.trace_file = 'trace_myModel.txt'
             self.eval_file = 'eval_myModel.txt'
-            self.training_model = BYOMTrainingModel(self.vocabulary, 1*10**-50, training_file)
+            # BYOM is of order 3 unless the trie backend is given another ngram size
+            self.training_model = TrainingModelFactory.get_byom_training_model(self.vocabulary, 1*10**-50,
+                                                                               training_file, backend,
+                                                                               int(ngram_size or 3))
 
         else:
             self.vocabulary = VocabularyFactory.get_vocabulary(vocabulary)
@@ -29,44 +64,79 @@ class Classifier:
             self.eval_file = 'eval_' + vocabulary + '_' + ngram_size + '_' + str(smoothing_value) + '.txt'
             self.training_model = TrainingModelFactory.get_nb_training_model(self.vocabulary, ngram_size,
                                                                              smoothing_value,
-                                                                             training_file)
+                                                                             training_file, backend)
 
-    def classify(self):
-        self.training_model.train()
-        self.test()
+    def classify(self, batch_size=DEFAULT_BATCH_SIZE):
+        # a model loaded from a file is already trained
+        if self.model_file is None:
+            self.training_model.train()
+        with Stats.stage('freeze'):
+            self.training_model.freeze()
+        self.test(batch_size)
+
+    def save_model(self, model_file, processes=1):
+        self.training_model.train(processes)
+        self.training_model.save(model_file)
 
     def get_most_frequent_ngrams(self):
         self.training_model.train()
         return self.training_model.get_ten_most_frequent_ngrams()
 
-    def test(self):
-        input_file = open(self.test_file, 'r', encoding="utf-8")
-        output_file = open(self.trace_file, 'w', encoding="utf-8")
-        for line in input_file:
-            # skip empty lines
-            if line is "\n":
-                continue
-
-            partitioned_line = line.split(maxsplit=3)
-            id = partitioned_line[0]
-            actual_language = partitioned_line[2]
-            tweet = partitioned_line[3]
-
-            if isinstance(self.vocabulary, CaseInsensitiveAlphabetChars):
-                tweet = tweet.lower()
-
-            highest_score = None
-            language_with_highest_score = None
-            for language in self.training_model.language_data.keys():
-                score = self.training_model.get_language_score_of_tweet(language, tweet)
-                if highest_score is None or highest_score < score:
-                    highest_score = score
-                    language_with_highest_score = language
-
-            languages_match = 'correct' if language_with_highest_score == actual_language else 'wrong'
-            output_file.write(str.join('  ', [id, language_with_highest_score, str(highest_score), actual_language,
-                                              languages_match]) + '\n')
-        input_file.close()
-        output_file.close()
-        eval = Eval(self.trace_file, self.eval_file)
+    def predict_iter(self, tweets, batch_size=DEFAULT_BATCH_SIZE):
+        # yields (language, score, scores of every language in the order of the model's languages) for each tweet,
+        # scoring batch_size tweets at a time
+        batch = []
+        for tweet in tweets:
+            batch.append(tweet)
+            if len(batch) == batch_size:
+                yield from self.predict_batch(batch)
+                batch = []
+        if batch:
+            yield from self.predict_batch(batch)
+
+    def predict_batch(self, tweets):
+        if isinstance(self.vocabulary, CaseInsensitiveAlphabetChars):
+            tweets = [tweet.lower() for tweet in tweets]
+
+        if self.score_cache is not None:
+            return self.score_cache.predict_batch(self.training_model, tweets, self.score_tweets)
+        return self.score_tweets(tweets)
+
+    def score_tweets(self, tweets):
+        scores = self.training_model.score_matrix(tweets, self.top1)
+        # the first language wins a tie, and the languages left out by top1 never win
+        best_languages = np.argmax(np.where(np.isnan(scores), float('-inf'), scores), axis=1)
+        highest_scores = scores[np.arange(len(tweets)), best_languages].tolist()
+        languages = self.training_model.languages
+        return [(languages[best_language], highest_score, tweet_scores) for best_language, highest_score, tweet_scores
+                in zip(best_languages.tolist(), highest_scores, scores)]
+
+    def test(self, batch_size=DEFAULT_BATCH_SIZE):
+        with Stats.stage('test'):
+            output_file = open(self.trace_file, 'w', encoding="utf-8")
+
+            records = Stats.timed_iter('read_test_file', CorpusReader.read_records(self.test_file, with_ids=True))
+            records, tweets = tee(records)
+            predictions = self.predict_iter((tweet for _, _, tweet in tweets), batch_size)
+            evaluated_predictions = []
+            trace_lines = []
+            for (id, actual_language, _), (language_with_highest_score, highest_score, _) in zip(records, predictions):
+                evaluated_predictions.append((language_with_highest_score, actual_language))
+
+                languages_match = 'correct' if language_with_highest_score == actual_language else 'wrong'
+                trace_lines.append(str.join('  ', [id, language_with_highest_score, str(highest_score),
+                                                   actual_language, languages_match]) + '\n')
+                if len(trace_lines) == batch_size:
+                    Classifier.write_trace_lines(output_file, trace_lines)
+            Classifier.write_trace_lines(output_file, trace_lines)
+            output_file.close()
+
+        # evaluated straight from the predictions instead of reading the trace back
+        eval = Eval(None, self.eval_file, evaluated_predictions, self.training_model.languages)
         eval.write_to_file()
+
+    @staticmethod
+    def write_trace_lines(output_file, trace_lines):
+        with Stats.stage('write_trace'):
+            output_file.writelines(trace_lines)
+        trace_lines.clear()
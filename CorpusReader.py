@@ -0,0 +1,56 @@
+import mmap
+import os
+
+# bytes of the corpus file decoded and split into records at a time, rounded up to the end of a line
+READ_CHUNK_SIZE = 1 << 22
+
+
+class CorpusReader:
+    # Reads a corpus file in the "id user language tweet" line format as batches of records, one per chunk of the file.
+    # The file is memory-mapped, a chunk's end is found with one search for the next newline in the mapped bytes, and
+    # the whole chunk is decoded once and split into lines and fields by str methods, so no per-line read or decode
+    # goes through the file object. Blank lines are skipped, and a tweet is the rest of its line without the newline
+    @staticmethod
+    def read_batches(path, start=0, end=None, with_ids=False):
+        # (ids, languages, tweets) lists of the records of every chunk of the byte range [start, end) of the file,
+        # which starts at the beginning of a line, with None for the ids unless with_ids is set
+        with open(path, 'rb') as input_file:
+            file_size = os.fstat(input_file.fileno()).st_size
+            end = file_size if end is None else min(end, file_size)
+            if start >= end:
+                return
+
+            with mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                while start < end:
+                    chunk_end = data.find(b'\n', min(start + READ_CHUNK_SIZE, end) - 1, end)
+                    chunk_end = end if chunk_end < 0 else chunk_end + 1
+                    text = data[start:chunk_end].decode('utf-8')
+                    start = chunk_end
+                    yield CorpusReader.parse_chunk(text, with_ids, path)
+
+    @staticmethod
+    def parse_chunk(text, with_ids, path):
+        if '\r' in text:
+            # the newlines a file opened in text mode would have read as '\n'
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+
+        ids = [] if with_ids else None
+        languages = []
+        tweets = []
+        for line in text.split('\n'):
+            fields = line.split(None, 3)
+            if len(fields) == 4:
+                if with_ids:
+                    ids.append(fields[0])
+                languages.append(fields[2])
+                tweets.append(fields[3])
+            elif fields:
+                raise ValueError('{}: expected an id, a user, a language and a tweet on the line {!r}'
+                                 .format(path, line))
+        return ids, languages, tweets
+
+    @staticmethod
+    def read_records(path, with_ids=False):
+        # (id, language, tweet) of every record of the file one at a time, the id being None unless with_ids is set
+        for ids, languages, tweets in CorpusReader.read_batches(path, with_ids=with_ids):
+            yield from zip(ids if with_ids else [None] * len(tweets), languages, tweets)
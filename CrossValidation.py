@@ -0,0 +1,133 @@
+import copy
+from multiprocessing import Pool
+
+import numpy as np
+
+from CorpusReader import CorpusReader
+from Evaluation import Eval
+from Stats import Stats
+from VocabularyFactory import CaseInsensitiveAlphabetChars
+
+
+class CrossValidation:
+    # k-fold cross-validation over one training file for about the cost of one training. Every fold's tweets are
+    # counted once into a model of their own, and the model of all the folds is their merge. The model a fold is
+    # validated with is then the whole model with the fold's counts subtracted, which is exactly the model the other
+    # folds would have trained. The file is read only once, its tweets being dealt to the folds in turn as they are
+    # read, so that a file sorted by language still gives every fold a share of every language
+    worker_model = None
+
+    def __init__(self, model, fold_count=5):
+        # model is an untrained model, which is copied for every fold
+        if fold_count < 2:
+            raise ValueError('cross-validation needs at least 2 folds')
+        self.model = model
+        self.fold_count = fold_count
+        self.results = []
+
+    def run(self, processes=1):
+        fold_batches, languages = CrossValidation.read_folds(self.model.training_file, self.fold_count)
+        fold_arguments = [(self.model, batches) for batches in fold_batches]
+        with Stats.stage('train'):
+            if processes > 1:
+                with Pool(min(processes, self.fold_count)) as pool:
+                    fold_models = pool.map(CrossValidation.count_fold, fold_arguments)
+            else:
+                fold_models = [CrossValidation.count_fold((copy.deepcopy(model), batches))
+                               for model, batches in fold_arguments]
+
+            # the languages are listed in the order they first appear in the file, as when training on all of it
+            model = copy.deepcopy(self.model)
+            for language in languages:
+                model.add_language(language)
+            for fold_model in fold_models:
+                model.add_model(fold_model)
+            model.prepare_scoring()
+
+        fold_arguments = [(fold_model, batches) for fold_model, batches in zip(fold_models, fold_batches)]
+        if processes > 1:
+            # every worker gets its own copy of the whole model once, and puts back what it subtracts for a fold
+            with Pool(min(processes, self.fold_count), CrossValidation.set_worker_model, (model,)) as pool:
+                self.results = pool.map(CrossValidation.validate_fold, fold_arguments)
+        else:
+            CrossValidation.set_worker_model(model)
+            self.results = [CrossValidation.validate_fold(arguments) for arguments in fold_arguments]
+            CrossValidation.set_worker_model(None)
+        return self.results
+
+    @staticmethod
+    def read_folds(path, fold_count):
+        # the file is read once: every fold gets the (ids, languages, tweets) batch of every fold_count-th record of
+        # each CorpusReader batch, from the fold-th record of the file on, and the languages are listed in the order
+        # they first appear in the file
+        fold_batches = [[] for _ in range(fold_count)]
+        languages = dict()
+        index = 0
+        for _, batch_languages, tweets in Stats.timed_iter('read_training_file', CorpusReader.read_batches(path)):
+            languages.update(dict.fromkeys(batch_languages))
+            for fold, batches in enumerate(fold_batches):
+                offset = (fold - index) % fold_count
+                batches.append((None, batch_languages[offset::fold_count], tweets[offset::fold_count]))
+            index += len(tweets)
+        return fold_batches, list(languages)
+
+    @staticmethod
+    def count_fold(arguments):
+        model, batches = arguments
+        for _, languages, tweets in batches:
+            model.learn_batch(languages, tweets)
+        return model
+
+    @staticmethod
+    def set_worker_model(model):
+        CrossValidation.worker_model = model
+
+    @staticmethod
+    def validate_fold(arguments):
+        # the Eval metrics of the fold's tweets classified by the model of the other folds
+        fold_model, batches = arguments
+        model = CrossValidation.worker_model
+        model.subtract(fold_model)
+        model.freeze()
+
+        tweets = []
+        actual_languages = []
+        for _, languages, batch_tweets in batches:
+            actual_languages.extend(languages)
+            tweets.extend(batch_tweets)
+        if isinstance(model.vocabulary, CaseInsensitiveAlphabetChars):
+            tweets = [tweet.lower() for tweet in tweets]
+        # the first language wins a tie, like in Classifier.predict_batch
+        predictions = np.argmax(model.score_matrix(tweets), axis=1).tolist()
+        eval = Eval(None, None, zip([model.languages[index] for index in predictions], actual_languages),
+                    model.languages)
+
+        model.unfreeze()
+        model.add_model(fold_model)
+        model.prepare_scoring()
+        return eval.get_metrics()
+
+    def get_summary(self):
+        # mean and sample standard deviation over the folds of every metric in the table
+        columns = np.array([self.get_row(metrics) for metrics in self.results], dtype=float)
+        return columns.mean(axis=0), columns.std(axis=0, ddof=1)
+
+    def get_languages(self):
+        return list(self.results[0]['f1'].keys()) if self.results else []
+
+    def get_row(self, metrics):
+        return [metrics['accuracy'], metrics['macro_f1'], metrics['weighted_f1']] + \
+            [metrics['f1'][language] for language in self.get_languages()]
+
+    def write_to_file(self, output_file):
+        output_file = open(output_file, 'w', encoding="utf-8")
+        output_file.write(str.join('  ', ['fold', 'accuracy', 'macro_f1', 'weighted_f1'] +
+                                   ['f1_' + language for language in self.get_languages()]) + '\n')
+        for fold, metrics in enumerate(self.results):
+            output_file.write(str.join('  ', [str(field) for field in [fold] + self.get_row(metrics)]) + '\n')
+        if self.results:
+            means, standard_deviations = self.get_summary()
+            output_file.write(str.join('  ', ['mean'] + [str(value) for value in means.tolist()]) + '\n')
+            output_file.write(str.join('  ', ['stddev'] + [str(value) for value in standard_deviations.tolist()]) +
+                              '\n')
+        output_file.close()
@@ -1,47 +1,67 @@
+from collections import Counter
+
+import numpy as np
+
+from Stats import Stats
+
+
 class Eval:
-    def __init__(self, trace_file, eval_file):
-        self._trace_file = open(trace_file, 'r', encoding="utf-8")
-        self._eval_file = open(eval_file, 'w', encoding="utf-8")
-        self._most_likely_correct = self.compute_most_likely_correct()
-        self._accuracy = self.compute_accuracy()
-        self._precision = self.compute_precision()
-        self._recall = self.compute_recall()
-        self._f1 = self.compute_f1()
-        self._macro_and_weighted_f1 = self.compute_macro_and_weighted_f1()
-        self._trace_file.close()
+    # All metrics are derived from one confusion matrix, built in a single pass over either the trace file or an
+    # iterable of (predicted language, actual language) pairs. The given languages (the model's) and any other language
+    # met in the predictions are listed in alphabetical order, so that the columns of an eval file do not depend on the
+    # order of the training file
+    def __init__(self, trace_file=None, eval_file=None, predictions=None, languages=()):
+        self._eval_file = eval_file
+        self._languages = list(languages)
+
+        with Stats.stage('eval'):
+            if predictions is None:
+                trace_file = open(trace_file, 'r', encoding="utf-8")
+                self.confusion_matrix = self.compute_confusion_matrix(
+                    self.read_trace(Stats.timed_iter('read_trace', trace_file)))
+                trace_file.close()
+            else:
+                self.confusion_matrix = self.compute_confusion_matrix(predictions)
+
+            self._most_likely_correct = self.compute_most_likely_correct()
+            self._accuracy = self.compute_accuracy()
+            self._precision = self.compute_precision()
+            self._recall = self.compute_recall()
+            self._f1 = self.compute_f1()
+            self._macro_and_weighted_f1 = self.compute_macro_and_weighted_f1()
+
+        if Stats.enabled:
+            Stats.count('evaluated_tweets', self.confusion_matrix.sum())
+
+    @staticmethod
+    def read_trace(trace_file):
+        for line in trace_file:
+            fields = line.split()
+            yield fields[1], fields[-2]
+
+    def compute_confusion_matrix(self, predictions):  # rows are the actual languages, columns the predicted ones
+        prediction_counts = Counter(predictions)
+        met_languages = {language for prediction in prediction_counts.keys() for language in prediction}
+        self._languages = sorted(met_languages.union(self._languages))
+
+        language_indices = {language: index for index, language in enumerate(self._languages)}
+        confusion_matrix = np.zeros((len(self._languages), len(self._languages)), dtype=np.int64)
+        for (predicted, actual), count in prediction_counts.items():
+            confusion_matrix[language_indices[actual], language_indices[predicted]] += count
+        return confusion_matrix
 
     def compute_most_likely_correct(self):  # number of documents correctly estimated, per language
-        most_likely_correct = {
-            'eu': 0, 'ca': 0, 'gl': 0, 'es': 0, 'en': 0, 'pt': 0}
-        self._trace_file.seek(0)
-        for line in self._trace_file:
-            if line.split()[-1] == 'correct':
-                most_likely_correct[line.split()[1]] += 1
-        return most_likely_correct
+        return dict(zip(self._languages, np.diagonal(self.confusion_matrix).tolist()))
 
     def compute_predicted_total(self):
-        most_likely_total = {
-            'eu': 0, 'ca': 0, 'gl': 0, 'es': 0, 'en': 0, 'pt': 0}
-        self._trace_file.seek(0)
-        for line in self._trace_file:
-            most_likely_total[line.split()[1]] += 1
-        return most_likely_total
+        return dict(zip(self._languages, self.confusion_matrix.sum(axis=0).tolist()))
 
     def compute_actual_total(self):
-        actual_total = {
-            'eu': 0, 'ca': 0, 'gl': 0, 'es': 0, 'en': 0, 'pt': 0}
-        self._trace_file.seek(0)
-        for line in self._trace_file:
-            actual_total[line.split()[-2]] += 1
-        return actual_total
+        return dict(zip(self._languages, self.confusion_matrix.sum(axis=1).tolist()))
 
     def compute_accuracy(self):
-        tweet_count = 0
-        correct_count = 0
-        self._trace_file.seek(0)
-        for line in self._trace_file:
-            correct_count += 1 if line.split()[-1] == 'correct' else 0
-            tweet_count += 1
+        tweet_count = int(self.confusion_matrix.sum())
+        correct_count = int(np.trace(self.confusion_matrix))
         return correct_count / tweet_count if tweet_count != 0 else 0.0
 
     def compute_precision(self):
@@ -98,17 +118,32 @@ class Eval:
         result[1] = w_avg
         return result
 
+    def get_metrics(self):
+        return {
+            'accuracy': self._accuracy,
+            'precision': dict(zip(self._languages, self._precision)),
+            'recall': dict(zip(self._languages, self._recall)),
+            'f1': dict(zip(self._languages, self._f1)),
+            'macro_f1': self._macro_and_weighted_f1[0],
+            'weighted_f1': self._macro_and_weighted_f1[1],
+        }
+
     def write_to_file(self):
-        self._eval_file.write('{}\r'.format(self._accuracy))
+        with Stats.stage('write_eval'):
+            self.write_eval_file()
+
+    def write_eval_file(self):
+        eval_file = open(self._eval_file, 'w', encoding="utf-8")
+        eval_file.write('{}\r'.format(self._accuracy))
         for p in self._precision:
-            self._eval_file.write('{}  '.format(p))
-        self._eval_file.write('\r')
+            eval_file.write('{}  '.format(p))
+        eval_file.write('\r')
         for r in self._recall:
-            self._eval_file.write('{}  '.format(r))
-        self._eval_file.write('\r')
+            eval_file.write('{}  '.format(r))
+        eval_file.write('\r')
         for f in self._f1:
-            self._eval_file.write('{}  '.format(f))
-        self._eval_file.write('\r')
-        self._eval_file.write('{}  {}'.format(
+            eval_file.write('{}  '.format(f))
+        eval_file.write('\r')
+        eval_file.write('{}  {}'.format(
             self._macro_and_weighted_f1[0], self._macro_and_weighted_f1[1]))
-        self._eval_file.close()
+        eval_file.close()
@@ -0,0 +1,87 @@
+from multiprocessing import Pool
+
+import numpy as np
+
+from CorpusReader import CorpusReader
+from Evaluation import Eval
+from TrainingModelFactory import TrainingModelFactory, DenseTrainingModel
+from VocabularyFactory import VocabularyFactory, CaseInsensitiveAlphabetChars
+
+
+class HyperparameterSweep:
+    # Trains the counts once per (vocabulary, ngram size) and scores the test set for every smoothing value from the
+    # same extracted test ngrams, since only the log probability table depends on δ
+    def __init__(self, training_file, test_file, vocabularies, ngram_sizes, smoothing_values, backend='dict'):
+        if backend == 'sketch':
+            raise ValueError('the sketch backend has no table of every seen ngram to sweep δ over, see sketch-report')
+        self.training_file = training_file
+        self.test_file = test_file
+        self.vocabularies = list(vocabularies)
+        self.ngram_sizes = list(ngram_sizes)
+        if backend == 'dense':
+            # every combination is checked before any is trained
+            for vocabulary in self.vocabularies:
+                for ngram_size in self.ngram_sizes:
+                    DenseTrainingModel.check_size(VocabularyFactory.get_vocabulary(vocabulary), int(ngram_size))
+        # given δ must be within [0 ... 1]
+        self.smoothing_values = [min(max(float(smoothing_value), 0.0), 1.0) for smoothing_value in smoothing_values]
+        self.backend = backend
+        self.results = []
+
+    def run(self, processes=1):
+        configurations = [(self, vocabulary, ngram_size)
+                          for vocabulary in self.vocabularies for ngram_size in self.ngram_sizes]
+        if processes > 1:
+            with Pool(min(processes, len(configurations))) as pool:
+                configuration_results = pool.map(HyperparameterSweep.sweep_configuration, configurations)
+        else:
+            configuration_results = map(HyperparameterSweep.sweep_configuration, configurations)
+
+        self.results = [result for results in configuration_results for result in results]
+        return self.results
+
+    @staticmethod
+    def sweep_configuration(arguments):
+        sweep, vocabulary_type, ngram_size = arguments
+        vocabulary = VocabularyFactory.get_vocabulary(vocabulary_type)
+        model = TrainingModelFactory.get_nb_training_model(vocabulary, ngram_size, sweep.smoothing_values[0],
+                                                           sweep.training_file, sweep.backend)
+        model.train()
+        model.freeze()
+
+        tweets, actual_languages = HyperparameterSweep.read_test_file(sweep.test_file)
+        if isinstance(vocabulary, CaseInsensitiveAlphabetChars):
+            tweets = [tweet.lower() for tweet in tweets]
+        rows = model.get_ngram_rows_of_tweets([model.parse_tweet(tweet) for tweet in tweets])
+
+        results = []
+        for smoothing_value in sweep.smoothing_values:
+            model.set_smoothing_value(smoothing_value)
+            if len(rows) == 0:
+                predicted_languages = []
+            else:
+                # the first language wins a tie, like in Classifier.predict_batch
+                predicted_languages = [model.languages[index] for index in np.argmax(model.score_rows(rows), axis=1)]
+            eval = Eval(None, None, zip(predicted_languages, actual_languages), model.languages)
+            results.append((vocabulary_type, ngram_size, smoothing_value, eval.get_metrics()))
+        return results
+
+    @staticmethod
+    def read_test_file(test_file):
+        tweets = []
+        actual_languages = []
+        for _, languages, batch_tweets in CorpusReader.read_batches(test_file):
+            actual_languages.extend(languages)
+            tweets.extend(batch_tweets)
+        return tweets, actual_languages
+
+    def write_to_file(self, output_file):
+        languages = list(self.results[0][3]['f1'].keys()) if self.results else []
+        output_file = open(output_file, 'w', encoding="utf-8")
+        output_file.write(str.join('  ', ['V', 'n', 'δ', 'accuracy', 'macro_f1', 'weighted_f1'] +
+                                   ['f1_' + language for language in languages]) + '\n')
+        for vocabulary, ngram_size, smoothing_value, metrics in self.results:
+            fields = [vocabulary, ngram_size, smoothing_value, metrics['accuracy'], metrics['macro_f1'],
+                      metrics['weighted_f1']] + [metrics['f1'][language] for language in languages]
+            output_file.write(str.join('  ', [str(field) for field in fields]) + '\n')
+        output_file.close()
@@ -0,0 +1,84 @@
+import json
+import os
+
+import numpy as np
+
+MODEL_FORMAT_VERSION = 1
+
+
+class ModelStorage:
+    # A saved model is a directory holding a small header.json plus one .npy file per count array, so that the
+    # arrays can be memory mapped instead of read when the model is loaded.
+    @staticmethod
+    def write(path, header, arrays):
+        os.makedirs(path, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(path, name + '.npy'), array)
+
+        header = dict(header, format_version=MODEL_FORMAT_VERSION, arrays=sorted(arrays.keys()))
+        with open(os.path.join(path, 'header.json'), 'w', encoding='utf-8') as header_file:
+            json.dump(header, header_file, indent=2)
+
+    @staticmethod
+    def read_header(path):
+        with open(os.path.join(path, 'header.json'), 'r', encoding='utf-8') as header_file:
+            return json.load(header_file)
+
+    @staticmethod
+    def read(path):
+        header = ModelStorage.read_header(path)
+        if header.get('format_version') != MODEL_FORMAT_VERSION:
+            raise ValueError('unsupported model format version {} in {}'.format(header.get('format_version'), path))
+
+        # copy-on-write, so a loaded model can still be trained further without touching the files
+        arrays = dict()
+        for name in header['arrays']:
+            arrays[name] = np.load(os.path.join(path, name + '.npy'), mmap_mode='c')
+        return header, arrays
+
+    @staticmethod
+    def flatten_trees(trees, depth):
+        # turns one nested ngram_frequencies dict per language into a (rows, depth) array of codepoint paths and a
+        # (rows, languages) array of counts. Paths shorter than depth are padded with -1 and hold 'total_count' values
+        rows = dict()
+        entries = []
+        for tree in trees:
+            language_entries = dict()
+            ModelStorage.walk_tree(tree, (), depth, language_entries)
+            for path in language_entries.keys():
+                rows.setdefault(path, len(rows))
+            entries.append(language_entries)
+
+        paths = np.full((len(rows), depth), -1, dtype=np.int64)
+        for path, row in rows.items():
+            paths[row, :len(path)] = path
+
+        counts = np.zeros((len(rows), len(trees)), dtype=np.int64)
+        for language_index, language_entries in enumerate(entries):
+            for path, count in language_entries.items():
+                counts[rows[path], language_index] = count
+        return paths, counts
+
+    @staticmethod
+    def walk_tree(node, path, depth, entries):
+        for key, value in node.items():
+            if key == 'total_count':
+                entries[path] = value
+            elif len(path) + 1 == depth:
+                entries[path + (key,)] = value
+            else:
+                ModelStorage.walk_tree(value, path + (key,), depth, entries)
+
+    @staticmethod
+    def fill_trees(trees, paths, counts):
+        depth = paths.shape[1]
+        for path, path_counts in zip(paths.tolist(), counts.tolist()):
+            keys = [key for key in path if key >= 0]
+            for tree, count in zip(trees, path_counts):
+                if count == 0:
+                    continue
+
+                node = tree
+                for key in keys[:-1] if len(keys) == depth else keys:
+                    node = node.setdefault(key, dict())
+                node[keys[-1] if len(keys) == depth else 'total_count'] = count
@@ -0,0 +1,109 @@
+import numpy as np
+
+# every codepoint fits in 21 bits, so up to three of them pack into a single int64 ngram id
+CODEPOINT_BITS = 21
+CODEPOINT_MASK = (1 << CODEPOINT_BITS) - 1
+
+
+class NgramExtractor:
+    # Encodes a tweet once into an array of codepoints and vocabulary indices, then forms every ngram with a sliding
+    # window, dropping the windows that contain a char outside the vocabulary
+    def __init__(self, vocabulary, ngram_size):
+        self.ngram_size = ngram_size
+        self.vocabulary_size = vocabulary.get_size()
+        self.codepoints = vocabulary.get_codepoints()
+        self.index_table = vocabulary.get_index_table()
+
+    def encode(self, tweet):
+        # a lone surrogate, which a str can hold, is kept as its codepoint, which no vocabulary has
+        codepoints = np.frombuffer(tweet.encode('utf-32-le', 'surrogatepass'), dtype=np.uint32).astype(np.int64)
+        indices = self.index_table[np.minimum(codepoints, len(self.index_table) - 1)]
+        return codepoints, indices
+
+    def encode_batch(self, tweets):
+        # the tweets encoded as one, each one followed by a newline, which is in no vocabulary, so that no window runs
+        # from a tweet into the next, along with the index in the batch of the tweet of every position
+        codepoints, indices = self.encode('\n'.join(tweets) + '\n')
+        tweet_indices = np.repeat(np.arange(len(tweets)), [len(tweet) + 1 for tweet in tweets])
+        return codepoints, indices, tweet_indices
+
+    @staticmethod
+    def get_window_starts(indices, ngram_size):
+        window_count = len(indices) - ngram_size + 1
+        if window_count < 1:
+            return np.empty(0, dtype=np.int64)
+
+        in_vocabulary = indices[:window_count] >= 0
+        for offset in range(1, ngram_size):
+            in_vocabulary &= indices[offset:offset + window_count] >= 0
+        return np.flatnonzero(in_vocabulary)
+
+    @staticmethod
+    def get_windows(values, starts, ngram_size):
+        # (ngrams, ngram_size) array holding the values at each position of every window
+        return values[starts[:, np.newaxis] + np.arange(ngram_size)]
+
+    @staticmethod
+    def pack_windows(windows):
+        ngrams = np.zeros(len(windows), dtype=np.int64)
+        for column in windows.T:
+            ngrams = (ngrams << CODEPOINT_BITS) | column
+        return ngrams
+
+    def extract(self, tweet):
+        # ngram ids made of the packed codepoints of their chars
+        codepoints, indices = self.encode(tweet)
+        starts = NgramExtractor.get_window_starts(indices, self.ngram_size)
+        return NgramExtractor.pack_windows(NgramExtractor.get_windows(codepoints, starts, self.ngram_size))
+
+    def extract_windows(self, tweet):
+        codepoints, indices = self.encode(tweet)
+        starts = NgramExtractor.get_window_starts(indices, self.ngram_size)
+        return NgramExtractor.get_windows(codepoints, starts, self.ngram_size)
+
+    def extract_indices(self, tweet):
+        # ngram ids made of the vocabulary indices of their chars read as a base V number, which are contiguous
+        codepoints, indices = self.encode(tweet)
+        return self.get_index_ngrams(indices, NgramExtractor.get_window_starts(indices, self.ngram_size))
+
+    def get_index_ngrams(self, indices, starts):
+        ngrams = np.zeros(len(starts), dtype=np.int64)
+        for offset in range(self.ngram_size):
+            ngrams = ngrams * self.vocabulary_size + indices[starts + offset]
+        return ngrams
+
+    def extract_batch(self, tweets):
+        # the ngram ids extract gives for every tweet of a batch, all in one array, with the index of the tweet each
+        # one comes from
+        codepoints, indices, tweet_indices = self.encode_batch(tweets)
+        starts = NgramExtractor.get_window_starts(indices, self.ngram_size)
+        ngrams = NgramExtractor.pack_windows(NgramExtractor.get_windows(codepoints, starts, self.ngram_size))
+        return ngrams, tweet_indices[starts]
+
+    def extract_indices_batch(self, tweets):
+        codepoints, indices, tweet_indices = self.encode_batch(tweets)
+        starts = NgramExtractor.get_window_starts(indices, self.ngram_size)
+        return self.get_index_ngrams(indices, starts), tweet_indices[starts]
+
+    def decode_index(self, ngram):
+        chars = []
+        for _ in range(self.ngram_size):
+            ngram, index = divmod(int(ngram), self.vocabulary_size)
+            chars.append(chr(self.codepoints[index]))
+        return ''.join(reversed(chars))
+
+    @staticmethod
+    def pack(ngram):
+        packed_ngram = 0
+        for char in ngram:
+            packed_ngram = (packed_ngram << CODEPOINT_BITS) | ord(char)
+        return packed_ngram
+
+    @staticmethod
+    def unpack(ngram, ngram_size):
+        return [(ngram >> (CODEPOINT_BITS * (ngram_size - 1 - position))) & CODEPOINT_MASK
+                for position in range(ngram_size)]
+
+    @staticmethod
+    def decode(ngram, ngram_size):
+        return ''.join(chr(codepoint) for codepoint in NgramExtractor.unpack(ngram, ngram_size))
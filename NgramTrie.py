@@ -0,0 +1,172 @@
+import numpy as np
+
+from NgramExtractor import CODEPOINT_BITS, CODEPOINT_MASK
+
+
+class NgramTrie:
+    # Counts of the ngrams of every size from 1 to depth in one prefix trie stored level by level, level k - 1 holding
+    # the nodes of the k-grams sorted by their key: the index of the node of their first k - 1 chars in the level above
+    # (0, the root, for unigrams) shifted left by CODEPOINT_BITS and or-ed with the codepoint of their last char. A
+    # node is found with one binary search per level whatever the ngram size, the children of a node are contiguous,
+    # and the nodes of a level are in the order of the ngrams they stand for. Every node has a count per language,
+    # from which the child totals (the number of (k+1)-grams starting with a node's k-gram) are summed.
+    # The keys and counts are replaced by new arrays whenever they change, never written into, so that a copy of the
+    # trie keeps the nodes and counts it had
+    def __init__(self, depth, language_count=0):
+        self.depth = depth
+        self.keys = [np.zeros(0, dtype=np.int64) for _ in range(depth)]
+        self.counts = [np.zeros((0, language_count), dtype=np.int64) for _ in range(depth)]
+
+    def copy(self):
+        trie = NgramTrie(self.depth)
+        trie.keys = list(self.keys)
+        trie.counts = list(self.counts)
+        return trie
+
+    def get_language_count(self):
+        return self.counts[0].shape[1]
+
+    def add_language(self):
+        self.counts = [np.concatenate([counts, np.zeros((len(counts), 1), dtype=np.int64)], axis=1)
+                       for counts in self.counts]
+
+    def add_sequences(self, codepoints, languages):
+        # counts every ngram of the given codepoints, in which -1 stands for a char outside the vocabulary and ends
+        # every ngram that would contain it, into the language whose index is given for each codepoint. The ngrams of
+        # one size are counted at a time, each one under the node its prefix got in the level before
+        starts = np.flatnonzero(codepoints >= 0)
+        parents = np.zeros(len(starts), dtype=np.int64)
+        for level in range(self.depth):
+            keys = (parents << CODEPOINT_BITS) | codepoints[starts + level]
+            self.insert(level, np.unique(keys))
+            nodes = np.searchsorted(self.keys[level], keys)
+
+            language_count = self.get_language_count()
+            cells, cell_counts = np.unique(nodes * language_count + languages[starts], return_counts=True)
+            counts = self.counts[level].copy()
+            counts.reshape(-1)[cells] += cell_counts
+            self.counts[level] = counts
+
+            ends = starts + level + 1
+            extended = ends < len(codepoints)
+            extended[extended] = codepoints[ends[extended]] >= 0
+            starts = starts[extended]
+            parents = nodes[extended]
+
+    def insert(self, level, keys):
+        # adds nodes with no counts for the given sorted keys that are not in the level yet, and moves the keys of the
+        # level below to the new indices of their parents
+        level_keys = self.keys[level]
+        new_keys = keys[NgramTrie.lookup(level_keys, keys) < 0]
+        if len(new_keys) == 0:
+            return
+
+        positions = np.arange(len(level_keys)) + np.searchsorted(new_keys, level_keys)
+        self.keys[level] = np.insert(level_keys, np.searchsorted(level_keys, new_keys), new_keys)
+        counts = np.zeros((len(self.keys[level]), self.get_language_count()), dtype=np.int64)
+        counts[positions] = self.counts[level]
+        self.counts[level] = counts
+        if level + 1 < self.depth:
+            self.keys[level + 1] = NgramTrie.move_parents(self.keys[level + 1], positions)
+
+    @staticmethod
+    def move_parents(keys, parent_indices):
+        # the keys with the parent index they hold replaced by its entry in parent_indices, which keeps them sorted as
+        # long as parent_indices is increasing
+        return (parent_indices[keys >> CODEPOINT_BITS] << CODEPOINT_BITS) | (keys & CODEPOINT_MASK)
+
+    @staticmethod
+    def lookup(keys, values):
+        # rows of the given values in the sorted keys, -1 for the ones that are not there
+        rows = np.searchsorted(keys, values)
+        found = rows < len(keys)
+        found[found] = keys[rows[found]] == values[found]
+        return np.where(found, rows, -1)
+
+    def find_paths(self, windows):
+        # (windows, size) node indices of the prefixes of every size of the given (windows, size) codepoints, found in
+        # one traversal of the levels, -1 from the first prefix that is not in the trie on
+        paths = np.full(windows.shape, -1, dtype=np.int64)
+        indices = np.arange(len(windows))
+        parents = np.zeros(len(windows), dtype=np.int64)
+        for level in range(windows.shape[1]):
+            nodes = NgramTrie.lookup(self.keys[level], (parents << CODEPOINT_BITS) | windows[indices, level])
+            found = nodes >= 0
+            indices = indices[found]
+            parents = nodes[found]
+            paths[indices, level] = parents
+        return paths
+
+    @staticmethod
+    def gather(rows, nodes):
+        # the rows of the given nodes, a row of zeros for -1
+        return np.concatenate([rows, np.zeros((1,) + rows.shape[1:], dtype=rows.dtype)])[nodes]
+
+    def get_child_totals(self, distinct=False):
+        # (parents, languages) child totals of the parents of the nodes of every level, the root's single row first,
+        # so that the totals the counts of level k are divided by are at index k. With distinct, the number of
+        # children with a count in each language instead
+        totals = []
+        for level in range(self.depth):
+            parent_count = 1 if level == 0 else len(self.keys[level - 1])
+            level_totals = np.zeros((parent_count, self.get_language_count()), dtype=np.int64)
+            parents, starts = np.unique(self.keys[level] >> CODEPOINT_BITS, return_index=True)
+            if len(starts) > 0:
+                counts = self.counts[level] > 0 if distinct else self.counts[level]
+                level_totals[parents] = np.add.reduceat(counts, starts, axis=0, dtype=np.int64)
+            totals.append(level_totals)
+        return totals
+
+    def get_parents(self, level):
+        # index of the parent of every node of a level in the level above, 0 for the root
+        return self.keys[level] >> CODEPOINT_BITS
+
+    def get_windows(self, level, nodes):
+        # (nodes, level + 1) codepoints of the ngrams of the given nodes of a level, read back up to the root
+        windows = np.zeros((len(nodes), level + 1), dtype=np.int64)
+        for position in range(level, -1, -1):
+            keys = self.keys[position][nodes]
+            windows[:, position] = keys & CODEPOINT_MASK
+            nodes = keys >> CODEPOINT_BITS
+        return windows
+
+    def add_trie(self, other, language_indices, sign=1):
+        # adds the counts of another trie of the same depth, or subtracts them with a sign of -1, the languages of
+        # the other trie being at the given indices in this one. Its nodes are moved under the indices their parents
+        # have in this trie, one level after the other
+        language_indices = np.asarray(language_indices, dtype=np.int64)
+        nodes = np.zeros(1, dtype=np.int64)
+        for level in range(self.depth):
+            keys = NgramTrie.move_parents(other.keys[level], nodes)
+            self.insert(level, keys)
+            nodes = np.searchsorted(self.keys[level], keys)
+            counts = self.counts[level].copy()
+            counts[np.ix_(nodes, language_indices)] += sign * other.counts[level]
+            self.counts[level] = counts
+
+    def prune(self):
+        # drops the nodes left with no count in any language, none of which has a child with a count
+        positions = np.zeros(1, dtype=np.int64)
+        for level in range(self.depth):
+            kept = (self.counts[level] != 0).any(axis=1)
+            self.keys[level] = NgramTrie.move_parents(self.keys[level][kept], positions)
+            self.counts[level] = self.counts[level][kept]
+            positions = np.cumsum(kept) - 1
+
+    def get_arrays(self):
+        arrays = dict()
+        for level in range(self.depth):
+            arrays['keys_' + str(level + 1)] = self.keys[level]
+            arrays['counts_' + str(level + 1)] = self.counts[level]
+        return arrays
+
+    def set_arrays(self, arrays):
+        language_count = self.get_language_count()
+        for level in range(self.depth):
+            keys = arrays.get('keys_' + str(level + 1))
+            counts = arrays.get('counts_' + str(level + 1))
+            if keys is None or counts is None or counts.shape != (len(keys), language_count):
+                raise ValueError('expected the keys and counts of every level of a trie of depth {} with {} languages'
+                                 .format(self.depth, language_count))
+            self.keys[level] = keys
+            self.counts[level] = counts
@@ -0,0 +1,37 @@
+import os
+from multiprocessing import Pool
+
+from CorpusReader import CorpusReader
+
+
+class ParallelTraining:
+    @staticmethod
+    def train(model, processes):
+        # every worker counts its own byte range of the training file into a copy of the untrained model, the
+        # copies are then merged back into the model
+        chunks = ParallelTraining.split_file(model.training_file, processes)
+        with Pool(processes) as pool:
+            chunk_models = pool.map(ParallelTraining.train_chunk, [(model, start, end) for start, end in chunks])
+
+        # merged in the order of the chunks, so the languages are in the order they first appear in the file
+        for chunk_model in chunk_models:
+            model.add_model(chunk_model)
+
+    @staticmethod
+    def train_chunk(arguments):
+        model, start, end = arguments
+        model.train_batches(CorpusReader.read_batches(model.training_file, start, end))
+        return model
+
+    @staticmethod
+    def split_file(path, chunk_count):
+        # byte ranges of roughly equal size, each one starting right after a newline
+        file_size = os.path.getsize(path)
+        boundaries = [0]
+        with open(path, 'rb') as input_file:
+            for i in range(1, chunk_count):
+                input_file.seek(max(file_size * i // chunk_count, boundaries[-1]))
+                input_file.readline()
+                boundaries.append(min(input_file.tell(), file_size))
+        boundaries.append(file_size)
+        return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if start < end]
@@ -0,0 +1,64 @@
+import time
+
+import numpy as np
+
+from Evaluation import Eval
+from HyperparameterSweep import HyperparameterSweep
+from VocabularyFactory import CaseInsensitiveAlphabetChars
+
+
+class QuantizationReport:
+    # Scores a test file with a trained model and with its QuantizedModel export, and reports the bytes of their
+    # tables of log10 probabilities, the seconds they take to score it and the metrics of Eval for both, along with how
+    # much accuracy and F1 the quantized model loses, the share of tweets it classifies like the model and how far its
+    # scores drift from the model's
+    def __init__(self, model, quantized_model, test_file):
+        self.model = model
+        self.quantized_model = quantized_model
+        self.test_file = test_file
+        self.results = []
+
+    def run(self):
+        tweets, actual_languages = HyperparameterSweep.read_test_file(self.test_file)
+        if isinstance(self.model.vocabulary, CaseInsensitiveAlphabetChars):
+            tweets = [tweet.lower() for tweet in tweets]
+
+        if not self.model.frozen:
+            self.model.freeze()
+        scores, metrics, seconds = QuantizationReport.evaluate(self.model, tweets, actual_languages)
+        quantized_scores, quantized_metrics, quantized_seconds = QuantizationReport.evaluate(self.quantized_model,
+                                                                                             tweets, actual_languages)
+
+        # the first language wins a tie, like in Classifier.predict_batch
+        agreement = np.mean(np.argmax(scores, axis=1) == np.argmax(quantized_scores, axis=1)) if tweets else None
+        finite = np.isfinite(scores) & np.isfinite(quantized_scores)
+        drifts = np.abs(quantized_scores - scores)[finite]
+        self.results = [
+            ('float', self.model.log_probability_table.nbytes, seconds, metrics, 1.0, 0.0, 0.0),
+            ('quantized', self.quantized_model.table.nbytes, quantized_seconds, quantized_metrics, agreement,
+             drifts.max(initial=0), drifts.mean() if len(drifts) > 0 else 0.0),
+        ]
+        return self.results
+
+    @staticmethod
+    def evaluate(model, tweets, actual_languages):
+        # the (tweets, languages) scores, the metrics of Eval and the seconds the scoring took
+        start = time.perf_counter()
+        scores = model.score_matrix(tweets)
+        seconds = time.perf_counter() - start
+        predicted_languages = [model.languages[index] for index in np.argmax(scores, axis=1).tolist()]
+        eval = Eval(None, None, zip(predicted_languages, actual_languages), model.languages)
+        return scores, eval.get_metrics(), seconds
+
+    def write_to_file(self, output_file):
+        float_metrics = self.results[0][3]
+        output_file = open(output_file, 'w', encoding="utf-8")
+        output_file.write(str.join('  ', ['model', 'table_bytes', 'score_seconds', 'accuracy', 'macro_f1',
+                                          'weighted_f1', 'accuracy_delta', 'macro_f1_delta', 'agreement',
+                                          'max_score_drift', 'mean_score_drift']) + '\n')
+        for name, table_bytes, seconds, metrics, agreement, max_drift, mean_drift in self.results:
+            fields = [name, table_bytes, seconds, metrics['accuracy'], metrics['macro_f1'], metrics['weighted_f1'],
+                      metrics['accuracy'] - float_metrics['accuracy'],
+                      metrics['macro_f1'] - float_metrics['macro_f1'], agreement, max_drift, mean_drift]
+            output_file.write(str.join('  ', [str(field) for field in fields]) + '\n')
+        output_file.close()
@@ -0,0 +1,111 @@
+import numpy as np
+
+from ModelStorage import ModelStorage
+from NgramExtractor import NgramExtractor
+from Stats import Stats
+from TrainingModelFactory import TrainingModel, BYOMTrainingModel, SketchTrainingModel
+from VocabularyFactory import VocabularyFactory
+
+# quantized log10 probabilities run from -QUANTIZED_MAX to QUANTIZED_MAX times their language's scale, and the one
+# value left below stands for -inf
+QUANTIZED_MAX = np.iinfo(np.int16).max
+QUANTIZED_NEGATIVE_INFINITY = np.iinfo(np.int16).min
+
+
+class QuantizedModel:
+    model_type = 'quantized'
+
+    # Scoring-only export of a trained naive Bayes model whatever its backend. The log10 probabilities are kept as int16
+    # in one (ngrams + 1, languages) table, the values of every language for an ngram next to each other so that one
+    # lookup reads them all, with a last row for the ngrams seen in no language. A language's values are its log10
+    # probabilities divided by its own scale, which maps its largest magnitude onto QUANTIZED_MAX. A tweet's values are
+    # summed as integers, and only the sums are multiplied back by the scales, so the score of a tweet drifts from the
+    # model's by at most half a scale per ngram
+    def __init__(self, vocabulary, ngram_size, smoothing_value, languages, log_prior_vector, ngram_keys, table,
+                 scales):
+        self.vocabulary = vocabulary
+        self.ngram_size = ngram_size
+        self.smoothing_value = smoothing_value
+        self.extractor = NgramExtractor(vocabulary, ngram_size)
+        self.languages = list(languages)
+        self.log_prior_vector = log_prior_vector
+        self.ngram_keys = ngram_keys
+        self.table = table
+        self.scales = scales
+        # the count of -inf values in every tweet's sum is only kept track of when there are any
+        self.has_negative_infinity = bool((table == QUANTIZED_NEGATIVE_INFINITY).any())
+        self.frozen = True
+        self.version = 0
+
+    @staticmethod
+    def from_model(model):
+        # the export of a trained model, whose counts are read again rather than from its frozen tables, since those
+        # are laid out differently by every backend
+        if model.model_type == BYOMTrainingModel.model_type:
+            raise ValueError('only naive Bayes models can be quantized, BYOM scores with conditional probabilities')
+        if isinstance(model, SketchTrainingModel):
+            raise ValueError('the sketch backend cannot be quantized, since it has no list of the ngrams it counted')
+
+        ngram_keys, counts = model.get_ngram_counts()
+        counts = np.concatenate([counts, np.zeros((1, len(model.languages)), dtype=counts.dtype)])
+        table, scales = QuantizedModel.quantize(model.get_ngram_log_probabilities(ngram_keys, counts))
+        return QuantizedModel(model.vocabulary, model.ngram_size, model.smoothing_value, model.languages,
+                              np.array(model.log_prior_vector, dtype=float), model.pack_ngram_keys(ngram_keys), table,
+                              scales)
+
+    @staticmethod
+    def quantize(log_probabilities):
+        # the (rows, languages) int16 table of the given log10 probabilities and the scale of every language
+        finite = np.isfinite(log_probabilities)
+        finite_values = np.where(finite, log_probabilities, 0)
+        largest = np.abs(finite_values).max(axis=0, initial=0)
+        scales = np.where(largest > 0, largest / QUANTIZED_MAX, 1.0)
+        values = np.clip(np.rint(finite_values / scales), -QUANTIZED_MAX, QUANTIZED_MAX)
+        table = np.where(finite, values, QUANTIZED_NEGATIVE_INFINITY).astype(np.int16)
+        return table, scales
+
+    def freeze(self):
+        pass
+
+    def score_matrix(self, tweets, top1=False):
+        # (tweets, languages) scores, in the order of self.languages. Every language is scored, even with top1
+        with Stats.stage('parse_tweet'):
+            ngrams = [self.extractor.extract(tweet) for tweet in tweets]
+        with Stats.stage('score'):
+            lengths = np.array([len(tweet_ngrams) for tweet_ngrams in ngrams], dtype=np.int64)
+            rows = TrainingModel.lookup_rows(self.ngram_keys, np.concatenate([np.zeros(0, dtype=np.int64)] + ngrams),
+                                             len(self.ngram_keys))
+            values = self.table[rows]
+            scores = self.log_prior_vector + TrainingModel.sum_segments(values, lengths, np.int64) * self.scales
+            if self.has_negative_infinity:
+                infinite = TrainingModel.sum_segments(values == QUANTIZED_NEGATIVE_INFINITY, lengths, np.int64) > 0
+                scores[infinite] = float('-inf')
+        if Stats.enabled:
+            Stats.count('scored_tweets', len(tweets))
+            Stats.count('scored_ngrams', lengths.sum())
+        return scores.reshape(len(tweets), len(self.languages))
+
+    def save(self, path):
+        header = {
+            'model': self.model_type,
+            'vocabulary': self.vocabulary.vocabulary_type,
+            'ngram_size': self.ngram_size,
+            'smoothing_value': self.smoothing_value,
+            'languages': self.languages,
+        }
+        ModelStorage.write(path, header, {'ngram_keys': self.ngram_keys, 'table': self.table, 'scales': self.scales,
+                                          'log_priors': self.log_prior_vector})
+
+    @staticmethod
+    def load(path):
+        header, arrays = ModelStorage.read(path)
+        if header['model'] != QuantizedModel.model_type:
+            raise ValueError('{} does not hold a quantized model'.format(path))
+
+        table = arrays['table']
+        if table.dtype != np.int16 or table.shape != (len(arrays['ngram_keys']) + 1, len(header['languages'])):
+            raise ValueError('expected an int16 table with a row per ngram plus one and a column per language in {}'
+                             .format(path))
+        return QuantizedModel(VocabularyFactory.get_vocabulary(header['vocabulary']), header['ngram_size'],
+                              header['smoothing_value'], header['languages'], arrays['log_priors'],
+                              arrays['ngram_keys'], table, arrays['scales'])
@@ -0,0 +1,87 @@
+import hashlib
+from collections import OrderedDict
+
+from Stats import Stats
+
+# bytes of the blake2b digest a tweet is keyed by, enough that two different tweets never share a key in practice
+KEY_SIZE = 16
+
+
+class ScoreCache:
+    # Bounded LRU cache of the predictions of tweets already scored, so that retweets and copy-pasted tweets are only
+    # scored once. A tweet is keyed by a hash of its exact text, as even whitespace can change a score: BYOM scores the
+    # first chars of a tweet whatever they are. The cache belongs to one model and is emptied as soon as the model's
+    # version changes, like when it is retrained or updated by partial_fit
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError('a score cache must hold at least one tweet')
+
+        self.capacity = capacity
+        self.predictions = OrderedDict()
+        self.model = None
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def get_key(tweet):
+        return hashlib.blake2b(tweet.encode('utf-8', 'surrogatepass'), digest_size=KEY_SIZE).digest()
+
+    def predict_batch(self, model, tweets, predict_batch):
+        # the predictions of tweets, given by predict_batch for the tweets not seen since the model last changed. A
+        # tweet that appears more than once in the batch is only scored once too
+        if model is not self.model or model.version != self.version:
+            if self.predictions:
+                self.invalidations += 1
+                self.predictions.clear()
+            self.model = model
+        # read before scoring, so that predictions made while the model is being updated are dropped with the rest
+        self.version = model.version
+
+        keys = [ScoreCache.get_key(tweet) for tweet in tweets]
+        found = dict()
+        missed_tweets = dict()
+        for key, tweet in zip(keys, tweets):
+            if key in found or key in missed_tweets:
+                self.hits += 1
+            elif key in self.predictions:
+                self.predictions.move_to_end(key)
+                found[key] = self.predictions[key]
+                self.hits += 1
+            else:
+                missed_tweets[key] = tweet
+                self.misses += 1
+
+        if missed_tweets:
+            evictions = self.evictions
+            for key, (language, score, scores) in zip(missed_tweets, predict_batch(list(missed_tweets.values()))):
+                # a copy, so that the cache does not keep the whole batch's score matrix alive, and read-only, since
+                # every later hit returns this same array
+                scores = scores.copy()
+                scores.setflags(write=False)
+                found[key] = (language, score, scores)
+                self.predictions[key] = found[key]
+                if len(self.predictions) > self.capacity:
+                    self.predictions.popitem(last=False)
+                    self.evictions += 1
+            if Stats.enabled:
+                Stats.count('score_cache_evictions', self.evictions - evictions)
+
+        if Stats.enabled:
+            Stats.count('score_cache_hits', len(tweets) - len(missed_tweets))
+            Stats.count('score_cache_misses', len(missed_tweets))
+        return [found[key] for key in keys]
+
+    def get_report(self):
+        lookups = self.hits + self.misses
+        return {
+            'capacity': self.capacity,
+            'size': len(self.predictions),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'hit_rate': self.hits / lookups if lookups else None,
+        }
@@ -0,0 +1,69 @@
+import numpy as np
+
+from Evaluation import Eval
+from HyperparameterSweep import HyperparameterSweep
+from TrainingModelFactory import TrainingModelFactory, SketchTrainingModel, DEFAULT_SKETCH_DEPTH, \
+    DEFAULT_HEAVY_HITTER_COUNT
+from VocabularyFactory import VocabularyFactory, CaseInsensitiveAlphabetChars
+
+
+class SketchReport:
+    # Trains the exact counts once and a sketch model for every width, evaluates each of them on the test set and
+    # reports how much accuracy and F1 the sketches lose for the memory they save, along with the share of tweets they
+    # classify like the exact counts do
+    def __init__(self, training_file, test_file, vocabulary, ngram_size, smoothing_value, sketch_widths,
+                 sketch_depth=DEFAULT_SKETCH_DEPTH, heavy_hitter_count=DEFAULT_HEAVY_HITTER_COUNT):
+        self.training_file = training_file
+        self.test_file = test_file
+        self.vocabulary = VocabularyFactory.get_vocabulary(vocabulary)
+        self.ngram_size = ngram_size
+        # given δ must be within [0 ... 1]
+        self.smoothing_value = min(max(float(smoothing_value), 0.0), 1.0)
+        self.sketch_widths = [int(sketch_width) for sketch_width in sketch_widths]
+        self.sketch_depth = sketch_depth
+        self.heavy_hitter_count = heavy_hitter_count
+        self.results = []
+
+    def run(self):
+        tweets, actual_languages = HyperparameterSweep.read_test_file(self.test_file)
+        if isinstance(self.vocabulary, CaseInsensitiveAlphabetChars):
+            tweets = [tweet.lower() for tweet in tweets]
+
+        # the sparse backend counts exactly in the least memory
+        exact_model = TrainingModelFactory.get_nb_training_model(self.vocabulary, self.ngram_size,
+                                                                 self.smoothing_value, self.training_file, 'sparse')
+        exact_predictions, exact_metrics, exact_bytes = SketchReport.evaluate(exact_model, tweets, actual_languages)
+        self.results = [('exact', '', '', exact_bytes, exact_metrics, 1.0)]
+
+        for sketch_width in self.sketch_widths:
+            model = SketchTrainingModel(self.vocabulary, int(self.ngram_size), self.smoothing_value,
+                                        self.training_file, sketch_width, self.sketch_depth, self.heavy_hitter_count)
+            predictions, metrics, count_bytes = SketchReport.evaluate(model, tweets, actual_languages)
+            agreement = np.mean(predictions == exact_predictions) if len(tweets) > 0 else None
+            self.results.append((sketch_width, self.sketch_depth, self.heavy_hitter_count, count_bytes, metrics,
+                                 agreement))
+        return self.results
+
+    @staticmethod
+    def evaluate(model, tweets, actual_languages):
+        # the predicted language indices, the metrics of Eval and the bytes of the counts
+        model.train()
+        count_bytes = sum(array.nbytes for array in model.get_count_arrays().values())
+        model.freeze()
+        # the first language wins a tie, like in Classifier.predict_batch
+        predictions = np.argmax(model.score_matrix(tweets), axis=1)
+        predicted_languages = [model.languages[index] for index in predictions.tolist()]
+        eval = Eval(None, None, zip(predicted_languages, actual_languages), model.languages)
+        return predictions, eval.get_metrics(), count_bytes
+
+    def write_to_file(self, output_file):
+        exact_metrics = self.results[0][4]
+        output_file = open(output_file, 'w', encoding="utf-8")
+        output_file.write(str.join('  ', ['width', 'depth', 'heavy_hitters', 'count_bytes', 'accuracy', 'macro_f1',
+                                          'weighted_f1', 'accuracy_delta', 'macro_f1_delta', 'agreement']) + '\n')
+        for sketch_width, sketch_depth, heavy_hitter_count, count_bytes, metrics, agreement in self.results:
+            fields = [sketch_width, sketch_depth, heavy_hitter_count, count_bytes, metrics['accuracy'],
+                      metrics['macro_f1'], metrics['weighted_f1'], metrics['accuracy'] - exact_metrics['accuracy'],
+                      metrics['macro_f1'] - exact_metrics['macro_f1'], agreement]
+            output_file.write(str.join('  ', [str(field) for field in fields]) + '\n')
+        output_file.close()
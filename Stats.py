@@ -0,0 +1,105 @@
+import cProfile
+import json
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+
+class Stats:
+    # Process wide wall time per stage and event counters. Time is charged to the innermost stage being run by the
+    # same thread, so the stages of a thread never overlap and add up to its instrumented time. The totals are shared
+    # by every thread, like the server's event loop and its scoring thread, and only updated under the lock. Until
+    # enable() is called a stage is a shared no-op context and the counters are left alone by their callers, which
+    # check Stats.enabled first
+    enabled = False
+    stage_seconds = dict()
+    counters = Counter()
+    lock = threading.Lock()
+    # the stack of stages a thread is in and when its time was last charged, in stage_stack and last_switch
+    thread_state = threading.local()
+    start = 0.0
+    profiler = None
+    no_stage = nullcontext()
+
+    @staticmethod
+    def enable(profile=False):
+        Stats.enabled = True
+        Stats.start = time.perf_counter()
+        if profile:
+            Stats.profiler = cProfile.Profile()
+            Stats.profiler.enable()
+
+    @staticmethod
+    def stage(name):
+        if not Stats.enabled:
+            return Stats.no_stage
+        return Stats.run_stage(name)
+
+    @staticmethod
+    @contextmanager
+    def run_stage(name):
+        state = Stats.switch_stage()
+        state.stage_stack.append(name)
+        try:
+            yield
+        finally:
+            Stats.switch_stage()
+            state.stage_stack.pop()
+
+    @staticmethod
+    def switch_stage():
+        # charges the time since the last switch of this thread to its innermost stage, and returns its state
+        now = time.perf_counter()
+        state = Stats.thread_state
+        if not hasattr(state, 'stage_stack'):
+            state.stage_stack = []
+        elif state.stage_stack:
+            name = state.stage_stack[-1]
+            with Stats.lock:
+                Stats.stage_seconds[name] = Stats.stage_seconds.get(name, 0.0) + now - state.last_switch
+        state.last_switch = now
+        return state
+
+    @staticmethod
+    def timed_iter(name, iterable):
+        # charges the time spent producing every item, like reading a file line by line, to the given stage
+        if not Stats.enabled:
+            return iterable
+        return Stats.run_timed_iter(name, iter(iterable))
+
+    @staticmethod
+    def run_timed_iter(name, iterator):
+        while True:
+            with Stats.run_stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    @staticmethod
+    def count(name, amount=1):
+        with Stats.lock:
+            Stats.counters[name] += int(amount)
+
+    @staticmethod
+    def get_report():
+        with Stats.lock:
+            return {
+                'total_seconds': time.perf_counter() - Stats.start,
+                'stage_seconds': dict(Stats.stage_seconds),
+                'counters': dict(Stats.counters),
+            }
+
+    @staticmethod
+    def write_to_file(path):
+        output_file = open(path, 'w', encoding="utf-8")
+        json.dump(Stats.get_report(), output_file, indent=2)
+        output_file.close()
+
+    @staticmethod
+    def write_profile(path):
+        # readable with the pstats module or any cProfile viewer
+        Stats.profiler.disable()
+        Stats.profiler.dump_stats(path)
@@ -1,13 +1,57 @@
-import bisect
+import copy
+import threading
 from abc import ABC, abstractmethod
+from collections import Counter
 from math import log10
 
-from VocabularyFactory import CaseInsensitiveAlphabetChars
+import numpy as np
+
+from CorpusReader import CorpusReader
+from ModelStorage import ModelStorage
+from NgramExtractor import NgramExtractor, CODEPOINT_BITS
+from NgramTrie import NgramTrie
+from ParallelTraining import ParallelTraining
+from Stats import Stats
+from VocabularyFactory import VocabularyFactory, CaseInsensitiveAlphabetChars, IsAlphaChars
+
+
+# number of ngrams scored for every language before score_batch_top1 picks a leader
+TOP1_PREFIX_SIZE = 16
+# relative slack left in the bounds of score_batch_top1 for rounding errors in the sums
+TOP1_TOLERANCE = 1e-9
+# number of ngrams the sparse and sketch backends (chars for the trie backend) buffer before counting them into their
+# arrays
+SPARSE_FLUSH_SIZE = 1 << 20
+# buckets per row, rows, and exactly counted heavy hitters of every language's count-min sketch in the sketch backend
+DEFAULT_SKETCH_WIDTH = 1 << 18
+DEFAULT_SKETCH_DEPTH = 4
+DEFAULT_HEAVY_HITTER_COUNT = 1 << 14
+# most possible ngrams, V^n, the dense backend keeps a count of for every language, 128 MB of int64 counts each
+DENSE_MAX_NGRAMS = 1 << 24
+# seed of the sketch hash functions, fixed so that sketches of the same shape can be saved, loaded and merged
+SKETCH_SEED = 472
+# what top_ngrams can rank the ngrams of a language by
+TOP_NGRAMS_MEASURES = ('count', 'probability', 'discriminativeness')
+# held by partial_fit while it updates a model and by snapshot while it copies one, so that a snapshot never sees half
+# of an update
+UPDATE_LOCK = threading.RLock()
 
 
 class TrainingModelFactory:
     @staticmethod
-    def get_nb_training_model(vocabulary, ngram_size, smoothing_value, training_file):
+    def get_nb_training_model(vocabulary, ngram_size, smoothing_value, training_file, backend='dict'):
+        if backend == 'dense':
+            return DenseTrainingModel(vocabulary, int(ngram_size), smoothing_value, training_file)
+
+        if backend == 'sparse':
+            return SparseTrainingModel(vocabulary, int(ngram_size), smoothing_value, training_file)
+
+        if backend == 'sketch':
+            return SketchTrainingModel(vocabulary, int(ngram_size), smoothing_value, training_file)
+
+        if backend == 'trie':
+            return TrieTrainingModel(vocabulary, int(ngram_size), smoothing_value, training_file)
+
         if ngram_size == '1':
             return UnigramTrainingModel(vocabulary, smoothing_value, training_file)
 
@@ -17,52 +61,132 @@ class TrainingModelFactory:
         if ngram_size == '3':
             return TrigramTrainingModel(vocabulary, smoothing_value, training_file)
 
+    @staticmethod
+    def get_byom_training_model(vocabulary, smoothing_value, training_file, backend='dict', ngram_size=3):
+        if backend == 'trie':
+            return TrieBYOMTrainingModel(vocabulary, ngram_size, smoothing_value, training_file)
+
+        if ngram_size != 3:
+            raise ValueError('only the trie backend has BYOM models of another order than 3')
+        return BYOMTrainingModel(vocabulary, smoothing_value, training_file, backend)
+
 
 class TrainingModel(ABC):
+    backend = 'dict'
+    is_snapshot = False
+
     def __init__(self, vocabulary, smoothing_value, training_file):
         self.vocabulary = vocabulary
         self.vocabulary_size = vocabulary.get_size()
         self.smoothing_value = smoothing_value
         self.training_file = training_file
         self.ngram_frequencies = dict()
-        self.language_data = {
-            'eu': {
-                'doc_freq': 0,
-            },
-            'ca': {
-                'doc_freq': 0,
-            },
-            'gl': {
-                'doc_freq': 0,
-            },
-            'es': {
-                'doc_freq': 0,
-            },
-            'en': {
-                'doc_freq': 0,
-            },
-            'pt': {
-                'doc_freq': 0,
-            }
-        }
-
-        for language in self.language_data.keys():
-            self.ngram_frequencies[language] = dict()
-            self.ngram_frequencies[language]['total_count'] = 0
-
-    def train(self):
-        input_file = open(self.training_file, 'r', encoding="utf-8")
-        for line in input_file:
-            partitioned_line = line.split(maxsplit=3)
-            language = partitioned_line[2]
-            tweet = partitioned_line[3]
-
-            self.language_data[language]['doc_freq'] += 1
-            if isinstance(self.vocabulary, CaseInsensitiveAlphabetChars):
-                tweet = tweet.lower()
-
+        # the languages are the labels met in the training data, indexed in the order they were first met
+        self.language_data = dict()
+        self.languages = []
+        self.language_indices = dict()
+        self.frozen = False
+        # bumped whenever the scores the model gives can change
+        self.version = 0
+
+    def train(self, processes=1):
+        if self.frozen:
+            raise RuntimeError('cannot train a frozen model')
+
+        with Stats.stage('train'):
+            if processes > 1:
+                ParallelTraining.train(self, processes)
+            else:
+                self.train_batches(CorpusReader.read_batches(self.training_file))
+            self.prepare_scoring()
+            self.version += 1
+
+        if Stats.enabled:
+            Stats.count('training_tweets', self.get_num_docs())
+            Stats.count('training_ngrams', sum(self.get_ngram_total(language) for language in self.languages))
+
+    def train_batches(self, batches):
+        # learns the (ids, languages, tweets) batches of CorpusReader.read_batches
+        for _, languages, tweets in Stats.timed_iter('read_training_file', batches):
+            self.learn_batch(languages, tweets)
+
+    def add_language(self, language):
+        self.language_indices[language] = len(self.languages)
+        self.languages.append(language)
+        self.language_data.setdefault(language, {'doc_freq': 0})
+        self.ngram_frequencies[language] = dict()
+        self.ngram_frequencies[language]['total_count'] = 0
+
+    def learn_tweet(self, language, tweet):
+        if language not in self.language_indices:
+            self.add_language(language)
+        self.language_data[language]['doc_freq'] += 1
+        if isinstance(self.vocabulary, CaseInsensitiveAlphabetChars):
+            tweet = tweet.lower()
+
+        self.process_tweet(language, tweet)
+        return tweet
+
+    def learn_batch(self, languages, tweets):
+        # learns the tweets of a batch like learn_tweet would one after the other, except that the backends that
+        # override process_batch count the ngrams of the whole batch at once
+        for language in dict.fromkeys(languages):
+            if language not in self.language_indices:
+                self.add_language(language)
+        for language, count in Counter(languages).items():
+            self.language_data[language]['doc_freq'] += count
+        if isinstance(self.vocabulary, CaseInsensitiveAlphabetChars):
+            tweets = [tweet.lower() for tweet in tweets]
+
+        self.process_batch(languages, tweets)
+
+    def process_batch(self, languages, tweets):
+        for language, tweet in zip(languages, tweets):
             self.process_tweet(language, tweet)
 
+    def group_by_language(self, languages, tweet_indices, values):
+        # (language, values) pairs of the values of a batch grouped by the language of the tweet each one comes from,
+        # for the languages that have any
+        language_indices = np.array([self.language_indices[language] for language in languages], dtype=np.int64)
+        language_indices = language_indices[tweet_indices]
+        bounds = np.cumsum(np.bincount(language_indices, minlength=len(self.languages)))
+        groups = np.split(values[np.argsort(language_indices, kind='stable')], bounds[:-1])
+        return [(language, group) for language, group in zip(self.languages, groups) if len(group) > 0]
+
+    def partial_fit(self, examples):
+        # Learns from more (language, tweet) pairs on top of what the model already knows. A frozen model stays
+        # frozen: only the rows of its tables for the ngrams of the new tweets are read from the counts again
+        if self.is_snapshot:
+            raise RuntimeError('cannot update a snapshot')
+
+        with UPDATE_LOCK, Stats.stage('train'):
+            ngram_total = sum(self.get_ngram_total(language) for language in self.languages)
+            tweets = [self.learn_tweet(language, tweet) for language, tweet in examples]
+            self.prepare_scoring()
+            if self.frozen:
+                self.refresh_frozen_tables(tweets)
+            self.version += 1
+
+        if Stats.enabled:
+            Stats.count('training_tweets', len(tweets))
+            Stats.count('training_ngrams', sum(self.get_ngram_total(language) for language in self.languages) -
+                        ngram_total)
+
+    def snapshot(self):
+        # A copy that keeps scoring like the model does now while partial_fit goes on updating the model. partial_fit
+        # replaces the tables instead of writing into them, so the copy shares them, and the counts, which it does not
+        # read once frozen
+        if not self.frozen:
+            raise RuntimeError('only a frozen model can be snapshotted')
+
+        with UPDATE_LOCK:
+            snapshot = copy.copy(self)
+        # partial_fit appends the languages it meets for the first time
+        snapshot.languages = list(self.languages)
+        snapshot.language_indices = dict(self.language_indices)
+        snapshot.is_snapshot = True
+        return snapshot
+
     @abstractmethod
     def process_tweet(self, language, tweet):
         pass
@@ -72,18 +196,334 @@ class TrainingModel(ABC):
         pass
 
     @abstractmethod
-    def get_ngram_probability(self, ngram, language):
+    def get_ngram_frequency(self, ngram, language):
         pass
 
     @abstractmethod
-    def get_ten_most_frequent_ngrams(self):
+    def get_seen_ngrams(self, language):
         pass
 
+    def get_ngram_total(self, language):
+        return self.ngram_frequencies[language]['total_count']
+
+    def get_smoothed_ngram_total(self, language):
+        return self.get_ngram_total(language) + self.smoothing_value * (self.vocabulary_size ** self.ngram_size)
+
+    def get_ngram_probability(self, ngram, language):
+        freq_ngram_for_language = self.smoothing_value + self.get_ngram_frequency(ngram, language)
+        return freq_ngram_for_language / self.get_smoothed_ngram_total(language)
+
+    def prepare_scoring(self):
+        # constants shared by every ngram of every tweet, computed once after training instead of per lookup
+        self.log_priors = self.compute_log_priors()
+        self.log_denominators = dict()
+        for language in self.language_data.keys():
+            total = self.get_smoothed_ngram_total(language)
+            self.log_denominators[language] = log10(total) if total > 0 else float('inf')
+        self.log_prior_vector = np.array([self.log_priors[language] for language in self.languages])
+        self.log_denominator_vector = np.array([self.log_denominators[language] for language in self.languages])
+
+    def freeze(self):
+        # replaces the counts with a read-only table of log10 probabilities, with one row per ngram seen in training
+        # (in the order of their sorted ids) and a last row holding every language's probability for an unseen ngram
+        ngram_keys, counts = self.get_ngram_counts()
+        frequencies = np.zeros((len(ngram_keys) + 1, len(self.languages)))
+        frequencies[:-1] = counts
+
+        # the frequencies are kept so that the table can be rebuilt for another smoothing value
+        frequencies.flags.writeable = False
+        ngram_keys.flags.writeable = False
+        self.frequency_table = frequencies
+        self.ngram_keys = ngram_keys
+        self.build_log_probability_table()
+        self.frozen = True
+
+    def get_all_seen_ngrams(self):
+        # sorted ids of the ngrams seen in at least one language
+        return np.unique(np.concatenate([np.zeros(0, dtype=np.int64)] +
+                                        [np.fromiter(self.get_seen_ngrams(language), dtype=np.int64)
+                                         for language in self.languages]))
+
+    def get_frequency_rows(self, ngrams):
+        # (ngrams, languages) counts of the given ngrams
+        frequencies = np.zeros((len(ngrams), len(self.languages)))
+        for language_index, language in enumerate(self.languages):
+            for row, ngram in enumerate(ngrams.tolist()):
+                frequencies[row, language_index] = self.get_ngram_frequency(ngram, language)
+        return frequencies
+
+    def get_ngram_counts(self):
+        # sorted ids of every ngram seen in training with their (ngrams, languages) counts, read in one walk over the
+        # trees of every language
+        paths, counts = ModelStorage.flatten_trees([self.ngram_frequencies[language] for language in self.languages],
+                                                   self.ngram_size)
+        # the shorter paths hold 'total_count' values
+        complete = (paths >= 0).all(axis=1)
+        ngram_keys = NgramExtractor.pack_windows(paths[complete])
+        order = np.argsort(ngram_keys)
+        return ngram_keys[order], counts[complete][order]
+
+    def get_ngram_log_probabilities(self, ngram_keys, counts):
+        # (ngrams, languages) log10 probabilities of ngrams with the given counts
+        with np.errstate(divide='ignore'):
+            return np.log10(counts + self.smoothing_value) - self.log_denominator_vector
+
+    def decode_ngram(self, ngram):
+        return NgramExtractor.decode(ngram, self.ngram_size)
+
+    def pack_ngram_keys(self, ngram_keys):
+        # the packed ids of ngrams given by the ids get_ngram_counts returns, which they already are for most backends
+        return ngram_keys
+
+    def top_ngrams(self, k, language=None, by='count'):
+        # the k ngrams seen in a language with the highest count, probability or discriminativeness, as (ngram, value)
+        # pairs from the highest value down, or a dict of them for every language when no language is given. The
+        # discriminativeness of an ngram is its probability times how much higher its log10 probability is in the
+        # language than in the most likely other language, that is its expected weight for the language over that one
+        if by not in TOP_NGRAMS_MEASURES:
+            raise ValueError('top ngrams can only be ranked by one of {}'.format(', '.join(TOP_NGRAMS_MEASURES)))
+
+        ngram_keys, counts = self.get_ngram_counts()
+        if by == 'count':
+            values = counts
+        else:
+            log_probabilities = self.get_ngram_log_probabilities(ngram_keys, counts)
+            values = 10 ** log_probabilities
+            if by == 'discriminativeness':
+                values = values * TrainingModel.get_log_odds_over_others(log_probabilities)
+
+        top_ngrams = dict()
+        for top_language in self.languages if language is None else [language]:
+            language_index = self.language_indices[top_language]
+            rows = np.flatnonzero(counts[:, language_index] > 0)
+            language_values = values[rows, language_index]
+            if k < len(rows):
+                # only the k best are sorted
+                selected = np.argpartition(-language_values, max(k - 1, 0))[:k]
+                rows = rows[selected]
+                language_values = language_values[selected]
+            order = np.lexsort((ngram_keys[rows], -language_values))
+            top_ngrams[top_language] = [(self.decode_ngram(ngram), value) for ngram, value in
+                                        zip(ngram_keys[rows[order]].tolist(), language_values[order].tolist())]
+        return top_ngrams if language is None else top_ngrams[language]
+
+    @staticmethod
+    def get_log_odds_over_others(log_probabilities):
+        # how much higher every log10 probability is than the highest one of the other languages for the same ngram
+        rows = np.arange(len(log_probabilities))
+        best_languages = np.argmax(log_probabilities, axis=1)
+        others = log_probabilities.copy()
+        others[rows, best_languages] = float('-inf')
+        best_others = np.repeat(log_probabilities[rows, best_languages][:, np.newaxis], log_probabilities.shape[1],
+                                axis=1)
+        best_others[rows, best_languages] = others.max(axis=1, initial=float('-inf'))
+        with np.errstate(invalid='ignore'):
+            return log_probabilities - best_others
+
+    def get_ten_most_frequent_ngrams(self):
+        return {language: sorted((count, ngram) for ngram, count in ngrams)
+                for language, ngrams in self.top_ngrams(10).items()}
+
+    def refresh_frozen_tables(self, tweets):
+        # the rows of the ngrams in the given tweets are read from the counts again, ngrams seen for the first time
+        # getting rows of their own, while the others are copied from the current table
+        ngrams = np.unique(np.concatenate([np.zeros(0, dtype=np.int64)] +
+                                          [self.parse_tweet(tweet) for tweet in tweets]))
+        ngram_keys, positions = TrainingModel.insert_keys(self.ngram_keys, ngrams)
+        frequencies = np.zeros((len(ngram_keys) + 1, len(self.languages)))
+        # a language met for the first time has no counts but for the ngrams of the new tweets
+        frequencies[positions, :self.frequency_table.shape[1]] = self.frequency_table[:-1]
+        frequencies[np.searchsorted(ngram_keys, ngrams)] = self.get_frequency_rows(ngrams)
+
+        frequencies.flags.writeable = False
+        ngram_keys.flags.writeable = False
+        self.frequency_table = frequencies
+        self.ngram_keys = ngram_keys
+        self.build_log_probability_table()
+
+    def build_log_probability_table(self):
+        with np.errstate(divide='ignore'):
+            log_frequencies = np.log10(self.frequency_table + self.smoothing_value)
+        self.log_probability_table = np.ascontiguousarray(log_frequencies - self.log_denominator_vector)
+        self.log_probability_table.flags.writeable = False
+        # highest log10 probability any single ngram can add to each language's score
+        self.best_log_probabilities = self.log_probability_table.max(axis=0)
+
+    def set_smoothing_value(self, smoothing_value):
+        # the counts do not depend on δ, so a trained model can be scored with another one without retraining
+        self.smoothing_value = smoothing_value
+        self.prepare_scoring()
+        if self.frozen:
+            self.build_log_probability_table()
+        self.version += 1
+
+    def score_batch(self, tweets):
+        return [dict(zip(self.languages, tweet_scores)) for tweet_scores in self.score_matrix(tweets).tolist()]
+
+    def score_batch_top1(self, tweets):
+        # like score_batch, but only with the languages that could be the most likely one
+        return [{language: score for language, score in zip(self.languages, tweet_scores) if score == score}
+                for tweet_scores in self.score_matrix(tweets, top1=True).tolist()]
+
+    def score_matrix(self, tweets, top1=False):
+        # (tweets, languages) scores, in the order of self.languages. With top1, the languages score_rows_top1 finds
+        # cannot be the most likely one are left out as NaN
+        if not self.frozen or len(tweets) == 0:
+            scores = [self.score_all_languages(tweet) for tweet in tweets]
+            return np.array([[tweet_scores[language] for language in self.languages] for tweet_scores in scores],
+                            dtype=float).reshape(len(tweets), len(self.languages))
+
+        with Stats.stage('parse_tweet'):
+            ngrams = [self.parse_tweet(tweet) for tweet in tweets]
+        with Stats.stage('score'):
+            rows = self.get_ngram_rows_of_tweets(ngrams)
+            scores = self.score_rows_top1(rows) if top1 else self.score_rows(rows)
+        if Stats.enabled:
+            self.record_scoring_stats(rows, scores)
+        return scores
+
+    def record_scoring_stats(self, rows, scores):
+        all_rows = np.concatenate(rows)
+        Stats.count('scored_tweets', len(rows))
+        Stats.count('scored_ngrams', len(all_rows))
+        # lookups of an ngram a language has no count for, which only get the smoothing value
+        Stats.count('smoothed_lookups', np.count_nonzero(self.frequency_table[all_rows] == 0))
+        Stats.count('negative_infinity_scores', np.count_nonzero(np.isneginf(scores)))
+
+    def score_rows(self, rows):
+        # (tweets, languages) scores of tweets given as the table rows of their ngrams: one gather over the rows of
+        # every ngram in the batch, then a sum per tweet
+        lengths = np.array([len(tweet_rows) for tweet_rows in rows])
+        scores = TrainingModel.sum_segments(self.log_probability_table[np.concatenate(rows)], lengths)
+        scores += self.log_prior_vector
+        return scores
+
+    def score_rows_top1(self, rows):
+        # Scores like score_rows, but only the languages that can still be the best one are fully scored, the others
+        # being NaN. The leader after the first TOP1_PREFIX_SIZE ngrams is scored fully, then the other languages are
+        # scored in chunks of growing size and dropped as soon as their score so far plus the best log probability
+        # they could get for each remaining ngram falls below the leader's score. The bounds leave room for rounding,
+        # and tweets whose two best scores are that close are scored fully, so the best language is always the one
+        # score_rows gives
+        lengths = np.array([len(tweet_rows) for tweet_rows in rows])
+        all_rows = np.concatenate(rows)
+        offsets = np.cumsum(lengths) - lengths
+        tweet_indices = np.arange(len(rows))
+
+        prefix_lengths = np.minimum(lengths, TOP1_PREFIX_SIZE)
+        prefix_rows = all_rows[TrainingModel.get_segment_positions(offsets, prefix_lengths)]
+        partial_scores = self.log_prior_vector + TrainingModel.sum_segments(self.log_probability_table[prefix_rows],
+                                                                            prefix_lengths)
+
+        leaders = np.argmax(partial_scores, axis=1)
+        leader_scores = self.log_prior_vector[leaders] + TrainingModel.sum_segments(
+            self.log_probability_table[all_rows, np.repeat(leaders, lengths)], lengths)
+        margins = TOP1_TOLERANCE * (1 + np.abs(np.where(np.isfinite(leader_scores), leader_scores, 0)))
+        thresholds = (leader_scores - margins)[:, np.newaxis]
+
+        candidates = np.ones(partial_scores.shape, dtype=bool)
+        candidates[tweet_indices, leaders] = False
+        scored_length = TOP1_PREFIX_SIZE
+        while True:
+            remaining_lengths = np.maximum(lengths - scored_length, 0)[:, np.newaxis]
+            with np.errstate(invalid='ignore'):
+                upper_bounds = partial_scores + np.where(remaining_lengths > 0,
+                                                         remaining_lengths * self.best_log_probabilities, 0)
+            candidates &= upper_bounds >= thresholds
+            candidate_tweets, candidate_languages = np.nonzero(candidates & (remaining_lengths > 0))
+            if len(candidate_tweets) == 0:
+                break
+
+            chunk_lengths = np.minimum(remaining_lengths[candidate_tweets, 0], scored_length)
+            chunk_rows = all_rows[TrainingModel.get_segment_positions(offsets[candidate_tweets] + scored_length,
+                                                                      chunk_lengths)]
+            partial_scores[candidate_tweets, candidate_languages] += TrainingModel.sum_segments(
+                self.log_probability_table[chunk_rows, np.repeat(candidate_languages, chunk_lengths)], chunk_lengths)
+            scored_length *= 2
+
+        scores = np.where(candidates, partial_scores, np.nan)
+        scores[tweet_indices, leaders] = leader_scores
+        best_scores = np.fmax.reduce(scores, axis=1)
+        near_ties = np.flatnonzero(np.isfinite(best_scores) &
+                                   ((scores >= (best_scores - margins)[:, np.newaxis]).sum(axis=1) > 1))
+        if len(near_ties) > 0:
+            scores[near_ties] = self.score_rows([rows[tweet_index] for tweet_index in near_ties])
+        return scores
+
+    def get_ngram_rows(self, ngrams):
+        return TrainingModel.lookup_rows(self.ngram_keys, ngrams, len(self.ngram_keys))
+
+    def get_ngram_rows_of_tweets(self, tweet_ngrams):
+        return [self.get_ngram_rows(ngrams) for ngrams in tweet_ngrams]
+
+    @staticmethod
+    def get_segment_positions(starts, lengths):
+        # the positions start, start + 1, ..., start + length - 1 of every segment, one segment after the other
+        return np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+
+    @staticmethod
+    def sum_segments(values, lengths, dtype=None):
+        # sums of consecutive segments of values with the given lengths, 0 for an empty segment, accumulated in the
+        # given dtype if any
+        padded_values = np.concatenate([values, np.zeros((1,) + values.shape[1:], dtype=values.dtype)])
+        sums = np.add.reduceat(padded_values, np.cumsum(lengths) - lengths, axis=0, dtype=dtype)
+        sums[lengths == 0] = 0
+        return sums
+
+    @staticmethod
+    def insert_keys(keys, ngrams):
+        # the sorted keys with the sorted ngrams that are not among them inserted in order, and the positions the
+        # keys that were already there moved to
+        new_keys = ngrams[TrainingModel.lookup_rows(keys, ngrams, -1) < 0]
+        merged_keys = np.insert(keys, np.searchsorted(keys, new_keys), new_keys)
+        return merged_keys, np.arange(len(keys)) + np.searchsorted(new_keys, keys)
+
+    @staticmethod
+    def lookup_rows(keys, ngrams, missing_row):
+        # rows of the given ngrams in the sorted keys, or missing_row for the ones that are not there
+        rows = np.searchsorted(keys, ngrams)
+        found = rows < len(keys)
+        found[found] = keys[rows[found]] == ngrams[found]
+        return np.where(found, rows, missing_row)
+
+    def compute_log_priors(self):
+        log_priors = dict()
+        for language in self.language_data.keys():
+            probability = self.get_probability_of_language(language)
+            log_priors[language] = log10(probability) if probability > 0 else float('-inf')
+        return log_priors
+
+    def score_all_languages(self, tweet):
+        if self.frozen:
+            rows = self.get_ngram_rows(self.parse_tweet(tweet))
+            scores = self.log_prior_vector + self.log_probability_table[rows].sum(axis=0)
+            return dict(zip(self.languages, scores.tolist()))
+
+        scores = dict(self.log_priors)
+        for ngram in self.parse_tweet(tweet).tolist():
+            for language in scores.keys():
+                if scores[language] == float('-inf'):
+                    continue
+
+                frequency = self.get_ngram_frequency(ngram, language) + self.smoothing_value
+                if frequency == 0:
+                    scores[language] = float('-inf')
+                    if Stats.enabled:
+                        Stats.count('negative_infinity_short_circuits')
+                else:
+                    scores[language] += log10(frequency) - self.log_denominators[language]
+        return scores
+
     def get_language_score_of_tweet(self, language, tweet):
+        if self.frozen:
+            return self.score_all_languages(tweet)[language]
+
         score = log10(self.get_probability_of_language(language))
-        for ngram in self.parse_tweet(tweet):
+        for ngram in self.parse_tweet(tweet).tolist():
             probability = self.get_ngram_probability(ngram, language)
             if probability == 0:
+                if Stats.enabled:
+                    Stats.count('negative_infinity_short_circuits')
                 return float('-inf')
             score += log10(probability)
         return score
@@ -99,74 +539,171 @@ class TrainingModel(ABC):
             num_docs += language_data['doc_freq']
         return num_docs
 
+    def merge(self, other):
+        # counts simply add up, so models trained on different parts of a corpus (or on different corpora) can be
+        # combined into the model that would have been trained on all of them
+        if self.frozen:
+            raise RuntimeError('cannot merge into a frozen model')
+
+        self.check_same_kind(other, 'merge')
+        self.add_model(other)
+        self.prepare_scoring()
+        self.version += 1
+
+    def subtract(self, other):
+        # the inverse of merge: takes out the counts of a model trained on part of this model's training data, which
+        # leaves the model that would have been trained on the rest of it
+        if self.frozen:
+            raise RuntimeError('cannot subtract from a frozen model')
+
+        self.check_same_kind(other, 'subtract')
+        if any(language not in self.language_indices for language in other.languages):
+            raise ValueError('can only subtract a model whose languages are all in this one')
+
+        self.subtract_counts(other)
+        for language in other.languages:
+            self.language_data[language]['doc_freq'] -= other.language_data[language]['doc_freq']
+        self.prepare_scoring()
+        self.version += 1
+
+    def check_same_kind(self, other, action):
+        if type(other) is not type(self) or other.backend != self.backend or other.ngram_size != self.ngram_size or \
+                other.vocabulary.vocabulary_type != self.vocabulary.vocabulary_type:
+            raise ValueError('can only {} models of the same type, backend, vocabulary and ngram size'.format(action))
+
+    def unfreeze(self):
+        # back to counting, so that the model can be merged or subtracted from again. The tables are left to the
+        # next freeze to rebuild
+        self.frozen = False
+
+    def add_model(self, other):
+        # adds the counts of a model of the same kind, along with the languages only it has
+        for language in other.languages:
+            if language not in self.language_indices:
+                self.add_language(language)
+        self.merge_counts(other)
+        for language in other.languages:
+            self.language_data[language]['doc_freq'] += other.language_data[language]['doc_freq']
+
+    def merge_counts(self, other):
+        for language in other.languages:
+            TrainingModel.add_trees(self.ngram_frequencies[language], other.ngram_frequencies[language])
+
+    def subtract_counts(self, other):
+        for language in other.languages:
+            TrainingModel.subtract_trees(self.ngram_frequencies[language], other.ngram_frequencies[language])
+
+    @staticmethod
+    def add_trees(target, source):
+        for key, value in source.items():
+            if isinstance(value, dict):
+                TrainingModel.add_trees(target.setdefault(key, dict()), value)
+            else:
+                target[key] = target.get(key, 0) + value
+
+    @staticmethod
+    def subtract_trees(target, source):
+        # counts that drop to 0 are removed, and so are the subtrees left with nothing but a total count, so that
+        # the trees are the ones the remaining tweets would have built
+        for key, value in source.items():
+            if isinstance(value, dict):
+                TrainingModel.subtract_trees(target[key], value)
+                if all(child_key == 'total_count' for child_key in target[key]):
+                    del target[key]
+            else:
+                target[key] -= value
+                if target[key] == 0 and key != 'total_count':
+                    del target[key]
+
+    def get_count_arrays(self):
+        paths, counts = ModelStorage.flatten_trees([self.ngram_frequencies[language] for language in self.languages],
+                                                   self.ngram_size)
+        return {'paths': paths, 'counts': counts}
+
+    def set_count_arrays(self, arrays):
+        ModelStorage.fill_trees([self.ngram_frequencies[language] for language in self.languages],
+                                arrays['paths'], arrays['counts'])
+
+    def save(self, path):
+        header = {
+            'model': self.model_type,
+            'backend': self.backend,
+            'vocabulary': self.vocabulary.vocabulary_type,
+            'ngram_size': self.ngram_size,
+            'smoothing_value': self.smoothing_value,
+            'languages': self.languages,
+            'doc_freq': [self.language_data[language]['doc_freq'] for language in self.languages],
+        }
+        ModelStorage.write(path, header, self.get_count_arrays())
+
+    @staticmethod
+    def load(path):
+        header, arrays = ModelStorage.read(path)
+        vocabulary = VocabularyFactory.get_vocabulary(header['vocabulary'])
+        # models saved before the header had a backend only tell a dense model apart by its type
+        backend = header.get('backend', 'dense' if header['model'] == DenseTrainingModel.model_type else 'dict')
+        if header['model'] == BYOMTrainingModel.model_type:
+            model = TrainingModelFactory.get_byom_training_model(vocabulary, header['smoothing_value'], None, backend,
+                                                                 header['ngram_size'])
+        else:
+            model = TrainingModelFactory.get_nb_training_model(vocabulary, str(header['ngram_size']),
+                                                               header['smoothing_value'], None, backend)
+
+        for language, doc_freq in zip(header['languages'], header['doc_freq']):
+            model.add_language(language)
+            model.language_data[language]['doc_freq'] = doc_freq
+        model.set_count_arrays(arrays)
+        model.prepare_scoring()
+        return model
+
 
 class UnigramTrainingModel(TrainingModel):
+    model_type = 'unigram'
+
     def __init__(self, vocabulary, smoothing_value, training_file):
         super().__init__(vocabulary, smoothing_value, training_file)
+        self.ngram_size = 1
+        self.extractor = NgramExtractor(vocabulary, self.ngram_size)
 
     def parse_tweet(self, tweet):
-        unigrams = []
-        for char in tweet:
-            if self.vocabulary.is_in_vocabulary(char):
-                unigrams.append(char)
-        return unigrams
+        return self.extractor.extract(tweet)
 
     def process_tweet(self, language, tweet):
-        for unigram in self.parse_tweet(tweet):
+        for codepoint, in self.extractor.extract_windows(tweet).tolist():
             self.ngram_frequencies[language]['total_count'] += 1
 
-            codepoint = ord(unigram)
             if codepoint not in self.ngram_frequencies[language]:
-                self.ngram_frequencies[language][ord(unigram)] = 1
+                self.ngram_frequencies[language][codepoint] = 1
             else:
-                self.ngram_frequencies[language][ord(unigram)] += 1
+                self.ngram_frequencies[language][codepoint] += 1
 
-    def get_ngram_probability(self, ngram, language):
-        freq_ngram_for_language = self.smoothing_value
+    def get_ngram_frequency(self, ngram, language):
         try:
-            freq_ngram_for_language += self.ngram_frequencies[language][ord(ngram)]
+            return self.ngram_frequencies[language][ngram]
         except KeyError:
-            pass
-
-        total_ngram_count_for_language = self.ngram_frequencies[language]['total_count'] + \
-                                         self.smoothing_value * self.vocabulary_size
-
-        return freq_ngram_for_language / total_ngram_count_for_language
+            return 0
 
-    def get_ten_most_frequent_ngrams(self):
-        most_frequent_ngrams = dict()
-        for language in self.ngram_frequencies.keys():
-            most_frequent_ngrams[language] = []
-            for codepoint, frequency in self.ngram_frequencies[language].items():
-                if codepoint != 'total_count':
-                    bisect.insort(most_frequent_ngrams[language], (frequency, chr(codepoint)))
-                    if len(most_frequent_ngrams[language]) > 10:
-                        most_frequent_ngrams[language].pop(0)
-        return most_frequent_ngrams
+    def get_seen_ngrams(self, language):
+        for codepoint in self.ngram_frequencies[language].keys():
+            if codepoint != 'total_count':
+                yield codepoint
 
 
 class BigramTrainingModel(TrainingModel):
+    model_type = 'bigram'
+
     def __init__(self, vocabulary, smoothing_value, training_file):
         super().__init__(vocabulary, smoothing_value, training_file)
+        self.ngram_size = 2
+        self.extractor = NgramExtractor(vocabulary, self.ngram_size)
 
     def parse_tweet(self, tweet):
-        bigrams = []
-        if len(tweet) < 2:
-            return bigrams
-
-        for i in range(len(tweet) - 1):
-            bigram = tweet[i] + tweet[i + 1]
-            if all(self.vocabulary.is_in_vocabulary(char) for char in bigram):
-                bigrams.append(bigram)
-        return bigrams
+        return self.extractor.extract(tweet)
 
     def process_tweet(self, language, tweet):
-        for bigram in self.parse_tweet(tweet):
+        for codepoint1, codepoint2 in self.extractor.extract_windows(tweet).tolist():
             self.ngram_frequencies[language]['total_count'] += 1
 
-            codepoint1 = ord(bigram[0])
-            codepoint2 = ord(bigram[1])
-
             if codepoint1 not in self.ngram_frequencies[language]:
                 self.ngram_frequencies[language][codepoint1] = dict()
                 self.ngram_frequencies[language][codepoint1][codepoint2] = 1
@@ -176,58 +713,37 @@ class BigramTrainingModel(TrainingModel):
                 else:
                     self.ngram_frequencies[language][codepoint1][codepoint2] += 1
 
-    def get_ngram_probability(self, ngram, language):
-        codepoint1 = ord(ngram[0])
-        codepoint2 = ord(ngram[1])
+    def get_ngram_frequency(self, ngram, language):
+        codepoint1, codepoint2 = NgramExtractor.unpack(ngram, 2)
 
-        freq_ngram_for_language = self.smoothing_value
         try:
-            freq_ngram_for_language += self.ngram_frequencies[language][codepoint1][codepoint2]
+            return self.ngram_frequencies[language][codepoint1][codepoint2]
         except KeyError:
-            pass
+            return 0
 
-        total_ngram_count_for_language = self.ngram_frequencies[language]['total_count'] + \
-                                         self.smoothing_value * (self.vocabulary_size ** 2)
-        return freq_ngram_for_language / total_ngram_count_for_language
-
-    def get_ten_most_frequent_ngrams(self):
-        most_frequent_ngrams = dict()
-        for language in self.ngram_frequencies.keys():
-            most_frequent_ngrams[language] = []
-            for codepoint1 in self.ngram_frequencies[language].keys():
-                if codepoint1 != 'total_count':
-                    for codepoint2, frequency in self.ngram_frequencies[language][codepoint1].items():
-                        if codepoint2 != 'total_count':
-                            bigram = chr(codepoint1) + chr(codepoint2)
-                            bisect.insort(most_frequent_ngrams[language], (frequency, bigram))
-                            if len(most_frequent_ngrams[language]) > 10:
-                                most_frequent_ngrams[language].pop(0)
-        return most_frequent_ngrams
+    def get_seen_ngrams(self, language):
+        for codepoint1 in self.ngram_frequencies[language].keys():
+            if codepoint1 != 'total_count':
+                for codepoint2 in self.ngram_frequencies[language][codepoint1].keys():
+                    if codepoint2 != 'total_count':
+                        yield (codepoint1 << CODEPOINT_BITS) | codepoint2
 
 
 class TrigramTrainingModel(TrainingModel):
+    model_type = 'trigram'
+
     def __init__(self, vocabulary, smoothing_value, training_file):
         super().__init__(vocabulary, smoothing_value, training_file)
+        self.ngram_size = 3
+        self.extractor = NgramExtractor(vocabulary, self.ngram_size)
 
     def parse_tweet(self, tweet):
-        trigrams = []
-        if len(tweet) < 3:
-            return trigrams
-
-        for i in range(len(tweet) - 2):
-            trigram = tweet[i] + tweet[i + 1] + tweet[i + 2]
-            if all(self.vocabulary.is_in_vocabulary(char) for char in trigram):
-                trigrams.append(trigram)
-        return trigrams
+        return self.extractor.extract(tweet)
 
     def process_tweet(self, language, tweet):
-        for trigram in self.parse_tweet(tweet):
+        for codepoint1, codepoint2, codepoint3 in self.extractor.extract_windows(tweet).tolist():
             self.ngram_frequencies[language]['total_count'] += 1
 
-            codepoint1 = ord(trigram[0])
-            codepoint2 = ord(trigram[1])
-            codepoint3 = ord(trigram[2])
-
             if codepoint1 not in self.ngram_frequencies[language]:
                 self.ngram_frequencies[language][codepoint1] = dict()
                 self.ngram_frequencies[language][codepoint1][codepoint2] = dict()
@@ -242,136 +758,1147 @@ class TrigramTrainingModel(TrainingModel):
                     else:
                         self.ngram_frequencies[language][codepoint1][codepoint2][codepoint3] += 1
 
-    def get_ngram_probability(self, ngram, language):
-        codepoint1 = ord(ngram[0])
-        codepoint2 = ord(ngram[1])
-        codepoint3 = ord(ngram[2])
+    def get_ngram_frequency(self, ngram, language):
+        codepoint1, codepoint2, codepoint3 = NgramExtractor.unpack(ngram, 3)
 
-        freq_ngram_for_language = self.smoothing_value
         try:
-            freq_ngram_for_language += self.ngram_frequencies[language][codepoint1][codepoint2][codepoint3]
+            return self.ngram_frequencies[language][codepoint1][codepoint2][codepoint3]
         except KeyError:
-            pass
-
-        total_ngram_count_for_language = self.ngram_frequencies[language]['total_count'] + \
-                                         self.smoothing_value * (self.vocabulary_size ** 3)
-        return freq_ngram_for_language / total_ngram_count_for_language
-
-    def get_ten_most_frequent_ngrams(self):
-        most_frequent_ngrams = dict()
-        for language in self.ngram_frequencies.keys():
-            most_frequent_ngrams[language] = []
-            for codepoint1 in self.ngram_frequencies[language].keys():
-                if codepoint1 != 'total_count':
-                    for codepoint2 in self.ngram_frequencies[language][codepoint1].keys():
-                        for codepoint3, frequency in self.ngram_frequencies[language][codepoint1][codepoint2].items():
+            return 0
+
+    def get_seen_ngrams(self, language):
+        for codepoint1 in self.ngram_frequencies[language].keys():
+            if codepoint1 != 'total_count':
+                for codepoint2 in self.ngram_frequencies[language][codepoint1].keys():
+                    if codepoint2 != 'total_count':
+                        for codepoint3 in self.ngram_frequencies[language][codepoint1][codepoint2].keys():
                             if codepoint3 != 'total_count':
-                                trigram = chr(codepoint1) + chr(codepoint2) + chr(codepoint3)
-                                bisect.insort(most_frequent_ngrams[language], (frequency, trigram))
-                                if len(most_frequent_ngrams[language]) > 10:
-                                    most_frequent_ngrams[language].pop(0)
-        return most_frequent_ngrams
+                                yield (((codepoint1 << CODEPOINT_BITS) | codepoint2) << CODEPOINT_BITS) | codepoint3
 
 
 class BYOMTrainingModel(TrainingModel):
+    model_type = 'byom'
+
     def parse_tweet(self, tweet):
         return self.trigramModel.parse_tweet(tweet)
 
-    def __init__(self, vocabulary, smoothing_value, training_file):
+    def __init__(self, vocabulary, smoothing_value, training_file, backend='dict'):
         super().__init__(vocabulary, smoothing_value, training_file)
+        self.ngram_size = 3
+        self.backend = backend
+
+        if backend == 'sparse':
+            self.unigramModel = SparseTrainingModel(vocabulary, 1, smoothing_value, training_file)
+            self.bigramModel = SparseTrainingModel(vocabulary, 2, smoothing_value, training_file)
+            self.trigramModel = SparseTrainingModel(vocabulary, 3, smoothing_value, training_file)
+        elif backend == 'dict':
+            self.unigramModel = UnigramTrainingModel(vocabulary, smoothing_value, training_file)
+            self.bigramModel = BigramTrainingModel(vocabulary, smoothing_value, training_file)
+            self.trigramModel = TrigramTrainingModel(vocabulary, smoothing_value, training_file)
+        else:
+            raise ValueError('BYOM only supports the dict and sparse backends')
+
+        # the sub-models are only ever trained through this model, so they all share its document counts
+        for model in self.get_sub_models().values():
+            model.language_data = self.language_data
+        # the frozen tables of the bigram and trigram probabilities, by ngram size
+        self.conditional_tables = dict()
+
+    def add_language(self, language):
+        super().add_language(language)
+        for model in self.get_sub_models().values():
+            model.add_language(language)
+
+    def prepare_scoring(self):
+        for model in self.get_sub_models().values():
+            model.prepare_scoring()
+        # how many bigrams and trigrams were seen after every context, and how many distinct chars, by ngram size.
+        # They are summed from the counts the first time they are needed
+        self.context_statistics = dict()
+        self.log_priors = self.compute_log_priors()
+        self.log_prior_vector = np.array([self.log_priors[language] for language in self.languages])
+
+    def get_count_arrays(self):
+        arrays = dict()
+        for prefix, model in self.get_sub_models().items():
+            for name, array in model.get_count_arrays().items():
+                arrays[prefix + '_' + name] = array
+        return arrays
+
+    def set_count_arrays(self, arrays):
+        for prefix, model in self.get_sub_models().items():
+            model.set_count_arrays({name[len(prefix) + 1:]: array for name, array in arrays.items()
+                                    if name.startswith(prefix + '_')})
+
+    def merge_counts(self, other):
+        for prefix, model in self.get_sub_models().items():
+            model.merge_counts(other.get_sub_models()[prefix])
+
+    def subtract_counts(self, other):
+        for prefix, model in self.get_sub_models().items():
+            model.subtract_counts(other.get_sub_models()[prefix])
+
+    def unfreeze(self):
+        super().unfreeze()
+        self.unigramModel.unfreeze()
+        self.conditional_tables = dict()
+
+    def get_sub_models(self):
+        return {'unigram': self.unigramModel, 'bigram': self.bigramModel, 'trigram': self.trigramModel}
+
+    def get_sub_model(self, ngram_size):
+        return (self.unigramModel, self.bigramModel, self.trigramModel)[ngram_size - 1]
+
+    def freeze(self):
+        self.unigramModel.freeze()
+        self.conditional_tables = self.build_conditional_tables()
+        self.frozen = True
+
+    def build_conditional_tables(self):
+        # the bigram table comes first, as the trigram table reads the probabilities of the trigrams' last two chars
+        # from it
+        tables = dict()
+        for model in (self.bigramModel, self.trigramModel):
+            ngram_keys, counts = model.get_ngram_counts()
+            self.context_statistics[model.ngram_size] = BYOMTrainingModel.get_context_statistics(ngram_keys, counts)
+            lower_log_probabilities = self.get_conditional_log_probabilities(
+                model.ngram_size - 1, BYOMTrainingModel.get_suffixes(ngram_keys, model.ngram_size), tables)
+            table = self.interpolate(model.ngram_size, ngram_keys, counts, lower_log_probabilities)
+
+            # an ngram never seen after a context gets the weight of the context times the probability of its lower
+            # order
+            context_keys, context_totals, context_types = self.context_statistics[model.ngram_size]
+            weights = BYOMTrainingModel.get_log_weights(context_totals, context_types)
+            tables[model.ngram_size] = ConditionalLogProbabilityTable(ngram_keys, table, context_keys, weights)
+        return tables
+
+    def refresh_frozen_tables(self, tweets):
+        # new counts change the weights of their contexts, and the probabilities of every longer ngram that ends like
+        # them, so the conditional tables are built again
+        self.unigramModel.refresh_frozen_tables(tweets)
+        self.conditional_tables = self.build_conditional_tables()
+
+    def snapshot(self):
+        # the frozen unigram model's tables are replaced by partial_fit too
+        with UPDATE_LOCK:
+            snapshot = super().snapshot()
+            snapshot.unigramModel = self.unigramModel.snapshot()
+        return snapshot
 
-        self.unigramModel = UnigramTrainingModel(vocabulary, smoothing_value, training_file)
-        self.bigramModel = BigramTrainingModel(vocabulary, smoothing_value, training_file)
-        self.trigramModel = TrigramTrainingModel(vocabulary, smoothing_value, training_file)
+    def process_tweet(self, language, tweet):
+        if self.backend == 'sparse':
+            # every sub-model gets the packed windows of the same encoded tweet
+            codepoints, indices = self.trigramModel.extractor.encode(tweet)
+            for model in self.get_sub_models().values():
+                starts = NgramExtractor.get_window_starts(indices, model.ngram_size)
+                model.add_ngrams(language, NgramExtractor.pack_windows(
+                    NgramExtractor.get_windows(codepoints, starts, model.ngram_size)))
+            return
+
+        # encodes the tweet once and counts unigrams, bigrams and trigrams in one sweep over it
+        unigrams = self.unigramModel.ngram_frequencies[language]
+        bigrams = self.bigramModel.ngram_frequencies[language]
+        trigrams = self.trigramModel.ngram_frequencies[language]
+
+        # chars outside the vocabulary are encoded as -1 and end every window that would contain them
+        codepoints, indices = self.trigramModel.extractor.encode(tweet)
+        codepoints = np.where(indices >= 0, codepoints, -1).tolist()
+        codepoints.extend((-1, -1))
+        for i in range(len(codepoints) - 2):
+            codepoint1 = codepoints[i]
+            if codepoint1 < 0:
+                continue
+
+            unigrams['total_count'] += 1
+            unigrams[codepoint1] = unigrams.get(codepoint1, 0) + 1
+
+            codepoint2 = codepoints[i + 1]
+            if codepoint2 < 0:
+                continue
+
+            bigrams['total_count'] += 1
+            bigrams_of_codepoint1 = bigrams.setdefault(codepoint1, dict())
+            bigrams_of_codepoint1[codepoint2] = bigrams_of_codepoint1.get(codepoint2, 0) + 1
+
+            codepoint3 = codepoints[i + 2]
+            if codepoint3 < 0:
+                continue
+
+            trigrams['total_count'] += 1
+            trigrams_of_codepoint2 = trigrams.setdefault(codepoint1, dict()).setdefault(codepoint2, dict())
+            trigrams_of_codepoint2[codepoint3] = trigrams_of_codepoint2.get(codepoint3, 0) + 1
+
+    def process_batch(self, languages, tweets):
+        if self.backend != 'sparse':
+            super().process_batch(languages, tweets)
+            return
+
+        # every sub-model gets the packed windows of the same encoded batch
+        codepoints, indices, tweet_indices = self.trigramModel.extractor.encode_batch(tweets)
+        for model in self.get_sub_models().values():
+            starts = NgramExtractor.get_window_starts(indices, model.ngram_size)
+            ngrams = NgramExtractor.pack_windows(NgramExtractor.get_windows(codepoints, starts, model.ngram_size))
+            for language, language_ngrams in self.group_by_language(languages, tweet_indices[starts], ngrams):
+                model.add_ngrams(language, language_ngrams)
 
-    def train(self):
-        self.unigramModel.train()
-        self.bigramModel.train()
-        self.trigramModel.train()
+    def get_language_score_of_tweet(self, language, tweet):
+        return self.score_all_languages(tweet)[language]
+
+    def score_all_languages(self, tweet):
+        return dict(zip(self.languages, self.get_score_vector(tweet).tolist()))
+
+    def get_score_vector(self, tweet):
+        first_chars = np.array([NgramExtractor.pack(tweet[0])])
+        first_bigram = np.array([NgramExtractor.pack(tweet[0:2])])
+        return self.log_prior_vector + self.get_conditional_log_probabilities(1, first_chars)[0] + \
+            self.get_conditional_log_probabilities(2, first_bigram)[0] + \
+            self.get_conditional_log_probabilities(3, self.parse_tweet(tweet)).sum(axis=0)
+
+    def score_matrix(self, tweets, top1=False):
+        # the three tables of the model do not share rows, so every language is scored fully even with top1
+        with Stats.stage('score'):
+            scores = np.array([self.get_score_vector(tweet) for tweet in tweets]).reshape(len(tweets),
+                                                                                           len(self.languages))
+        if Stats.enabled:
+            Stats.count('scored_tweets', len(tweets))
+        return scores
+
+    def get_ngram_total(self, language):
+        return self.trigramModel.get_ngram_total(language)
+
+    def get_conditional_log_probabilities(self, ngram_size, ngrams, tables=None):
+        # (ngrams, languages) log10 probabilities of the last char of every ngram of the given size given the chars
+        # before it, read from the given frozen tables, or the model's own once it is frozen, where they have one for
+        # the ngram size. The first char of a tweet is scored by its unigram probability
+        if tables is None:
+            tables = self.conditional_tables if self.frozen else dict()
+        if ngram_size == 1:
+            if self.unigramModel.frozen:
+                return self.unigramModel.log_probability_table[self.unigramModel.get_ngram_rows(ngrams)]
+            return self.unigramModel.get_ngram_log_probabilities(ngrams, self.unigramModel.get_frequency_rows(ngrams))
+
+        lower_log_probabilities = self.get_conditional_log_probabilities(
+            ngram_size - 1, BYOMTrainingModel.get_suffixes(ngrams, ngram_size), tables)
+        if ngram_size in tables:
+            return tables[ngram_size].get_log_probabilities(ngrams, lower_log_probabilities)
+        return self.interpolate(ngram_size, ngrams, self.get_sub_model(ngram_size).get_frequency_rows(ngrams),
+                                lower_log_probabilities)
+
+    def interpolate(self, ngram_size, ngrams, frequencies, lower_log_probabilities):
+        if ngram_size not in self.context_statistics:
+            self.context_statistics[ngram_size] = BYOMTrainingModel.get_context_statistics(
+                *self.get_sub_model(ngram_size).get_ngram_counts())
+        context_keys, context_totals, context_types = self.context_statistics[ngram_size]
+        rows = TrainingModel.lookup_rows(context_keys, ngrams >> CODEPOINT_BITS, len(context_keys))
+        return BYOMTrainingModel.get_interpolated_log_probabilities(frequencies, context_totals[rows],
+                                                                    context_types[rows], lower_log_probabilities)
+
+    @staticmethod
+    def get_interpolated_log_probabilities(frequencies, context_totals, context_types, lower_log_probabilities):
+        # Witten-Bell interpolation of the ngrams' counts with the probabilities of their last chars given one char
+        # less: (count + types * lower probability) / (context total + types), where types is the number of distinct
+        # chars seen after the context. The probabilities after a context are then normalised however often it was
+        # seen, and an unseen context just takes the lower order probabilities
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_probabilities = np.log10(frequencies + context_types * 10 ** lower_log_probabilities) - \
+                np.log10(context_totals + context_types)
+        return np.where(context_totals > 0, log_probabilities, lower_log_probabilities)
+
+    @staticmethod
+    def get_log_weights(context_totals, context_types):
+        # log10 of the share of the probability after every context that goes to the chars never seen after it, 0
+        # for an unseen context
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(context_totals > 0, np.log10(context_types) - np.log10(context_totals + context_types), 0)
+
+    @staticmethod
+    def get_context_statistics(ngram_keys, counts):
+        # the sorted contexts of the given sorted ngrams, with the (contexts, languages) number of ngrams and of
+        # distinct ngrams seen after each of them, and a last row of zeros for an unseen context
+        context_keys, starts = np.unique(ngram_keys >> CODEPOINT_BITS, return_index=True)
+        lengths = np.diff(np.append(starts, len(ngram_keys)))
+        context_totals = np.concatenate([TrainingModel.sum_segments(counts.astype(float), lengths),
+                                         np.zeros((1, counts.shape[1]))])
+        context_types = np.concatenate([TrainingModel.sum_segments((counts > 0).astype(float), lengths),
+                                        np.zeros((1, counts.shape[1]))])
+        return context_keys, context_totals, context_types
+
+    @staticmethod
+    def get_suffixes(ngrams, ngram_size):
+        # the packed ids of the ngrams without their first char
+        return ngrams & ((1 << (CODEPOINT_BITS * (ngram_size - 1))) - 1)
+
+    def get_ngram_frequency(self, ngram, language):
+        return self.trigramModel.get_ngram_frequency(ngram, language)
+
+    def get_seen_ngrams(self, language):
+        return self.trigramModel.get_seen_ngrams(language)
+
+    def get_ngram_counts(self):
+        return self.trigramModel.get_ngram_counts()
+
+    def get_ngram_log_probabilities(self, ngram_keys, counts):
+        # probabilities of the trigrams given their first two chars, like the model scores them
+        bigrams = BYOMTrainingModel.get_suffixes(ngram_keys, 3)
+        return self.interpolate(3, ngram_keys, counts, self.get_conditional_log_probabilities(2, bigrams))
+
+    def get_ngram_probability(self, ngram, language):
+        return 10 ** self.get_conditional_log_probabilities(3, np.array([ngram]))[0, self.language_indices[language]]
+
+
+class ConditionalLogProbabilityTable:
+    # rows for every seen ngram, with its log10 probability given the chars before it, and for every seen context, with
+    # the log10 weight the lower order probability of an ngram never seen after it gets, then a last one of zeros for
+    # an unseen context
+    def __init__(self, ngram_keys, table, context_keys, weights):
+        for array in (ngram_keys, table, context_keys, weights):
+            array.flags.writeable = False
+        self.ngram_keys = ngram_keys
+        self.table = table
+        self.context_keys = context_keys
+        self.weights = weights
+
+    def get_log_probabilities(self, ngrams, lower_log_probabilities):
+        # lower_log_probabilities are the (ngrams, languages) log10 probabilities of the ngrams without their first char
+        rows = TrainingModel.lookup_rows(self.ngram_keys, ngrams, -1)
+        seen = rows >= 0
+        context_rows = TrainingModel.lookup_rows(self.context_keys, ngrams >> CODEPOINT_BITS, len(self.context_keys))
+        log_probabilities = self.weights[context_rows] + lower_log_probabilities
+        log_probabilities[seen] = self.table[rows[seen]]
+        return log_probabilities
+
+
+class DenseTrainingModel(TrainingModel):
+    model_type = 'dense'
+    backend = 'dense'
+
+    # Keeps the counts of every language in one (languages, V^n) array where an ngram is identified by its symbols'
+    # vocabulary indices read as a base V number. Only practical for the small alphabet vocabularies.
+    def __init__(self, vocabulary, ngram_size, smoothing_value, training_file):
+        DenseTrainingModel.check_size(vocabulary, ngram_size)
+
+        super().__init__(vocabulary, smoothing_value, training_file)
+        self.ngram_size = ngram_size
+        self.extractor = NgramExtractor(vocabulary, ngram_size)
+
+        self.counts = np.zeros((0, self.vocabulary_size ** ngram_size), dtype=np.int64)
+        self.total_counts = np.zeros(0, dtype=np.int64)
+        self.pending_ngrams = dict()
+
+    @staticmethod
+    def check_size(vocabulary, ngram_size):
+        # checked before a count array is allocated, so that a vocabulary and ngram size with too many possible ngrams
+        # fail with the reason rather than with a MemoryError
+        if isinstance(vocabulary, IsAlphaChars):
+            raise ValueError('the dense backend only supports vocabularies 0 and 1, use the sparse or trie backend')
+        ngram_count = vocabulary.get_size() ** ngram_size
+        if ngram_count > DENSE_MAX_NGRAMS:
+            raise ValueError('the dense backend would keep {}^{} = {} counts per language, more than its limit of {}, '
+                             'use the sparse or trie backend'.format(vocabulary.get_size(), ngram_size, ngram_count,
+                                                                     DENSE_MAX_NGRAMS))
+
+    def add_language(self, language):
+        # its row of counts is added by the next flush, along with those of the other new languages
+        super().add_language(language)
+        self.pending_ngrams[language] = []
+
+    def flush_pending_ngrams(self):
+        new_languages = len(self.languages) - self.counts.shape[0]
+        if new_languages or any(self.pending_ngrams.values()):
+            # counted into a new array, since a frozen model's frequency table is a view of the current one
+            counts = np.concatenate([self.counts, np.zeros((new_languages, self.counts.shape[1]), dtype=np.int64)])
+            for language, pending in self.pending_ngrams.items():
+                if pending:
+                    ngrams = np.concatenate(pending)
+                    counts[self.language_indices[language]] += np.bincount(ngrams, minlength=counts.shape[1])
+                    pending.clear()
+            self.counts = counts
+        self.total_counts = self.counts.sum(axis=1)
+
+    def parse_tweet(self, tweet):
+        return self.extractor.extract_indices(tweet)
 
     def process_tweet(self, language, tweet):
-        self.unigramModel.process_tweet(language, tweet)
-        self.bigramModel.process_tweet(language, tweet)
-        self.trigramModel.process_tweet(language, tweet)
-
-        for bigram in self.bigramModel.parse_tweet(tweet):
-            codepoint1 = ord(bigram[0])
-            try:
-                self.ngram_frequencies[language][codepoint1]['total_count'] += 1
-            except KeyError:
-                self.ngram_frequencies[language][codepoint1]['total_count'] = 1
-
-        for trigram in self.trigramModel.parse_tweet(tweet):
-            codepoint1 = ord(trigram[0])
-            codepoint2 = ord(trigram[1])
-            try:
-                self.ngram_frequencies[language][codepoint1][codepoint2]['total_count'] += 1
-            except KeyError:
-                self.ngram_frequencies[language][codepoint1][codepoint2]['total_count'] = 1
+        # counted in bulk by flush_pending_ngrams once the whole file has been read
+        self.pending_ngrams[language].append(self.parse_tweet(tweet))
+
+    def process_batch(self, languages, tweets):
+        ngrams, tweet_indices = self.extractor.extract_indices_batch(tweets)
+        for language, language_ngrams in self.group_by_language(languages, tweet_indices, ngrams):
+            self.pending_ngrams[language].append(language_ngrams)
+
+    def get_ngram_frequency(self, ngram, language):
+        return self.counts[self.language_indices[language], ngram]
+
+    def get_ngram_total(self, language):
+        return self.total_counts[self.language_indices[language]]
+
+    def prepare_scoring(self):
+        # anything buffered by process_tweet has to be counted before the totals are read
+        self.flush_pending_ngrams()
+        super().prepare_scoring()
+
+    def freeze(self):
+        # every ngram already has its own row, so the table is just the counts turned into log10 probabilities
+        self.frequency_table = self.counts.T
+        self.build_log_probability_table()
+        self.frozen = True
+
+    def refresh_frozen_tables(self, tweets):
+        # every ngram has a row already
+        self.frequency_table = self.counts.T
+        self.build_log_probability_table()
+
+    def get_ngram_rows(self, ngrams):
+        return ngrams
 
     def get_language_score_of_tweet(self, language, tweet):
-        score = log10(self.get_probability_of_language(language))
-        p_first_char = self.unigramModel.get_ngram_probability(tweet[0], language)
-        if p_first_char == 0:
-            return float('-inf')
-        score += log10(p_first_char)
-
-        p_first_two_chars_given_first_char = self.get_conditional_bigram_probability(tweet[0:2], language)
-        if p_first_two_chars_given_first_char == 0:
-            return float('-inf')
-        score += log10(p_first_two_chars_given_first_char)
-
-        for ngram in self.parse_tweet(tweet):
-            probability = self.get_conditional_trigram_probability(ngram, language)
-            if probability == 0:
-                return float('-inf')
-            score += log10(probability)
-        return score
+        return self.score_all_languages(tweet)[language]
+
+    def score_all_languages(self, tweet):
+        if self.frozen:
+            return super().score_all_languages(tweet)
+
+        ngrams = self.parse_tweet(tweet)
+        if len(ngrams) == 0:
+            return dict(self.log_priors)
+
+        with np.errstate(divide='ignore'):
+            log_frequencies = np.log10(self.counts[:, ngrams] + self.smoothing_value).sum(axis=1)
+        scores = self.log_prior_vector + log_frequencies - len(ngrams) * self.log_denominator_vector
+        return dict(zip(self.languages, scores.tolist()))
+
+    def get_seen_ngrams(self, language):
+        return np.flatnonzero(self.counts[self.language_indices[language]])
+
+    def get_ngram_counts(self):
+        ngram_keys = np.flatnonzero(self.counts.any(axis=0))
+        return ngram_keys, self.counts[:, ngram_keys].T
+
+    def decode_ngram(self, ngram):
+        return self.extractor.decode_index(ngram)
+
+    def pack_ngram_keys(self, ngram_keys):
+        # the vocabulary indices are in the order of the codepoints, so the packed ids stay sorted
+        windows = np.zeros((len(ngram_keys), self.ngram_size), dtype=np.int64)
+        for position in range(self.ngram_size - 1, -1, -1):
+            ngram_keys, indices = np.divmod(ngram_keys, self.vocabulary_size)
+            windows[:, position] = self.extractor.codepoints[indices]
+        return NgramExtractor.pack_windows(windows)
+
+    def merge_counts(self, other):
+        self.flush_pending_ngrams()
+        other.flush_pending_ngrams()
+        counts = self.counts.copy()
+        counts[[self.language_indices[language] for language in other.languages]] += other.counts
+        self.counts = counts
+
+    def subtract_counts(self, other):
+        self.flush_pending_ngrams()
+        other.flush_pending_ngrams()
+        counts = self.counts.copy()
+        counts[[self.language_indices[language] for language in other.languages]] -= other.counts
+        self.counts = counts
+
+    def get_count_arrays(self):
+        self.flush_pending_ngrams()
+        return {'counts': self.counts}
+
+    def set_count_arrays(self, arrays):
+        shape = (len(self.languages), self.counts.shape[1])
+        if arrays['counts'].shape != shape:
+            raise ValueError('expected dense counts of shape {}'.format(shape))
+        self.counts = arrays['counts']
+
+
+class SparseTrainingModel(TrainingModel):
+    model_type = 'sparse'
+    backend = 'sparse'
+
+    # Keeps, for every language, the packed ids of the ngrams it was seen with in a sorted array next to an array of
+    # their counts, so that an ngram costs 12 bytes per language it was seen in whatever the size of the vocabulary
+    def __init__(self, vocabulary, ngram_size, smoothing_value, training_file):
+        super().__init__(vocabulary, smoothing_value, training_file)
+        self.ngram_size = ngram_size
+        self.extractor = NgramExtractor(vocabulary, ngram_size)
+
+        self.keys = []
+        self.counts = []
+        self.total_counts = np.zeros(0, dtype=np.int64)
+        self.pending_ngrams = dict()
+        self.pending_count = 0
+
+    def add_language(self, language):
+        super().add_language(language)
+        self.keys.append(np.zeros(0, dtype=np.int64))
+        self.counts.append(np.zeros(0, dtype=np.uint32))
+        self.total_counts = np.append(self.total_counts, 0)
+        self.pending_ngrams[language] = []
+
+    def add_ngrams(self, language, ngrams):
+        # buffered and counted in bulk by flush_pending_ngrams
+        self.pending_ngrams[language].append(ngrams)
+        self.pending_count += len(ngrams)
+        if self.pending_count >= SPARSE_FLUSH_SIZE:
+            self.flush_pending_ngrams()
+
+    def flush_pending_ngrams(self):
+        for language, pending in self.pending_ngrams.items():
+            if pending:
+                keys, counts = np.unique(np.concatenate(pending), return_counts=True)
+                self.add_counts(self.language_indices[language], keys, counts)
+                pending.clear()
+        self.pending_count = 0
+        self.total_counts = np.array([counts.sum(dtype=np.int64) for counts in self.counts], dtype=np.int64)
+
+    def add_counts(self, language_index, keys, counts):
+        # adds the counts of the given sorted keys, which do not have to be in the model yet, to a language
+        merged_keys, positions = TrainingModel.insert_keys(self.keys[language_index], keys)
+        merged_counts = np.zeros(len(merged_keys), dtype=np.int64)
+        merged_counts[positions] = self.counts[language_index]
+        merged_counts[np.searchsorted(merged_keys, keys)] += counts
+        self.keys[language_index] = merged_keys
+        # the counts are kept in 32 bits unless one of them outgrows it
+        if merged_counts.max(initial=0) <= np.iinfo(np.uint32).max:
+            merged_counts = merged_counts.astype(np.uint32)
+        self.counts[language_index] = merged_counts
 
-    def get_conditional_bigram_probability(self, bigram, language):
-        codepoint1 = ord(bigram[0])
-        codepoint2 = ord(bigram[1])
+    @staticmethod
+    def gather_counts(keys, counts, ngrams):
+        # (ngrams, languages) counts of the given ngrams from the sorted keys and counts of every language, 0 for the
+        # ones a language does not have
+        frequencies = np.zeros((len(ngrams), len(keys)))
+        for language_index, (language_keys, language_counts) in enumerate(zip(keys, counts)):
+            rows = TrainingModel.lookup_rows(language_keys, ngrams, -1)
+            found = rows >= 0
+            frequencies[found, language_index] = language_counts[rows[found]]
+        return frequencies
 
-        freq_bigram = self.smoothing_value
-        try:
-            freq_bigram += self.bigramModel.ngram_frequencies[language][codepoint1][codepoint2]
-        except KeyError:
-            pass
+    def parse_tweet(self, tweet):
+        return self.extractor.extract(tweet)
 
-        freq_first_char_bigram = self.smoothing_value * (self.vocabulary_size ** 2)
-        try:
-            freq_first_char_bigram += self.trigramModel.ngram_frequencies[language][codepoint1]['total_count']
-        except KeyError:
-            pass
+    def process_tweet(self, language, tweet):
+        self.add_ngrams(language, self.parse_tweet(tweet))
 
-        return freq_bigram / freq_first_char_bigram if freq_first_char_bigram != 0 else 0
+    def process_batch(self, languages, tweets):
+        ngrams, tweet_indices = self.extractor.extract_batch(tweets)
+        for language, language_ngrams in self.group_by_language(languages, tweet_indices, ngrams):
+            self.add_ngrams(language, language_ngrams)
 
-    def get_conditional_trigram_probability(self, trigram, language):
-        codepoint1 = ord(trigram[0])
-        codepoint2 = ord(trigram[1])
-        codepoint3 = ord(trigram[2])
+    def get_ngram_frequency(self, ngram, language):
+        keys = self.keys[self.language_indices[language]]
+        row = np.searchsorted(keys, ngram)
+        if row < len(keys) and keys[row] == ngram:
+            return int(self.counts[self.language_indices[language]][row])
+        return 0
 
-        freq_trigram = self.smoothing_value
+    def get_frequency_rows(self, ngrams):
+        return SparseTrainingModel.gather_counts(self.keys, self.counts, ngrams)
 
-        try:
-            freq_trigram += self.trigramModel.ngram_frequencies[language][codepoint1][codepoint2][codepoint3]
-        except KeyError:
-            pass
+    def get_ngram_total(self, language):
+        return self.total_counts[self.language_indices[language]]
 
-        freq_first_two_char_trigram = self.smoothing_value * (self.vocabulary_size ** 3)
-        try:
-            freq_first_two_char_trigram += self.trigramModel.ngram_frequencies[language][codepoint1][codepoint2][
-                'total_count']
-        except KeyError:
-            pass
+    def prepare_scoring(self):
+        # anything buffered by process_tweet has to be counted before the totals are read
+        self.flush_pending_ngrams()
+        super().prepare_scoring()
 
-        return freq_trigram / freq_first_two_char_trigram if freq_first_two_char_trigram != 0 else 0
+    def get_language_score_of_tweet(self, language, tweet):
+        return self.score_all_languages(tweet)[language]
+
+    def score_all_languages(self, tweet):
+        if self.frozen:
+            return super().score_all_languages(tweet)
+
+        ngrams = self.parse_tweet(tweet)
+        if len(ngrams) == 0:
+            return dict(self.log_priors)
+
+        with np.errstate(divide='ignore'):
+            log_frequencies = np.log10(self.get_frequency_rows(ngrams) + self.smoothing_value).sum(axis=0)
+        scores = self.log_prior_vector + log_frequencies - len(ngrams) * self.log_denominator_vector
+        return dict(zip(self.languages, scores.tolist()))
+
+    def get_seen_ngrams(self, language):
+        language_index = self.language_indices[language]
+        return self.keys[language_index][self.counts[language_index] > 0]
+
+    def get_all_seen_ngrams(self):
+        return np.unique(np.concatenate([np.zeros(0, dtype=np.int64)] +
+                                        [self.get_seen_ngrams(language) for language in self.languages]))
+
+    def get_ngram_counts(self):
+        ngram_keys = self.get_all_seen_ngrams()
+        return ngram_keys, self.get_frequency_rows(ngram_keys).astype(np.int64)
+
+    def merge_counts(self, other):
+        self.flush_pending_ngrams()
+        other.flush_pending_ngrams()
+        for language, keys, counts in zip(other.languages, other.keys, other.counts):
+            self.add_counts(self.language_indices[language], keys, counts)
+
+    def subtract_counts(self, other):
+        # the ngrams left with no count are dropped
+        self.flush_pending_ngrams()
+        other.flush_pending_ngrams()
+        for language, keys, counts in zip(other.languages, other.keys, other.counts):
+            language_index = self.language_indices[language]
+            self.add_counts(language_index, keys, -counts.astype(np.int64))
+            kept = self.counts[language_index] > 0
+            self.keys[language_index] = self.keys[language_index][kept]
+            self.counts[language_index] = self.counts[language_index][kept]
+
+    def get_count_arrays(self):
+        # the arrays of every language one after the other
+        self.flush_pending_ngrams()
+        return {'keys': np.concatenate(self.keys), 'counts': np.concatenate(self.counts),
+                'lengths': np.array([len(keys) for keys in self.keys], dtype=np.int64)}
+
+    def set_count_arrays(self, arrays):
+        lengths = arrays['lengths']
+        if len(lengths) != len(self.languages) or lengths.sum() != len(arrays['keys']) or \
+                len(arrays['counts']) != len(arrays['keys']):
+            raise ValueError('expected sparse keys and counts of every language one after the other')
+        self.keys = np.split(arrays['keys'], np.cumsum(lengths)[:-1])
+        self.counts = np.split(arrays['counts'], np.cumsum(lengths)[:-1])
+
+
+class SketchTrainingModel(TrainingModel):
+    model_type = 'sketch'
+    backend = 'sketch'
+
+    # Approximate counts in a fixed amount of memory: every language keeps a count-min sketch of depth rows of width
+    # 32 bit counters, each row indexed by its own hash of the ngram id, plus the exact counts of its heavy_hitters
+    # most frequent ngrams. An ngram's count is its heavy hitter count if it has one, or else the smallest of its
+    # counters, which is never lower than its true count. The sketch is updated conservatively, raising an ngram's
+    # counters only as far as its new estimate, which keeps the estimates of the other ngrams much closer.
+    # Every batch of counts competes with the heavy hitters for their places: an ngram that makes it in starts from
+    # its estimate, and one that is pushed out adds what it gained since then back into the sketch. The sketch cannot
+    # list the ngrams it holds, so a frozen model scores from the sketch instead of a table of every seen ngram
+    def __init__(self, vocabulary, ngram_size, smoothing_value, training_file, sketch_width=DEFAULT_SKETCH_WIDTH,
+                 sketch_depth=DEFAULT_SKETCH_DEPTH, heavy_hitter_count=DEFAULT_HEAVY_HITTER_COUNT):
+        if sketch_width <= 0 or sketch_width & (sketch_width - 1):
+            raise ValueError('the sketch width must be a power of 2')
 
-    def get_ngram_probability(self, ngram, language):
-        return self.get_conditional_trigram_probability(ngram, language)
+        super().__init__(vocabulary, smoothing_value, training_file)
+        self.ngram_size = ngram_size
+        self.extractor = NgramExtractor(vocabulary, ngram_size)
+        self.sketch_width = sketch_width
+        self.sketch_depth = sketch_depth
+        self.heavy_hitter_count = heavy_hitter_count
+        self.hash_multipliers, self.hash_increments = SketchTrainingModel.get_hash_parameters(sketch_depth)
+
+        self.sketches = []
+        self.heavy_keys = []
+        self.heavy_counts = []
+        # the estimate a heavy hitter started from, which its sketch counters already account for
+        self.heavy_bases = []
+        self.total_counts = np.zeros(0, dtype=np.int64)
+        self.pending_ngrams = dict()
+        self.pending_count = 0
 
-    def get_probability_of_language(self, language):
-        return self.unigramModel.get_probability_of_language(language)
+    @staticmethod
+    def get_hash_parameters(depth):
+        # one multiply-add-shift hash per row, the same for every sketch of the same depth
+        parameters = np.random.default_rng(SKETCH_SEED).integers(0, 1 << 63, size=(2, depth), dtype=np.int64)
+        multipliers = parameters[0].astype(np.uint64) * np.uint64(2) + np.uint64(1)
+        return multipliers[:, np.newaxis], parameters[1].astype(np.uint64)[:, np.newaxis]
+
+    def add_language(self, language):
+        super().add_language(language)
+        self.sketches.append(np.zeros((self.sketch_depth, self.sketch_width), dtype=np.uint32))
+        self.heavy_keys.append(np.zeros(0, dtype=np.int64))
+        self.heavy_counts.append(np.zeros(0, dtype=np.int64))
+        self.heavy_bases.append(np.zeros(0, dtype=np.int64))
+        self.total_counts = np.append(self.total_counts, 0)
+        self.pending_ngrams[language] = []
+
+    def get_buckets(self, ngrams):
+        # (depth, ngrams) counter of every ngram in every row
+        with np.errstate(over='ignore'):
+            hashes = ngrams.astype(np.uint64) * self.hash_multipliers + self.hash_increments
+        shift = np.uint64(64 - (self.sketch_width.bit_length() - 1))
+        return (hashes >> shift).astype(np.intp) if self.sketch_width > 1 else np.zeros(hashes.shape, dtype=np.intp)
+
+    def get_estimates(self, sketch, buckets):
+        return sketch[np.arange(self.sketch_depth)[:, np.newaxis], buckets].min(axis=0).astype(np.int64)
+
+    def add_to_sketch(self, sketch, keys, counts):
+        # the conservative update of a copy of the sketch, since a snapshot may share the current one
+        buckets = self.get_buckets(keys)
+        rows = np.broadcast_to(np.arange(self.sketch_depth)[:, np.newaxis], buckets.shape)
+        estimates = np.minimum(self.get_estimates(sketch, buckets) + counts, np.iinfo(np.uint32).max)
+        sketch = sketch.copy()
+        np.maximum.at(sketch, (rows, buckets), np.broadcast_to(estimates.astype(np.uint32), buckets.shape))
+        return sketch
+
+    def add_ngrams(self, language, ngrams):
+        # buffered and counted in bulk by flush_pending_ngrams
+        self.pending_ngrams[language].append(ngrams)
+        self.pending_count += len(ngrams)
+        if self.pending_count >= SPARSE_FLUSH_SIZE:
+            self.flush_pending_ngrams()
+
+    def flush_pending_ngrams(self):
+        for language, pending in self.pending_ngrams.items():
+            if pending:
+                keys, counts = np.unique(np.concatenate(pending), return_counts=True)
+                self.add_counts(self.language_indices[language], keys, counts)
+                pending.clear()
+        self.pending_count = 0
+
+    def add_counts(self, language_index, keys, counts):
+        # adds the counts of the given sorted keys to a language, exactly for the heavy hitters and to the sketch for
+        # the others
+        self.total_counts = self.total_counts.copy()
+        self.total_counts[language_index] += counts.sum(dtype=np.int64)
+        sketch = self.sketches[language_index]
+        heavy_keys = self.heavy_keys[language_index]
+        heavy_counts = self.heavy_counts[language_index].copy()
+
+        rows = TrainingModel.lookup_rows(heavy_keys, keys, -1)
+        found = rows >= 0
+        heavy_counts[rows[found]] += counts[found]
+        keys = keys[~found]
+        counts = counts[~found]
+        estimates = self.get_estimates(sketch, self.get_buckets(keys))
+
+        candidate_keys = np.concatenate([heavy_keys, keys])
+        candidate_counts = np.concatenate([heavy_counts, estimates + counts])
+        candidate_bases = np.concatenate([self.heavy_bases[language_index], estimates])
+        kept = np.ones(len(candidate_keys), dtype=bool)
+        if len(candidate_keys) > self.heavy_hitter_count:
+            kept[:] = False
+            kept[np.argpartition(-candidate_counts, self.heavy_hitter_count - 1)[:self.heavy_hitter_count]] = True
+
+        dropped = ~kept & (candidate_counts > candidate_bases)
+        if dropped.any():
+            self.sketches[language_index] = self.add_to_sketch(sketch, candidate_keys[dropped],
+                                                               (candidate_counts - candidate_bases)[dropped])
+        order = np.argsort(candidate_keys[kept])
+        self.heavy_keys[language_index] = candidate_keys[kept][order]
+        self.heavy_counts[language_index] = candidate_counts[kept][order]
+        self.heavy_bases[language_index] = candidate_bases[kept][order]
 
-    def get_ten_most_frequent_ngrams(self):
-        return self.trigramModel.get_ten_most_frequent_ngrams()
+    def parse_tweet(self, tweet):
+        return self.extractor.extract(tweet)
+
+    def process_tweet(self, language, tweet):
+        self.add_ngrams(language, self.parse_tweet(tweet))
+
+    def process_batch(self, languages, tweets):
+        ngrams, tweet_indices = self.extractor.extract_batch(tweets)
+        for language, language_ngrams in self.group_by_language(languages, tweet_indices, ngrams):
+            self.add_ngrams(language, language_ngrams)
+
+    def get_ngram_frequency(self, ngram, language):
+        return int(self.get_frequency_rows(np.array([ngram], dtype=np.int64))[0, self.language_indices[language]])
+
+    def get_frequency_rows(self, ngrams):
+        frequencies = np.zeros((len(ngrams), len(self.languages)))
+        if len(ngrams) == 0 or len(self.languages) == 0:
+            return frequencies
+
+        buckets = self.get_buckets(ngrams)
+        for language_index, sketch in enumerate(self.sketches):
+            frequencies[:, language_index] = self.get_estimates(sketch, buckets)
+            rows = TrainingModel.lookup_rows(self.heavy_keys[language_index], ngrams, -1)
+            found = rows >= 0
+            frequencies[found, language_index] = self.heavy_counts[language_index][rows[found]]
+        return frequencies
+
+    def get_ngram_total(self, language):
+        return self.total_counts[self.language_indices[language]]
+
+    def prepare_scoring(self):
+        # anything buffered by process_tweet has to be counted before the totals are read
+        self.flush_pending_ngrams()
+        super().prepare_scoring()
+
+    def freeze(self):
+        # there is no table to build, a frozen model only stops training
+        self.frozen = True
+
+    def refresh_frozen_tables(self, tweets):
+        pass
+
+    def build_log_probability_table(self):
+        pass
+
+    def snapshot(self):
+        # a frozen model scores from the sketches, whose arrays partial_fit replaces in the lists
+        with UPDATE_LOCK:
+            snapshot = super().snapshot()
+            snapshot.sketches = list(self.sketches)
+            snapshot.heavy_keys = list(self.heavy_keys)
+            snapshot.heavy_counts = list(self.heavy_counts)
+            snapshot.heavy_bases = list(self.heavy_bases)
+        return snapshot
+
+    def get_language_score_of_tweet(self, language, tweet):
+        return self.score_all_languages(tweet)[language]
+
+    def score_all_languages(self, tweet):
+        return dict(zip(self.languages, self.score_matrix([tweet])[0].tolist()))
+
+    def score_matrix(self, tweets, top1=False):
+        # every language is scored fully, even with top1, from the counts of the distinct ngrams of the batch
+        with Stats.stage('parse_tweet'):
+            ngrams = [self.parse_tweet(tweet) for tweet in tweets]
+        with Stats.stage('score'):
+            lengths = np.array([len(tweet_ngrams) for tweet_ngrams in ngrams], dtype=np.int64)
+            batch_ngrams, inverse = np.unique(np.concatenate([np.zeros(0, dtype=np.int64)] + ngrams),
+                                              return_inverse=True)
+            log_probabilities = self.get_ngram_log_probabilities(batch_ngrams, self.get_frequency_rows(batch_ngrams))
+            scores = self.log_prior_vector + TrainingModel.sum_segments(log_probabilities[inverse], lengths)
+        if Stats.enabled:
+            Stats.count('scored_tweets', len(tweets))
+            Stats.count('scored_ngrams', lengths.sum())
+        return scores.reshape(len(tweets), len(self.languages))
+
+    def get_seen_ngrams(self, language):
+        # only the heavy hitters are known by their ids
+        return self.heavy_keys[self.language_indices[language]]
+
+    def get_all_seen_ngrams(self):
+        return np.unique(np.concatenate([np.zeros(0, dtype=np.int64)] + self.heavy_keys))
+
+    def get_ngram_counts(self):
+        ngram_keys = self.get_all_seen_ngrams()
+        return ngram_keys, self.get_frequency_rows(ngram_keys).astype(np.int64)
+
+    def merge_counts(self, other):
+        if (other.sketch_depth, other.sketch_width) != (self.sketch_depth, self.sketch_width):
+            raise ValueError('can only merge sketches of the same width and depth')
+
+        self.flush_pending_ngrams()
+        other.flush_pending_ngrams()
+        for language in other.languages:
+            language_index = self.language_indices[language]
+            other_index = other.language_indices[language]
+            total_count = self.total_counts[language_index] + other.total_counts[other_index]
+            # the counts in the other sketch, including what the other heavy hitters started from, add up with these
+            merged_sketch = self.sketches[language_index].astype(np.int64) + other.sketches[other_index]
+            self.sketches[language_index] = np.minimum(merged_sketch, np.iinfo(np.uint32).max).astype(np.uint32)
+
+            # the heavy hitters of this model take the other model's counts of their ngrams as they are
+            heavy_keys = self.heavy_keys[language_index]
+            other_counts, other_bases = other.get_language_counts(other_index, heavy_keys)
+            self.heavy_counts[language_index] = self.heavy_counts[language_index] + other_counts
+            self.heavy_bases[language_index] = self.heavy_bases[language_index] + other_bases
+
+            # and those of the other model only bring what they gained since they started
+            keys = other.heavy_keys[other_index]
+            new = TrainingModel.lookup_rows(heavy_keys, keys, -1) < 0
+            self.add_counts(language_index, keys[new], (other.heavy_counts[other_index] -
+                                                        other.heavy_bases[other_index])[new])
+            self.total_counts[language_index] = total_count
+
+    def subtract_counts(self, other):
+        raise ValueError('the counts of a sketch cannot be subtracted, since conservative updates do not add up')
+
+    def get_language_counts(self, language_index, ngrams):
+        # the counts of the given ngrams in a language, with the part of them held by the sketch
+        counts = self.get_estimates(self.sketches[language_index], self.get_buckets(ngrams))
+        bases = counts.copy()
+        rows = TrainingModel.lookup_rows(self.heavy_keys[language_index], ngrams, -1)
+        found = rows >= 0
+        counts[found] = self.heavy_counts[language_index][rows[found]]
+        bases[found] = self.heavy_bases[language_index][rows[found]]
+        return counts, bases
+
+    def get_count_arrays(self):
+        # the heavy hitters of every language one after the other
+        self.flush_pending_ngrams()
+        return {'sketches': np.array(self.sketches, dtype=np.uint32).reshape(len(self.languages), self.sketch_depth,
+                                                                              self.sketch_width),
+                'heavy_keys': np.concatenate([np.zeros(0, dtype=np.int64)] + self.heavy_keys),
+                'heavy_counts': np.concatenate([np.zeros(0, dtype=np.int64)] + self.heavy_counts),
+                'heavy_bases': np.concatenate([np.zeros(0, dtype=np.int64)] + self.heavy_bases),
+                'lengths': np.array([len(keys) for keys in self.heavy_keys], dtype=np.int64),
+                'total_counts': self.total_counts}
+
+    def set_count_arrays(self, arrays):
+        # the sketches keep the width and depth they were saved with
+        sketches = arrays['sketches']
+        lengths = arrays['lengths']
+        if sketches.ndim != 3 or len(sketches) != len(self.languages) or len(lengths) != len(self.languages) or \
+                lengths.sum() != len(arrays['heavy_keys']) or len(arrays['total_counts']) != len(self.languages):
+            raise ValueError('expected a sketch, heavy hitters and a total count for every language')
+
+        self.sketch_depth, self.sketch_width = sketches.shape[1:]
+        self.hash_multipliers, self.hash_increments = SketchTrainingModel.get_hash_parameters(self.sketch_depth)
+        self.heavy_hitter_count = max(self.heavy_hitter_count, int(lengths.max(initial=0)))
+        self.sketches = list(sketches)
+        self.heavy_keys = np.split(arrays['heavy_keys'], np.cumsum(lengths)[:-1])
+        self.heavy_counts = np.split(arrays['heavy_counts'], np.cumsum(lengths)[:-1])
+        self.heavy_bases = np.split(arrays['heavy_bases'], np.cumsum(lengths)[:-1])
+        self.total_counts = np.array(arrays['total_counts'], dtype=np.int64)
+
+
+class TrieTrainingModel(TrainingModel):
+    model_type = 'trie'
+    backend = 'trie'
+
+    # Keeps the counts in an NgramTrie of depth n, which takes any ngram size with any vocabulary. Packed ids only
+    # hold three codepoints, so an ngram of this model is identified by the index of its node in the trie's last level
+    # instead, which sorts like the packed id would
+    def __init__(self, vocabulary, ngram_size, smoothing_value, training_file):
+        if ngram_size < 1:
+            raise ValueError('the ngram size must be at least 1')
+
+        super().__init__(vocabulary, smoothing_value, training_file)
+        self.ngram_size = ngram_size
+        self.extractor = NgramExtractor(vocabulary, ngram_size)
+        self.trie = NgramTrie(ngram_size)
+        self.total_counts = np.zeros(0, dtype=np.int64)
+        self.pending_codepoints = []
+        self.pending_languages = []
+        self.pending_count = 0
+
+    def add_language(self, language):
+        super().add_language(language)
+        self.trie.add_language()
+        self.total_counts = np.append(self.total_counts, 0)
+
+    def flush_pending_ngrams(self):
+        if self.pending_codepoints:
+            self.trie.add_sequences(np.concatenate(self.pending_codepoints), np.concatenate(self.pending_languages))
+            self.pending_codepoints.clear()
+            self.pending_languages.clear()
+        self.pending_count = 0
+        self.total_counts = self.trie.counts[-1].sum(axis=0)
+
+    def parse_tweet(self, tweet):
+        # (ngrams, n) codepoints of every ngram of the tweet
+        return self.extractor.extract_windows(tweet)
+
+    def process_tweet(self, language, tweet):
+        # buffered and counted in bulk by flush_pending_ngrams, with chars outside the vocabulary as -1 and a -1 after
+        # the tweet so that no ngram runs into the next one
+        codepoints, indices = self.extractor.encode(tweet)
+        self.add_codepoints(np.append(np.where(indices >= 0, codepoints, -1), -1),
+                            np.full(len(codepoints) + 1, self.language_indices[language]))
+
+    def process_batch(self, languages, tweets):
+        # the newline after every tweet of the encoded batch is outside the vocabulary, so it is the -1 after it
+        codepoints, indices, tweet_indices = self.extractor.encode_batch(tweets)
+        language_indices = np.array([self.language_indices[language] for language in languages], dtype=np.int64)
+        self.add_codepoints(np.where(indices >= 0, codepoints, -1), language_indices[tweet_indices])
+
+    def add_codepoints(self, codepoints, languages):
+        self.pending_codepoints.append(codepoints)
+        self.pending_languages.append(languages)
+        self.pending_count += len(codepoints)
+        if self.pending_count >= SPARSE_FLUSH_SIZE:
+            self.flush_pending_ngrams()
+
+    def get_ngram_frequency(self, ngram, language):
+        return int(self.trie.counts[-1][ngram, self.language_indices[language]])
+
+    def get_ngram_total(self, language):
+        return self.total_counts[self.language_indices[language]]
+
+    def prepare_scoring(self):
+        # anything buffered by process_tweet has to be counted before the totals are read
+        self.flush_pending_ngrams()
+        super().prepare_scoring()
+
+    def refresh_frozen_tables(self, tweets):
+        # the nodes of the new ngrams move the ones after them, so the tables are built again
+        self.freeze()
+
+    def snapshot(self):
+        # a frozen model finds the rows of its ngrams in the trie, whose arrays partial_fit replaces in the lists
+        with UPDATE_LOCK:
+            snapshot = super().snapshot()
+            snapshot.trie = self.trie.copy()
+        return snapshot
+
+    def get_ngram_rows(self, ngrams):
+        return self.get_ngram_rows_of_tweets([ngrams])[0]
+
+    def get_ngram_rows_of_tweets(self, tweet_ngrams):
+        # the ngrams of every tweet are found in one traversal of the trie
+        lengths = [len(ngrams) for ngrams in tweet_ngrams]
+        windows = np.concatenate([np.zeros((0, self.ngram_size), dtype=np.int64)] + tweet_ngrams)
+        nodes = self.trie.find_paths(windows)[:, -1]
+        rows = np.where(nodes >= 0, nodes, len(self.trie.keys[-1]))
+        return np.split(rows, np.cumsum(lengths)[:-1])
+
+    def get_language_score_of_tweet(self, language, tweet):
+        return self.score_all_languages(tweet)[language]
+
+    def score_all_languages(self, tweet):
+        if self.frozen:
+            return super().score_all_languages(tweet)
+
+        windows = self.parse_tweet(tweet)
+        if len(windows) == 0:
+            return dict(self.log_priors)
+
+        counts = NgramTrie.gather(self.trie.counts[-1], self.trie.find_paths(windows)[:, -1])
+        with np.errstate(divide='ignore'):
+            log_frequencies = np.log10(counts + self.smoothing_value).sum(axis=0)
+        scores = self.log_prior_vector + log_frequencies - len(windows) * self.log_denominator_vector
+        return dict(zip(self.languages, scores.tolist()))
+
+    def get_seen_ngrams(self, language):
+        return np.flatnonzero(self.trie.counts[-1][:, self.language_indices[language]] > 0)
+
+    def get_all_seen_ngrams(self):
+        return np.flatnonzero(self.trie.counts[-1].any(axis=1))
+
+    def get_ngram_counts(self):
+        self.flush_pending_ngrams()
+        return np.arange(len(self.trie.keys[-1])), self.trie.counts[-1]
+
+    def decode_ngram(self, ngram):
+        return ''.join(chr(codepoint) for codepoint in
+                       self.trie.get_windows(self.ngram_size - 1, np.array([ngram]))[0].tolist())
+
+    def pack_ngram_keys(self, ngram_keys):
+        if self.ngram_size > 3:
+            raise ValueError('only ngrams of up to 3 chars have packed ids')
+        return NgramExtractor.pack_windows(self.trie.get_windows(self.ngram_size - 1, ngram_keys))
+
+    def get_language_indices_of(self, other):
+        return [self.language_indices[language] for language in other.languages]
+
+    def merge_counts(self, other):
+        self.flush_pending_ngrams()
+        other.flush_pending_ngrams()
+        self.trie.add_trie(other.trie, self.get_language_indices_of(other))
+
+    def subtract_counts(self, other):
+        # the nodes left with no count are dropped
+        self.flush_pending_ngrams()
+        other.flush_pending_ngrams()
+        self.trie.add_trie(other.trie, self.get_language_indices_of(other), -1)
+        self.trie.prune()
+
+    def get_count_arrays(self):
+        self.flush_pending_ngrams()
+        return self.trie.get_arrays()
+
+    def set_count_arrays(self, arrays):
+        self.trie.set_arrays(arrays)
+
+
+class TrieBYOMTrainingModel(TrieTrainingModel):
+    model_type = 'byom'
+
+    # BYOM of any order n on an NgramTrie of depth n, which holds the counts of every order at once: the first n - 1
+    # chars of a tweet are scored by their probability given the chars before them, and every ngram of the tweet by
+    # the probability of its last char given the n - 1 before it. Each of them is interpolated with the probability
+    # given one char less like in BYOMTrainingModel, down to the unigram probability, so the trie is searched for the
+    # ngram and for every suffix of it. Frozen, every level of the trie gets a table of log10 probabilities with a
+    # row for every node and, from the bigrams on, the log10 weights of the nodes of the level above as contexts, like
+    # a ConditionalLogProbabilityTable
+    def prepare_scoring(self):
+        super().prepare_scoring()
+        self.child_totals = self.trie.get_child_totals()
+        self.child_types = self.trie.get_child_totals(distinct=True)
+
+    def freeze(self):
+        self.log_probability_tables = self.build_log_probability_tables()
+        self.frozen = True
+
+    def build_log_probability_tables(self):
+        # the levels are built from the unigrams up, each reading the probabilities of its nodes' suffixes from the
+        # tables of the levels before it. The unigram table has a last row for an unseen char
+        tables = []
+        for level in range(self.ngram_size):
+            nodes = np.arange(len(self.trie.keys[level]))
+            if level == 0:
+                table = self.get_unigram_log_probabilities(np.append(nodes, -1))
+                weights = None
+            else:
+                suffixes = self.trie.get_windows(level, nodes)[:, 1:]
+                table = BYOMTrainingModel.get_interpolated_log_probabilities(
+                    self.trie.counts[level], self.child_totals[level][self.trie.get_parents(level)],
+                    self.child_types[level][self.trie.get_parents(level)],
+                    self.get_window_log_probabilities(suffixes, tables))
+                weights = np.concatenate([BYOMTrainingModel.get_log_weights(self.child_totals[level],
+                                                                              self.child_types[level]),
+                                          np.zeros((1, len(self.languages)))])
+                weights.flags.writeable = False
+            table.flags.writeable = False
+            tables.append((table, weights))
+        return tables
+
+    def refresh_frozen_tables(self, tweets):
+        self.log_probability_tables = self.build_log_probability_tables()
+
+    def get_unigram_log_probabilities(self, nodes):
+        # (nodes, languages) log10 probabilities of the given unigram nodes, -1 standing for a char not in the trie
+        with np.errstate(divide='ignore'):
+            return np.log10(NgramTrie.gather(self.trie.counts[0], nodes) + self.smoothing_value) - \
+                np.log10(self.child_totals[0][0] + self.smoothing_value * self.vocabulary_size)
+
+    def get_window_log_probabilities(self, windows, tables=None):
+        # (windows, languages) log10 probabilities of the last char of every (windows, size) codepoints given the ones
+        # before it, read from the given frozen tables, or the model's own once it is frozen, where they have one for
+        # the size
+        if tables is None:
+            tables = self.log_probability_tables if self.frozen else []
+        level = windows.shape[1] - 1
+        paths = self.trie.find_paths(windows)
+        nodes = paths[:, level]
+        if level == 0:
+            if tables:
+                return tables[0][0][np.where(nodes >= 0, nodes, len(tables[0][0]) - 1)]
+            return self.get_unigram_log_probabilities(nodes)
+
+        contexts = paths[:, level - 1]
+        lower_log_probabilities = self.get_window_log_probabilities(windows[:, 1:], tables)
+        if level < len(tables):
+            table, weights = tables[level]
+            log_probabilities = weights[np.where(contexts >= 0, contexts, len(weights) - 1)] + lower_log_probabilities
+            found = nodes >= 0
+            log_probabilities[found] = table[nodes[found]]
+            return log_probabilities
+
+        return BYOMTrainingModel.get_interpolated_log_probabilities(
+            NgramTrie.gather(self.trie.counts[level], nodes), NgramTrie.gather(self.child_totals[level], contexts),
+            NgramTrie.gather(self.child_types[level], contexts), lower_log_probabilities)
+
+    def get_ngram_log_probabilities(self, ngram_keys, counts):
+        # probabilities of the ngrams given their first n - 1 chars, like the model scores them
+        level = self.ngram_size - 1
+        if level == 0:
+            return self.get_unigram_log_probabilities(ngram_keys)
+        parents = self.trie.get_parents(level)[ngram_keys]
+        return BYOMTrainingModel.get_interpolated_log_probabilities(
+            counts, self.child_totals[level][parents], self.child_types[level][parents],
+            self.get_window_log_probabilities(self.trie.get_windows(level, ngram_keys)[:, 1:]))
+
+    def get_language_score_of_tweet(self, language, tweet):
+        return self.score_all_languages(tweet)[language]
+
+    def score_all_languages(self, tweet):
+        return dict(zip(self.languages, self.score_matrix([tweet])[0].tolist()))
+
+    def score_matrix(self, tweets, top1=False):
+        # every language is scored fully, even with top1. The first n - 1 chars of a tweet are taken as they are,
+        # those outside the vocabulary or past the end of the tweet (as -1) just never being found in the trie
+        if len(tweets) == 0:
+            return np.zeros((0, len(self.languages)))
+
+        with Stats.stage('parse_tweet'):
+            prefixes = np.full((len(tweets), self.ngram_size - 1), -1, dtype=np.int64)
+            for row, tweet in enumerate(tweets):
+                codepoints = [ord(char) for char in tweet[:self.ngram_size - 1]]
+                prefixes[row, :len(codepoints)] = codepoints
+            ngrams = [self.parse_tweet(tweet) for tweet in tweets]
+        with Stats.stage('score'):
+            lengths = np.array([len(tweet_ngrams) for tweet_ngrams in ngrams], dtype=np.int64)
+            windows = np.concatenate([np.zeros((0, self.ngram_size), dtype=np.int64)] + ngrams)
+            scores = np.repeat(self.log_prior_vector[np.newaxis], len(tweets), axis=0)
+            for level in range(self.ngram_size - 1):
+                scores = scores + self.get_window_log_probabilities(prefixes[:, :level + 1])
+            scores = scores + TrainingModel.sum_segments(self.get_window_log_probabilities(windows), lengths)
+        if Stats.enabled:
+            Stats.count('scored_tweets', len(tweets))
+            Stats.count('scored_ngrams', lengths.sum())
+        return scores
@@ -1,5 +1,12 @@
+import os
+import platform
+import unicodedata
 from abc import ABC, abstractmethod
 
+import numpy as np
+
+MAX_CODEPOINTS = 17 * 2 ** 16
+
 
 class VocabularyFactory:
     @staticmethod
@@ -21,8 +28,22 @@ class Vocabulary(ABC):
     def get_size(self):
         pass
 
+    @abstractmethod
+    def get_codepoints(self):
+        pass
+
+    def get_index_table(self):
+        # maps each codepoint to its index in the sorted vocabulary, or -1 when it is not part of it. The table ends
+        # one past the largest codepoint of the vocabulary so that larger codepoints can be clamped onto that -1
+        codepoints = self.get_codepoints()
+        index_table = np.full(codepoints[-1] + 2, -1, dtype=np.int64)
+        index_table[codepoints] = np.arange(len(codepoints))
+        return index_table
+
 
 class CaseInsensitiveAlphabetChars(Vocabulary):
+    vocabulary_type = '0'
+
     def is_in_vocabulary(self, char):
         codepoint = ord(char)
         return 97 <= codepoint <= 122
@@ -30,8 +51,13 @@ class CaseInsensitiveAlphabetChars(Vocabulary):
     def get_size(self):
         return 26
 
+    def get_codepoints(self):
+        return np.arange(97, 123)
+
 
 class CaseSensitiveAlphabetChars(Vocabulary):
+    vocabulary_type = '1'
+
     def is_in_vocabulary(self, char):
         codepoint = ord(char)
         return 65 <= codepoint <= 90 or 97 <= codepoint <= 122
@@ -39,15 +65,55 @@ class CaseSensitiveAlphabetChars(Vocabulary):
     def get_size(self):
         return 52  # 26*2
 
+    def get_codepoints(self):
+        return np.concatenate([np.arange(65, 91), np.arange(97, 123)])
+
 
 class IsAlphaChars(Vocabulary):
+    vocabulary_type = '2'
+
+    # which codepoints satisfy isalpha() only changes with the Unicode database, so the table is computed once per
+    # process and cached on disk for every later run with the same Python and Unicode versions
+    membership_table = None
+    size = None
+
     def is_in_vocabulary(self, char):
         return char.isalpha()
 
     def get_size(self):
-        count = 0
-        for codepoint in range(17 * 2 ** 16):
-            ch = chr(codepoint)
-            if ch.isalpha():
-                count = count + 1
-        return count
+        if IsAlphaChars.size is None:
+            IsAlphaChars.size = int(IsAlphaChars.get_membership_table().sum())
+        return IsAlphaChars.size
+
+    def get_codepoints(self):
+        return np.flatnonzero(IsAlphaChars.get_membership_table())
+
+    @staticmethod
+    def get_membership_table():
+        if IsAlphaChars.membership_table is None:
+            IsAlphaChars.membership_table = IsAlphaChars.load_membership_table()
+        return IsAlphaChars.membership_table
+
+    @staticmethod
+    def load_membership_table():
+        cache_file = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser(os.path.join('~', '.cache'))),
+                                  'comp472-nlp', 'isalpha_{}_{}.npy'.format(platform.python_version(),
+                                                                            unicodedata.unidata_version))
+        try:
+            membership_table = np.load(cache_file)
+            if membership_table.shape == (MAX_CODEPOINTS,):
+                return membership_table
+        except (OSError, ValueError):
+            pass
+
+        membership_table = np.fromiter((chr(codepoint).isalpha() for codepoint in range(MAX_CODEPOINTS)),
+                                       dtype=bool, count=MAX_CODEPOINTS)
+        try:
+            # written under a temporary name first so concurrent runs never read a partial file
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            temporary_file = '{}.{}.tmp.npy'.format(cache_file[:-len('.npy')], os.getpid())
+            np.save(temporary_file, membership_table)
+            os.replace(temporary_file, cache_file)
+        except OSError:
+            pass
+        return membership_table
@@ -0,0 +1,191 @@
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+from Classifier import Classifier
+from CorpusReader import CorpusReader
+from Evaluation import Eval
+from VocabularyFactory import CaseInsensitiveAlphabetChars
+
+# every vocabulary and ngram size, then BYOM
+DEFAULT_CONFIGURATIONS = ['0:1', '0:2', '0:3', '1:1', '1:2', '1:3', '2:1', '2:2', '2:3', 'byom']
+
+
+class Benchmark:
+    # Times training, scoring, Classifier.test and Eval for each configuration, every configuration in a fresh
+    # worker process so that its peak RSS is its own
+    def __init__(self, training_file, test_file, configurations=DEFAULT_CONFIGURATIONS, smoothing_value=0.5,
+                 backend='dict', repeat=1):
+        self.training_file = os.path.abspath(training_file)
+        self.test_file = os.path.abspath(test_file)
+        self.configurations = list(configurations)
+        self.smoothing_value = smoothing_value
+        self.backend = backend
+        self.repeat = repeat
+
+    def run(self):
+        results = []
+        for configuration in self.configurations:
+            with Pool(1, maxtasksperchild=1) as pool:
+                results.append(pool.apply(Benchmark.run_configuration, ((self, configuration),)))
+        return {
+            'commit': Benchmark.get_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'training_file': self.training_file,
+            'test_file': self.test_file,
+            'smoothing_value': self.smoothing_value,
+            'backend': self.backend,
+            'repeat': self.repeat,
+            'results': results,
+        }
+
+    @staticmethod
+    def run_configuration(arguments):
+        # the trace and eval files are written to a scratch directory
+        benchmark, configuration = arguments
+        previous_directory = os.getcwd()
+        with tempfile.TemporaryDirectory(prefix='comp472-benchmark-') as working_directory:
+            os.chdir(working_directory)
+            try:
+                return benchmark.measure(configuration)
+            finally:
+                os.chdir(previous_directory)
+
+    def measure(self, configuration):
+        timings = {'train': [], 'score': [], 'batch_score': [], 'test': [], 'eval': []}
+        for _ in range(self.repeat):
+            classifier = self.get_classifier(configuration)
+            model = classifier.training_model
+
+            start = time.perf_counter()
+            model.train()
+            timings['train'].append(time.perf_counter() - start)
+            model_bytes = Benchmark.get_size(model)
+
+            training_tweets = Benchmark.read_tweets(self.training_file, classifier.vocabulary)
+            test_tweets = Benchmark.read_tweets(self.test_file, classifier.vocabulary)
+
+            start = time.perf_counter()
+            for tweet in test_tweets:
+                for language in model.languages:
+                    model.get_language_score_of_tweet(language, tweet)
+            timings['score'].append(time.perf_counter() - start)
+
+            model.freeze()
+            frozen_model_bytes = Benchmark.get_size(model)
+            start = time.perf_counter()
+            for i in range(0, len(test_tweets), 256):
+                model.score_batch(test_tweets[i:i + 256])
+            timings['batch_score'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            classifier.test()
+            timings['test'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            eval = Eval(classifier.trace_file, classifier.eval_file, languages=model.languages)
+            eval.write_to_file()
+            timings['eval'].append(time.perf_counter() - start)
+
+        training_ngrams = sum(len(model.parse_tweet(tweet)) for tweet in training_tweets)
+        test_ngrams = sum(len(model.parse_tweet(tweet)) for tweet in test_tweets)
+        # the best of the repeats is the one least disturbed by the rest of the machine
+        seconds = {stage: min(stage_timings) for stage, stage_timings in timings.items()}
+        return {
+            'configuration': configuration,
+            'training_tweets': len(training_tweets),
+            'training_ngrams': training_ngrams,
+            'test_tweets': len(test_tweets),
+            'test_ngrams': test_ngrams,
+            'seconds': seconds,
+            'train_tweets_per_second': Benchmark.get_rate(len(training_tweets), seconds['train']),
+            'train_ngrams_per_second': Benchmark.get_rate(training_ngrams, seconds['train']),
+            # get_language_score_of_tweet is called once per language
+            'score_tweets_per_second': Benchmark.get_rate(len(test_tweets), seconds['score']),
+            'score_ngrams_per_second': Benchmark.get_rate(test_ngrams * len(model.languages), seconds['score']),
+            'batch_score_tweets_per_second': Benchmark.get_rate(len(test_tweets), seconds['batch_score']),
+            'batch_score_ngrams_per_second': Benchmark.get_rate(test_ngrams, seconds['batch_score']),
+            'test_tweets_per_second': Benchmark.get_rate(len(test_tweets), seconds['test']),
+            'eval_tweets_per_second': Benchmark.get_rate(len(test_tweets), seconds['eval']),
+            'accuracy': eval.get_metrics()['accuracy'],
+            'model_bytes': model_bytes,
+            'frozen_model_bytes': frozen_model_bytes,
+            # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+            'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss *
+                              (1 if sys.platform == 'darwin' else 1024),
+        }
+
+    def get_classifier(self, configuration):
+        if configuration == 'byom':
+            # BYOM has no dense or sketch backend
+            return Classifier(self.training_file, self.test_file, True,
+                              backend=self.backend if self.backend in ('sparse', 'trie') else 'dict')
+        vocabulary, ngram_size = configuration.split(':')
+        return Classifier(self.training_file, self.test_file, False, vocabulary, ngram_size,
+                          str(self.smoothing_value), self.backend)
+
+    @staticmethod
+    def read_tweets(path, vocabulary):
+        tweets = [tweet for _, _, tweet in CorpusReader.read_records(path)]
+        if isinstance(vocabulary, CaseInsensitiveAlphabetChars):
+            tweets = [tweet.lower() for tweet in tweets]
+        return tweets
+
+    @staticmethod
+    def get_rate(count, seconds):
+        return count / seconds if seconds > 0 else None
+
+    @staticmethod
+    def get_size(value, seen=None):
+        # bytes held by an object and everything it references, counting shared objects once
+        if seen is None:
+            seen = set()
+        if id(value) in seen:
+            return 0
+        seen.add(id(value))
+
+        # an array counts its data only when it owns it, not when it is a view or memory mapped
+        size = sys.getsizeof(value)
+        if isinstance(value, dict):
+            size += sum(Benchmark.get_size(key, seen) + Benchmark.get_size(item, seen) for key, item in value.items())
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            size += sum(Benchmark.get_size(item, seen) for item in value)
+        elif hasattr(value, '__dict__'):
+            size += Benchmark.get_size(vars(value), seen)
+        return size
+
+    @staticmethod
+    def get_commit():
+        try:
+            return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                  capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    @staticmethod
+    def compare(baseline, current, threshold):
+        # rates that dropped or sizes that grew by more than threshold (a fraction) between two result files
+        regressions = []
+        baseline_results = {result['configuration']: result for result in baseline['results']}
+        for result in current['results']:
+            baseline_result = baseline_results.get(result['configuration'])
+            if baseline_result is None:
+                continue
+            for metric, value in result.items():
+                baseline_value = baseline_result.get(metric)
+                if value is None or baseline_value is None:
+                    continue
+                if metric.endswith('_per_second') and value < baseline_value * (1 - threshold):
+                    regressions.append((result['configuration'], metric, baseline_value, value))
+                elif metric.endswith('_bytes') and value > baseline_value * (1 + threshold):
+                    regressions.append((result['configuration'], metric, baseline_value, value))
+        return regressions
@@ -0,0 +1,79 @@
+import random
+import string
+from itertools import accumulate
+
+# the languages of the corpus the classifier was first written for
+LANGUAGES = ['eu', 'ca', 'gl', 'es', 'en', 'pt']
+
+ALPHABETS = {
+    'ascii': string.ascii_lowercase,
+    'latin': string.ascii_lowercase + 'áàâäãçéèêëíìîïñóòôöõúùûüß',
+    'mixed': string.ascii_lowercase + 'áàâäãçéèêëíìîïñóòôöõúùûüß' + 'αβγδεζηθικλμνξοπρστυφχψω' + 'абвгдежзийклмнопрстуфхцчшщыэюя',
+}
+
+NOISE = '0123456789#@!?.,:;()-_/\'"😀👍🔥❤'
+
+
+class CorpusGenerator:
+    # Writes tweets in the '<id> <user> <language> <tweet>' format, each language drawing its chars from its own
+    # first-order Markov chain over the alphabet. Every language ranks the alphabet like a shared base ranking with
+    # a share of the positions swapped, so that languages overlap like real ones, and char frequencies follow a Zipf
+    # law whose exponent sets how skewed they are. The same seed always gives the same corpus
+    def __init__(self, languages=LANGUAGES, alphabet='latin', seed=0, skew=1.0, divergence=0.3,
+                 min_length=20, max_length=140, uppercase_ratio=0.05, noise_ratio=0.03):
+        self.languages = list(languages)
+        self.alphabet = ALPHABETS[alphabet]
+        self.seed = seed
+        self.min_length = min_length
+        self.max_length = max_length
+        self.uppercase_ratio = uppercase_ratio
+        self.noise_ratio = noise_ratio
+
+        setup_random = random.Random(seed)
+        base_ranking = list(self.alphabet)
+        setup_random.shuffle(base_ranking)
+        self.transitions = dict()
+        for language in self.languages:
+            ranking = list(base_ranking)
+            for _ in range(int(len(ranking) * divergence)):
+                i, j = setup_random.randrange(len(ranking)), setup_random.randrange(len(ranking))
+                ranking[i], ranking[j] = ranking[j], ranking[i]
+            char_weights = {char: 1 / (rank + 1) ** skew for rank, char in enumerate(ranking)}
+
+            # words are about five chars long
+            char_weights[' '] = sum(char_weights.values()) / 4
+
+            # what follows a char is its language's char frequencies reweighted by a random affinity per pair
+            self.transitions[language] = dict()
+            for previous_char in [' '] + ranking:
+                next_chars = ranking + [' ']
+                weights = [char_weights[char] * setup_random.uniform(0.2, 1.8) for char in next_chars]
+                if previous_char == ' ':
+                    weights[-1] = 0
+                self.transitions[language][previous_char] = (next_chars, list(accumulate(weights)))
+
+    def generate_tweet(self, language, tweet_random):
+        length = tweet_random.randint(self.min_length, self.max_length)
+        chars = []
+        previous_char = ' '
+        while len(chars) < length:
+            if tweet_random.random() < self.noise_ratio:
+                chars.append(tweet_random.choice(NOISE))
+                continue
+
+            next_chars, cumulative_weights = self.transitions[language][previous_char]
+            char = tweet_random.choices(next_chars, cum_weights=cumulative_weights)[0]
+            previous_char = char
+            if tweet_random.random() < self.uppercase_ratio:
+                char = char.upper()
+            chars.append(char)
+        return ''.join(chars).strip()
+
+    def write(self, path, tweet_count, first_id=0, seed_offset=0):
+        tweet_random = random.Random(self.seed + 1 + seed_offset)
+        output_file = open(path, 'w', encoding="utf-8")
+        for i in range(tweet_count):
+            language = tweet_random.choice(self.languages)
+            tweet = self.generate_tweet(language, tweet_random)
+            output_file.write(str.join('\t', [str(first_id + i), 'user' + str(first_id + i), language, tweet]) + '\n')
+        output_file.close()
@@ -0,0 +1,88 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from benchmarks.Benchmark import Benchmark, DEFAULT_CONFIGURATIONS
+from benchmarks.CorpusGenerator import CorpusGenerator, ALPHABETS, LANGUAGES
+
+parser = argparse.ArgumentParser(prog='python -m benchmarks')
+subparsers = parser.add_subparsers(dest='command', required=True)
+
+generate_parser = subparsers.add_parser('generate', help='write a synthetic training and test corpus')
+run_parser = subparsers.add_parser('run', help='benchmark every configuration and write the results as JSON')
+for corpus_parser in (generate_parser, run_parser):
+    corpus_parser.add_argument('--training-size', type=int, default=20000, help='number of training tweets')
+    corpus_parser.add_argument('--test-size', type=int, default=2000, help='number of test tweets')
+    corpus_parser.add_argument('--languages', nargs='+', default=LANGUAGES, help='language labels of the tweets')
+    corpus_parser.add_argument('--alphabet', choices=sorted(ALPHABETS.keys()), default='latin')
+    corpus_parser.add_argument('--skew', type=float, default=1.0, help='Zipf exponent of the char frequencies')
+    corpus_parser.add_argument('--divergence', type=float, default=0.3,
+                               help='share of the alphabet ranked differently in every language')
+    corpus_parser.add_argument('--seed', type=int, default=0)
+
+generate_parser.add_argument('training_file')
+generate_parser.add_argument('test_file')
+
+run_parser.add_argument('--training-file', help='benchmark on this corpus instead of a generated one')
+run_parser.add_argument('--test-file')
+run_parser.add_argument('--configurations', nargs='+', default=DEFAULT_CONFIGURATIONS, metavar='V:n|byom')
+run_parser.add_argument('--smoothing-value', type=float, default=0.5)
+run_parser.add_argument('--backend', default='dict')
+run_parser.add_argument('--repeat', type=int, default=1, help='runs per configuration, the fastest one is kept')
+run_parser.add_argument('--output', default='benchmark.json')
+
+compare_parser = subparsers.add_parser('compare', help='list the regressions between two result files')
+compare_parser.add_argument('baseline')
+compare_parser.add_argument('current')
+compare_parser.add_argument('--threshold', type=float, default=0.1,
+                            help='fraction a rate may drop or a size may grow by before it counts as a regression')
+
+arguments = parser.parse_args()
+
+
+def generate_corpus(training_file, test_file):
+    generator = CorpusGenerator(arguments.languages, arguments.alphabet, arguments.seed, arguments.skew,
+                                arguments.divergence)
+    generator.write(training_file, arguments.training_size)
+    generator.write(test_file, arguments.test_size, first_id=arguments.training_size, seed_offset=1)
+
+
+if arguments.command == 'generate':
+    generate_corpus(arguments.training_file, arguments.test_file)
+
+elif arguments.command == 'run':
+    corpus = None
+    corpus_directory = None
+    training_file = arguments.training_file
+    test_file = arguments.test_file
+    if training_file is None or test_file is None:
+        corpus_directory = tempfile.mkdtemp(prefix='comp472-corpus-')
+        training_file = os.path.join(corpus_directory, 'training.txt')
+        test_file = os.path.join(corpus_directory, 'test.txt')
+        generate_corpus(training_file, test_file)
+        corpus = {option: getattr(arguments, option) for option in
+                  ('training_size', 'test_size', 'languages', 'alphabet', 'skew', 'divergence', 'seed')}
+
+    benchmark = Benchmark(training_file, test_file, arguments.configurations, arguments.smoothing_value,
+                          arguments.backend, arguments.repeat)
+    results = benchmark.run()
+    results['corpus'] = corpus
+    if corpus_directory is not None:
+        shutil.rmtree(corpus_directory)
+    output_file = open(arguments.output, 'w', encoding="utf-8")
+    json.dump(results, output_file, indent=2)
+    output_file.close()
+
+else:
+    baseline_file = open(arguments.baseline, 'r', encoding="utf-8")
+    current_file = open(arguments.current, 'r', encoding="utf-8")
+    regressions = Benchmark.compare(json.load(baseline_file), json.load(current_file), arguments.threshold)
+    baseline_file.close()
+    current_file.close()
+
+    for configuration, metric, baseline_value, value in regressions:
+        print('{}  {}  {} -> {}'.format(configuration, metric, baseline_value, value))
+    sys.exit(1 if regressions else 0)
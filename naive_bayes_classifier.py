@@ -1,19 +1,232 @@
+import argparse
+import asyncio
+import signal
 import sys
 
-from Classifier import Classifier
+from ClassificationServer import ClassificationServer, DEFAULT_MAX_DELAY
+from Classifier import Classifier, DEFAULT_BATCH_SIZE
+from CorpusReader import CorpusReader
+from CrossValidation import CrossValidation
+from HyperparameterSweep import HyperparameterSweep
+from QuantizationReport import QuantizationReport
+from QuantizedModel import QuantizedModel
+from SketchReport import SketchReport
+from Stats import Stats
+from TrainingModelFactory import TrainingModel, TOP_NGRAMS_MEASURES, DEFAULT_SKETCH_WIDTH, DEFAULT_SKETCH_DEPTH, \
+    DEFAULT_HEAVY_HITTER_COUNT
+
+commands = ('train', 'classify', 'merge', 'update', 'sweep', 'cross-validate', 'sketch-report', 'top', 'serve',
+            'quantize')
+
+
+def pop_option(name):
+    # options every command takes, removed before the command's own arguments are read
+    if name not in sys.argv:
+        return None
+    index = sys.argv.index(name)
+    value = sys.argv[index + 1]
+    del sys.argv[index:index + 2]
+    return value
+
+
+def create(constructor, *args, **options):
+    # arguments no model can be made for, like a vocabulary too large for the dense backend, end the command with the
+    # reason instead of a traceback
+    try:
+        return constructor(*args, **options)
+    except ValueError as error:
+        sys.exit('error: {}'.format(error))
+
+
+stats_file = pop_option('--stats')
+profile_file = pop_option('--profile')
+if stats_file is not None or profile_file is not None:
+    Stats.enable(profile_file is not None)
 
 classifier = None
 
-if sys.argv[1] == 'byom':
-    training_file = sys.argv[2]
-    test_file = sys.argv[3]
-    classifier = Classifier(training_file, test_file, True)
+if len(sys.argv) > 1 and sys.argv[1] in commands:
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    train_parser = subparsers.add_parser('train', help='train a model once and save it to a directory')
+    train_parser.add_argument('model_args', nargs='+', metavar='arg',
+                              help='byom <training_file> [<backend> [<n>]] | <V> <n> <δ> <training_file> [<backend>]')
+    train_parser.add_argument('--model', required=True, help='directory to save the trained model to')
+    train_parser.add_argument('--processes', type=int, default=1,
+                              help='number of processes counting chunks of the training file in parallel')
+
+    classify_parser = subparsers.add_parser('classify', help='classify a test file with a saved model')
+    classify_parser.add_argument('test_file')
+    classify_parser.add_argument('--model', required=True, help='directory of a model saved by the train command')
+    classify_parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                                 help='number of tweets scored together')
+    classify_parser.add_argument('--top1', action='store_true',
+                                 help='stop scoring the languages that cannot be the most likely one')
+    classify_parser.add_argument('--cache-size', type=int, default=0,
+                                 help='number of distinct tweets whose predictions are kept for when they come again')
+
+    merge_parser = subparsers.add_parser('merge', help='combine saved models trained on separate corpora')
+    merge_parser.add_argument('input_models', nargs='+', metavar='input_model')
+    merge_parser.add_argument('--model', required=True, help='directory to save the merged model to')
+
+    update_parser = subparsers.add_parser('update', help='add more labeled tweets to a saved model')
+    update_parser.add_argument('training_file')
+    update_parser.add_argument('--model', required=True, help='directory of a model saved by the train command')
+    update_parser.add_argument('--output', required=True, help='directory to save the updated model to')
+
+    sweep_parser = subparsers.add_parser('sweep', help='evaluate every combination of the given V, n and δ values')
+    sweep_parser.add_argument('training_file')
+    sweep_parser.add_argument('test_file')
+    sweep_parser.add_argument('--vocabularies', nargs='+', default=['0', '1', '2'], metavar='V')
+    sweep_parser.add_argument('--ngram-sizes', nargs='+', default=['1', '2', '3'], metavar='n')
+    sweep_parser.add_argument('--smoothing-values', nargs='+', required=True, metavar='δ')
+    sweep_parser.add_argument('--backend', default='dict')
+    sweep_parser.add_argument('--processes', type=int, default=1,
+                              help='number of (V, n) combinations trained and scored in parallel')
+    sweep_parser.add_argument('--output', default='eval_sweep.txt', help='file to write the table of metrics to')
+
+    cross_validation_parser = subparsers.add_parser('cross-validate', help='k-fold cross-validate on a training file')
+    cross_validation_parser.add_argument('model_args', nargs='+', metavar='arg',
+                                         help='byom <training_file> [<backend> [<n>]] | '
+                                              '<V> <n> <δ> <training_file> [<backend>]')
+    cross_validation_parser.add_argument('--folds', type=int, default=5)
+    cross_validation_parser.add_argument('--processes', type=int, default=1,
+                                         help='number of folds counted and validated in parallel')
+    cross_validation_parser.add_argument('--output', default='eval_cv.txt',
+                                         help='file to write the metrics of every fold and their mean and stddev to')
+
+    sketch_parser = subparsers.add_parser('sketch-report',
+                                          help='compare the accuracy of the sketch backend to exact counting')
+    sketch_parser.add_argument('training_file')
+    sketch_parser.add_argument('test_file')
+    sketch_parser.add_argument('--vocabulary', default='2', metavar='V')
+    sketch_parser.add_argument('--ngram-size', default='3', metavar='n')
+    sketch_parser.add_argument('--smoothing-value', default='0.5', metavar='δ')
+    sketch_parser.add_argument('--widths', nargs='+', type=int, default=[DEFAULT_SKETCH_WIDTH],
+                               help='counters per sketch row to try, each a power of 2')
+    sketch_parser.add_argument('--depth', type=int, default=DEFAULT_SKETCH_DEPTH, help='rows of every sketch')
+    sketch_parser.add_argument('--heavy-hitters', type=int, default=DEFAULT_HEAVY_HITTER_COUNT,
+                               help='ngrams counted exactly per language')
+    sketch_parser.add_argument('--output', default='eval_sketch.txt', help='file to write the table of metrics to')
+
+    top_parser = subparsers.add_parser('top', help='list the highest ranked ngrams of a saved model')
+    top_parser.add_argument('--model', required=True, help='directory of a model saved by the train command')
+    top_parser.add_argument('-k', type=int, default=10, help='number of ngrams listed per language')
+    top_parser.add_argument('--language', help='only list the ngrams of this language')
+    top_parser.add_argument('--by', choices=TOP_NGRAMS_MEASURES, default='count')
+
+    quantize_parser = subparsers.add_parser('quantize', help='export a saved model as int16 tables for scoring only')
+    quantize_parser.add_argument('--model', required=True, help='directory of a model saved by the train command')
+    quantize_parser.add_argument('--output', required=True, help='directory to save the quantized model to')
+    quantize_parser.add_argument('--test-file', help='also compare the quantized model to the model on this file')
+    quantize_parser.add_argument('--report', default='eval_quantized.txt',
+                                 help='file to write the comparison on the test file to')
+
+    serve_parser = subparsers.add_parser('serve', help='classify tweets sent over a socket with a saved model')
+    serve_parser.add_argument('--model', required=True, help='directory of a model saved by the train command')
+    serve_parser.add_argument('--socket', help='path of a Unix socket to listen on instead of a TCP port')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8472)
+    serve_parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                              help='largest number of requests scored together')
+    serve_parser.add_argument('--max-delay', type=float, default=DEFAULT_MAX_DELAY * 1000,
+                              help='milliseconds a request may wait for others to be batched with')
+    serve_parser.add_argument('--top1', action='store_true',
+                              help='stop scoring the languages that cannot be the most likely one')
+    serve_parser.add_argument('--cache-size', type=int, default=0,
+                              help='number of distinct tweets whose predictions are kept for when they come again')
+
+    arguments = parser.parse_args()
+    if arguments.command in ('train', 'cross-validate'):
+        model_args = arguments.model_args
+        if model_args[0] == 'byom':
+            backend = model_args[2] if len(model_args) > 2 else 'dict'
+            ngram_size = model_args[3] if len(model_args) > 3 else None
+            classifier = create(Classifier, model_args[1], None, True, ngram_size=ngram_size, backend=backend)
+        else:
+            backend = model_args[4] if len(model_args) > 4 else 'dict'
+            classifier = create(Classifier, model_args[3], None, False, model_args[0], model_args[1], model_args[2],
+                                backend)
+        if arguments.command == 'train':
+            classifier.save_model(arguments.model, arguments.processes)
+        else:
+            cross_validation = CrossValidation(classifier.training_model, arguments.folds)
+            cross_validation.run(arguments.processes)
+            cross_validation.write_to_file(arguments.output)
+    elif arguments.command == 'merge':
+        merged_model = TrainingModel.load(arguments.input_models[0])
+        for input_model in arguments.input_models[1:]:
+            merged_model.merge(TrainingModel.load(input_model))
+        merged_model.save(arguments.model)
+    elif arguments.command == 'update':
+        model = TrainingModel.load(arguments.model)
+        records = CorpusReader.read_records(arguments.training_file)
+        model.partial_fit((language, tweet) for _, language, tweet in records)
+        model.save(arguments.output)
+    elif arguments.command == 'sweep':
+        sweep = create(HyperparameterSweep, arguments.training_file, arguments.test_file, arguments.vocabularies,
+                       arguments.ngram_sizes, arguments.smoothing_values, arguments.backend)
+        sweep.run(arguments.processes)
+        sweep.write_to_file(arguments.output)
+    elif arguments.command == 'sketch-report':
+        report = SketchReport(arguments.training_file, arguments.test_file, arguments.vocabulary, arguments.ngram_size,
+                              arguments.smoothing_value, arguments.widths, arguments.depth, arguments.heavy_hitters)
+        report.run()
+        report.write_to_file(arguments.output)
+    elif arguments.command == 'top':
+        model = TrainingModel.load(arguments.model)
+        top_ngrams = model.top_ngrams(arguments.k, by=arguments.by)
+        for language in model.languages if arguments.language is None else [arguments.language]:
+            for ngram, value in top_ngrams[language]:
+                print(str.join('  ', [language, ngram, str(value)]))
+    elif arguments.command == 'quantize':
+        model = TrainingModel.load(arguments.model)
+        quantized_model = QuantizedModel.from_model(model)
+        quantized_model.save(arguments.output)
+        if arguments.test_file is not None:
+            report = QuantizationReport(model, quantized_model, arguments.test_file)
+            report.run()
+            report.write_to_file(arguments.report)
+    elif arguments.command == 'serve':
+        classifier = Classifier(None, None, False, model_file=arguments.model, top1=arguments.top1,
+                                cache_size=arguments.cache_size)
+        server = ClassificationServer(classifier, arguments.batch_size, arguments.max_delay / 1000)
+        # stopped like with Ctrl-C, so that the stats are still written
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        try:
+            asyncio.run(server.serve_forever(arguments.socket, arguments.host, arguments.port))
+        except KeyboardInterrupt:
+            pass
+    else:
+        classifier = Classifier(None, arguments.test_file, False, model_file=arguments.model, top1=arguments.top1,
+                                cache_size=arguments.cache_size)
+        classifier.classify(arguments.batch_size)
+
 else:
-    vocabulary = sys.argv[1]
-    ngram_size = sys.argv[2]
-    smoothing_value = sys.argv[3]
-    training_file = sys.argv[4]
-    test_file = sys.argv[5]
-    classifier = Classifier(training_file, test_file, False, vocabulary, ngram_size, smoothing_value)
-
-classifier.classify()
+    top1 = '--top1' in sys.argv
+    args = [arg for arg in sys.argv if arg != '--top1']
+
+    if args[1] == 'byom':
+        training_file = args[2]
+        test_file = args[3]
+        backend = args[4] if len(args) > 4 else 'dict'
+        ngram_size = args[5] if len(args) > 5 else None
+        classifier = create(Classifier, training_file, test_file, True, ngram_size=ngram_size, backend=backend,
+                            top1=top1)
+        classifier.classify()
+    else:
+        vocabulary = args[1]
+        ngram_size = args[2]
+        smoothing_value = args[3]
+        training_file = args[4]
+        test_file = args[5]
+        backend = args[6] if len(args) > 6 else 'dict'
+        classifier = create(Classifier, training_file, test_file, False, vocabulary, ngram_size, smoothing_value,
+                            backend, top1=top1)
+        classifier.classify()
+
+if stats_file is not None:
+    Stats.write_to_file(stats_file)
+if profile_file is not None:
+    Stats.write_profile(profile_file)
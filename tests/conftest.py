@@ -0,0 +1,63 @@
+import os
+import sys
+
+import pytest
+
+# the modules live in the root directory of the repository, which is not a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Classifier import Classifier  # noqa: E402
+from HyperparameterSweep import HyperparameterSweep  # noqa: E402
+
+# the same everyday tweets written in each of the six languages the classifier was first written for, in the
+# '<id> <user> <language> <tweet>' format of the corpus files
+DATA_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+TRAINING_FILE = os.path.join(DATA_DIRECTORY, 'training.txt')
+TEST_FILE = os.path.join(DATA_DIRECTORY, 'test.txt')
+
+
+@pytest.fixture
+def training_file():
+    return TRAINING_FILE
+
+
+@pytest.fixture
+def test_file():
+    return TEST_FILE
+
+
+@pytest.fixture(scope='session')
+def training_tweets():
+    # (tweets, languages) of the training file
+    return HyperparameterSweep.read_test_file(TRAINING_FILE)
+
+
+@pytest.fixture(scope='session')
+def test_tweets():
+    # (tweets, languages) of the test file
+    return HyperparameterSweep.read_test_file(TEST_FILE)
+
+
+def train_classifier(classifier):
+    classifier.training_model.train()
+    classifier.training_model.freeze()
+    return classifier
+
+
+@pytest.fixture
+def get_classifier():
+    # a Classifier trained on the training file, or on the given one, and frozen, for V, n and δ given as on the
+    # command line
+    def get_classifier(vocabulary='2', ngram_size='2', smoothing_value='0.5', training_file=TRAINING_FILE, **options):
+        return train_classifier(Classifier(training_file, TEST_FILE, False, vocabulary, ngram_size, smoothing_value,
+                                           **options))
+    return get_classifier
+
+
+@pytest.fixture
+def get_byom_classifier():
+    # a BYOM Classifier trained on the training file, or on the given one, and frozen, of order 3 unless the trie
+    # backend is given another
+    def get_byom_classifier(ngram_size=None, training_file=TRAINING_FILE, **options):
+        return train_classifier(Classifier(training_file, TEST_FILE, True, ngram_size=ngram_size, **options))
+    return get_byom_classifier
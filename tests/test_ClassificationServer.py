@@ -0,0 +1,41 @@
+import asyncio
+
+from ClassificationServer import ClassificationServer
+
+
+def fail_bad_tweets(classifier):
+    # a tweet holding "bad" fails the whole batch it is scored in
+    score_tweets = classifier.score_tweets
+
+    def score_good_tweets(tweets):
+        if any('bad' in tweet for tweet in tweets):
+            raise ValueError('cannot score a bad tweet')
+        return score_tweets(tweets)
+    classifier.score_tweets = score_good_tweets
+    return classifier
+
+
+def test_bad_request_only_fails_itself(get_classifier):
+    async def classify_together(server, tweets):
+        await server.start()
+        return await asyncio.gather(*[server.classify(tweet) for tweet in tweets], return_exceptions=True)
+
+    server = ClassificationServer(fail_bad_tweets(get_classifier()), batch_size=3, max_delay=1)
+    good, bad, other = asyncio.run(classify_together(server, ['thanks for the coffee this morning', 'a bad tweet',
+                                                              'gracias por el café de esta mañana']))
+    assert server.batch_count == 1
+    assert good[0] == 'en'
+    assert other[0] == 'es'
+    assert isinstance(bad, ValueError)
+
+
+def test_bad_request_gets_an_error_response(get_classifier):
+    async def respond(server, tweets):
+        await server.start()
+        return await asyncio.gather(*[server.get_classification_response(index, tweet)
+                                      for index, tweet in enumerate(tweets)])
+
+    server = ClassificationServer(fail_bad_tweets(get_classifier()), batch_size=2, max_delay=1)
+    bad, good = asyncio.run(respond(server, ['a bad tweet', 'thanks for the coffee this morning']))
+    assert bad == {'id': 0, 'error': 'cannot score a bad tweet'}
+    assert good['id'] == 1 and good['language'] == 'en'
@@ -0,0 +1,14 @@
+def test_a_tie_goes_to_the_language_first_met_in_training(get_classifier, training_file, tmp_path):
+    # the training file in reverse, whose first language is another one
+    lines = open(training_file, encoding='utf-8').read().splitlines()
+    reversed_file = tmp_path / 'reversed.txt'
+    reversed_file.write_text('\n'.join(reversed(lines)) + '\n', encoding='utf-8')
+
+    for path in (training_file, str(reversed_file)):
+        first_language = open(path, encoding='utf-8').readline().split()[2]
+        # every language has as many training tweets, so a tweet with no ngram scores the same in all of them, and
+        # with δ = 0 a tweet of unseen chars scores -inf in all of them
+        classifier = get_classifier('2', '1', '0', training_file=path)
+        for language, _, scores in classifier.predict_batch(['', '!!', 'ʃʃ']):
+            assert len(set(scores.tolist())) == 1
+            assert language == first_language
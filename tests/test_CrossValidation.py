@@ -0,0 +1,47 @@
+import numpy as np
+
+from CorpusReader import CorpusReader
+from CrossValidation import CrossValidation
+from Evaluation import Eval
+from TrainingModelFactory import TrainingModelFactory
+from VocabularyFactory import VocabularyFactory
+
+
+def get_model(training_file, backend='sparse'):
+    return TrainingModelFactory.get_nb_training_model(VocabularyFactory.get_vocabulary('2'), '2', 0.5, training_file,
+                                                      backend)
+
+
+def test_training_file_is_read_once(training_file, monkeypatch):
+    read_batches = CorpusReader.read_batches
+    read_paths = []
+
+    def record_reads(path, *arguments, **options):
+        read_paths.append(path)
+        return read_batches(path, *arguments, **options)
+    monkeypatch.setattr(CorpusReader, 'read_batches', staticmethod(record_reads))
+
+    CrossValidation(get_model(training_file), 4).run()
+    assert read_paths == [training_file]
+
+
+def test_folds_are_validated_by_the_model_of_the_other_folds(training_file, tmp_path):
+    fold_count = 4
+    for backend in ('dict', 'sparse'):
+        results = CrossValidation(get_model(training_file, backend), fold_count).run()
+
+        # the tweets are dealt to the folds in turn
+        lines = open(training_file, encoding='utf-8').read().splitlines()
+        for fold, metrics in enumerate(results):
+            rest_file = tmp_path / 'rest.txt'
+            rest_file.write_text('\n'.join(line for index, line in enumerate(lines) if index % fold_count != fold) +
+                                 '\n', encoding='utf-8')
+            model = get_model(str(rest_file), backend)
+            model.train()
+            model.freeze()
+            languages, tweets = zip(*[line.split(maxsplit=3)[2:] for line in lines[fold::fold_count]])
+            predictions = np.argmax(model.score_matrix(list(tweets)), axis=1).tolist()
+            expected_metrics = Eval(None, None, zip([model.languages[index] for index in predictions], languages),
+                                    model.languages).get_metrics()
+            assert metrics['accuracy'] == expected_metrics['accuracy']
+            assert metrics['f1'] == expected_metrics['f1']
@@ -0,0 +1,18 @@
+from Evaluation import Eval
+
+
+def test_languages_are_listed_in_alphabetical_order(tmp_path):
+    predictions = [('es', 'es'), ('en', 'es'), ('en', 'en'), ('xx', 'pt')]
+    eval_files = []
+    # the order of the model's languages, and whether a language is only met in the predictions, make no difference
+    for languages in (['pt', 'es', 'en'], ['en', 'es'], ['xx', 'es', 'eu', 'en', 'pt']):
+        eval_file = tmp_path / 'eval_{}.txt'.format(len(eval_files))
+        eval = Eval(None, str(eval_file), predictions, languages)
+        eval.write_to_file()
+        eval_files.append(eval_file.read_text(encoding='utf-8'))
+        assert list(eval.get_metrics()['precision'].keys()) == sorted(set(languages).union(('en', 'es', 'pt', 'xx')))
+    assert eval_files[0] == eval_files[1]
+
+    precisions = [float(precision) for precision in eval_files[0].splitlines()[1].split()]
+    # en, es, pt and xx
+    assert precisions == [0.5, 1.0, 0.0, 0.0]
@@ -0,0 +1,13 @@
+import numpy as np
+
+from NgramExtractor import NgramExtractor
+from VocabularyFactory import VocabularyFactory
+
+
+def test_lone_surrogate_is_out_of_vocabulary():
+    for vocabulary_type in ('0', '1', '2'):
+        extractor = NgramExtractor(VocabularyFactory.get_vocabulary(vocabulary_type), 2)
+        codepoints, indices = extractor.encode('ab \ud800 cd')
+        assert codepoints.tolist() == [ord(char) for char in 'ab \ud800 cd']
+        assert indices[3] == -1
+        assert np.array_equal(extractor.extract('ab \ud800 cd'), extractor.extract('ab cd'))
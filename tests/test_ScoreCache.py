@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from ScoreCache import ScoreCache
+
+
+def test_whitespace_is_part_of_the_key():
+    assert ScoreCache.get_key('a  b') != ScoreCache.get_key('a b')
+    assert ScoreCache.get_key(' a') != ScoreCache.get_key('a')
+    assert ScoreCache.get_key('\ud800') != ScoreCache.get_key('\ud801')
+
+
+def test_byom_leading_whitespace_is_not_served_from_the_cache(get_byom_classifier, test_tweets):
+    for backend in ('dict', 'trie'):
+        classifier = get_byom_classifier(backend=backend, cache_size=16)
+        # BYOM scores the first chars of a tweet as they are, so a space before a letter changes the score
+        for tweet in [tweet for tweet in test_tweets[0] if tweet[0].isalpha()]:
+            tweets = [tweet, ' ' + tweet]
+            expected = [classifier.score_tweets([tweet])[0] for tweet in tweets]
+            assert not np.array_equal(expected[0][2], expected[1][2])
+            # the second tweet is scored after the first is in the cache
+            for tweet, (language, score, scores) in zip(tweets, expected):
+                [(cached_language, cached_score, cached_scores)] = classifier.predict_batch([tweet])
+                assert (cached_language, cached_score) == (language, score)
+                assert np.array_equal(cached_scores, scores)
+
+
+def test_cached_scores_cannot_be_changed_by_a_caller(get_classifier, test_tweets):
+    classifier = get_classifier(cache_size=16)
+    tweet = test_tweets[0][0]
+    [(_, _, scores)] = classifier.predict_batch([tweet])
+    expected = scores.copy()
+    with pytest.raises(ValueError):
+        scores[0] = 0
+    [(_, _, cached_scores)] = classifier.predict_batch([tweet])
+    assert np.array_equal(cached_scores, expected)
@@ -0,0 +1,33 @@
+import sys
+import threading
+from collections import Counter
+
+from Stats import Stats
+
+
+def test_counters_and_stages_of_concurrent_threads_add_up(monkeypatch):
+    monkeypatch.setattr(Stats, 'enabled', False)
+    monkeypatch.setattr(Stats, 'stage_seconds', dict())
+    monkeypatch.setattr(Stats, 'counters', Counter())
+    Stats.enable()
+    # threads switch as often as possible, for the updates of one to land in the middle of another's
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+
+    def work(index):
+        for _ in range(2000):
+            with Stats.stage('outer'):
+                with Stats.stage('inner_{}'.format(index)):
+                    Stats.count('events')
+                Stats.count('events', 2)
+
+    threads = [threading.Thread(target=work, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    sys.setswitchinterval(switch_interval)
+
+    report = Stats.get_report()
+    assert report['counters'] == {'events': 8 * 2000 * 3}
+    assert sorted(report['stage_seconds']) == ['inner_{}'.format(index) for index in range(8)] + ['outer']
@@ -0,0 +1,271 @@
+from math import log10
+
+import numpy as np
+import pytest
+
+from benchmarks.CorpusGenerator import CorpusGenerator
+from HyperparameterSweep import HyperparameterSweep
+from NgramExtractor import NgramExtractor
+from TrainingModelFactory import TrainingModelFactory, SketchTrainingModel, DEFAULT_SKETCH_DEPTH, DENSE_MAX_NGRAMS
+from VocabularyFactory import VocabularyFactory
+
+
+def get_best_languages(scores):
+    # the first language wins a tie, and the languages left out by top1 never win, like in Classifier.score_tweets
+    return np.argmax(np.where(np.isnan(scores), float('-inf'), scores), axis=1)
+
+
+def test_top1_picks_the_language_full_scoring_picks(get_classifier, training_tweets, test_tweets):
+    # tweets far longer than TOP1_PREFIX_SIZE ngrams, tweets with no ngram and ties at -inf with δ = 0
+    tweets = training_tweets[0] + test_tweets[0] + [' '.join(test_tweets[0]), '', '!!', 'zzzz qqqq']
+    for vocabulary, ngram_size, smoothing_value, backend in (('0', '1', '0.5', 'dict'), ('0', '3', '0.1', 'dense'),
+                                                             ('1', '2', '0.5', 'sparse'), ('2', '3', '0.5', 'dict'),
+                                                             ('2', '3', '0', 'sparse'), ('2', '2', '0.3', 'trie'),
+                                                             ('2', '3', '0.5', 'sketch')):
+        model = get_classifier(vocabulary, ngram_size, smoothing_value, backend=backend).training_model
+        scores = model.score_matrix(tweets)
+        top1_scores = model.score_matrix(tweets, top1=True)
+        best_languages = get_best_languages(scores)
+        assert np.array_equal(get_best_languages(top1_scores), best_languages)
+        rows = np.arange(len(tweets))
+        assert np.allclose(top1_scores[rows, best_languages], scores[rows, best_languages], rtol=1e-12)
+
+
+# (V, n, δ, backend) of the naive Bayes models, and backends of the BYOM models, that can be updated
+UPDATABLE_MODELS = (('2', '3', '0.5', 'dict'), ('0', '2', '0.5', 'dense'), ('1', '3', '0.1', 'sparse'),
+                    ('2', '3', '0.5', 'trie'))
+UPDATABLE_BYOM_BACKENDS = ('dict', 'sparse', 'trie')
+
+
+def split_training_file(training_file, tmp_path):
+    # a file with the first half of the training file but its Basque tweets, and the (language, tweet) pairs of the
+    # rest of it, so that learning them also meets a language for the first time
+    lines = open(training_file, encoding='utf-8').read().splitlines()
+    first_lines = [line for line in lines[:len(lines) // 2] if line.split(maxsplit=3)[2] != 'eu']
+    first_file = tmp_path / 'first.txt'
+    first_file.write_text('\n'.join(first_lines) + '\n', encoding='utf-8')
+    examples = [tuple(line.split(maxsplit=3)[2:]) for line in lines if line not in first_lines]
+    return str(first_file), examples
+
+
+def get_scores(model, tweets):
+    # the scores of every language, whatever order the model has its languages in
+    return dict(zip(model.languages, model.score_matrix(tweets).T))
+
+
+def assert_same_scores(scores, expected_scores):
+    assert scores.keys() == expected_scores.keys()
+    for language, language_scores in expected_scores.items():
+        assert np.allclose(scores[language], language_scores, rtol=1e-9)
+
+
+def get_updatable_classifiers(get_classifier, get_byom_classifier, **options):
+    for vocabulary, ngram_size, smoothing_value, backend in UPDATABLE_MODELS:
+        yield get_classifier(vocabulary, ngram_size, smoothing_value, backend=backend, **options)
+    for backend in UPDATABLE_BYOM_BACKENDS:
+        yield get_byom_classifier(backend=backend, **options)
+
+
+def test_partial_fit_scores_like_full_training(get_classifier, get_byom_classifier, training_file, test_tweets,
+                                               tmp_path):
+    first_file, examples = split_training_file(training_file, tmp_path)
+    fully_trained = get_updatable_classifiers(get_classifier, get_byom_classifier)
+    updated = get_updatable_classifiers(get_classifier, get_byom_classifier, training_file=first_file)
+    for full_classifier, classifier in zip(fully_trained, updated):
+        expected_scores = get_scores(full_classifier.training_model, test_tweets[0])
+
+        # frozen, only the rows of the new ngrams are read again
+        model = classifier.training_model
+        snapshot = model.snapshot()
+        snapshot_scores = get_scores(snapshot, test_tweets[0])
+        model.partial_fit(examples)
+        assert model.frozen
+        assert_same_scores(get_scores(model, test_tweets[0]), expected_scores)
+        # the snapshot taken before keeps scoring like the model did then
+        assert_same_scores(get_scores(snapshot, test_tweets[0]), snapshot_scores)
+
+
+def test_partial_fit_of_an_unfrozen_model_scores_like_full_training(get_classifier, get_byom_classifier,
+                                                                     training_file, test_tweets, tmp_path):
+    first_file, examples = split_training_file(training_file, tmp_path)
+    fully_trained = get_updatable_classifiers(get_classifier, get_byom_classifier)
+    updated = get_updatable_classifiers(get_classifier, get_byom_classifier, training_file=first_file)
+    for full_classifier, classifier in zip(fully_trained, updated):
+        model = classifier.training_model
+        model.unfreeze()
+        model.partial_fit(examples[:len(examples) // 2])
+        model.partial_fit(examples[len(examples) // 2:])
+        model.freeze()
+        assert_same_scores(get_scores(model, test_tweets[0]), get_scores(full_classifier.training_model,
+                                                                         test_tweets[0]))
+
+
+def test_subtract_scores_like_training_on_the_rest(get_classifier, get_byom_classifier, training_file, test_tweets,
+                                                   tmp_path):
+    # every fifth tweet, of every language, is taken back out of the model of the whole file
+    lines = open(training_file, encoding='utf-8').read().splitlines()
+    part_file = tmp_path / 'part.txt'
+    part_file.write_text('\n'.join(lines[::5]) + '\n', encoding='utf-8')
+    rest_file = tmp_path / 'rest.txt'
+    rest_file.write_text('\n'.join(line for index, line in enumerate(lines) if index % 5 != 0) + '\n',
+                         encoding='utf-8')
+
+    wholes = get_updatable_classifiers(get_classifier, get_byom_classifier)
+    parts = get_updatable_classifiers(get_classifier, get_byom_classifier, training_file=str(part_file))
+    rests = get_updatable_classifiers(get_classifier, get_byom_classifier, training_file=str(rest_file))
+    for whole, part, rest in zip(wholes, parts, rests):
+        model = whole.training_model
+        model.unfreeze()
+        model.subtract(part.training_model)
+        model.freeze()
+        assert_same_scores(get_scores(model, test_tweets[0]), get_scores(rest.training_model, test_tweets[0]))
+
+
+def test_dense_backend_refuses_too_many_possible_ngrams_up_front(training_file, test_file):
+    # 52^5 counts per language would not fit, and V2 has no dense indices at all
+    assert 52 ** 5 > DENSE_MAX_NGRAMS
+    for vocabulary, ngram_size in (('1', '5'), ('2', '2')):
+        with pytest.raises(ValueError, match='sparse or trie backend'):
+            TrainingModelFactory.get_nb_training_model(VocabularyFactory.get_vocabulary(vocabulary), ngram_size, 0.5,
+                                                       training_file, 'dense')
+    with pytest.raises(ValueError, match='sparse or trie backend'):
+        HyperparameterSweep(training_file, test_file, ['0', '2'], ['1'], ['0.5'], 'dense')
+
+
+def test_sketch_counts_are_within_the_count_min_bound(training_file, training_tweets):
+    vocabulary = VocabularyFactory.get_vocabulary('2')
+    exact_model = TrainingModelFactory.get_nb_training_model(vocabulary, '3', 0.5, training_file, 'sparse')
+    exact_model.train()
+    ngram_keys, exact_counts = exact_model.get_ngram_counts()
+    examples = list(zip(training_tweets[1], training_tweets[0]))
+
+    for sketch_width, heavy_hitter_count in ((1 << 18, 1 << 14), (256, 64), (64, 16), (16, 4)):
+        # learned a few tweets at a time, so that the heavy hitters are competed for again and again
+        model = SketchTrainingModel(vocabulary, 3, 0.5, None, sketch_width, DEFAULT_SKETCH_DEPTH, heavy_hitter_count)
+        for start in range(0, len(examples), 10):
+            model.partial_fit(examples[start:start + 10])
+        assert model.languages == exact_model.languages
+        assert [model.get_ngram_total(language) for language in model.languages] == \
+            [exact_model.get_ngram_total(language) for language in exact_model.languages]
+        errors = model.get_frequency_rows(ngram_keys) - exact_counts
+
+        # a count is never underestimated, and is over by more than e / width of its language's count with a
+        # probability of at most e^-depth
+        assert (errors >= 0).all()
+        bounds = np.e / sketch_width * model.total_counts
+        assert np.mean(errors > bounds) <= np.exp(-DEFAULT_SKETCH_DEPTH)
+        if sketch_width == 1 << 18:
+            assert (errors == 0).all()
+
+
+def get_separate_models(model, training_file):
+    # unigram, bigram and trigram models trained on their own, like BYOM used to train its sub-models
+    models = [TrainingModelFactory.get_nb_training_model(model.vocabulary, str(ngram_size), model.smoothing_value,
+                                                         training_file) for ngram_size in (1, 2, 3)]
+    for separate_model in models:
+        separate_model.train()
+    return models
+
+
+def get_additive_probability(models, text, language):
+    # the count of the ngram ending the text plus δ, divided by the smoothing mass of its order alone
+    model = models[len(text) - 1]
+    if len(text) == 1:
+        return model.get_ngram_probability(NgramExtractor.pack(text), language)
+    return (model.get_ngram_frequency(NgramExtractor.pack(text), language) + model.smoothing_value) / \
+        (model.smoothing_value * model.vocabulary_size ** len(text))
+
+
+def get_witten_bell_probability(models, text, language):
+    # the probability of the last char of the text given the ones before it, interpolated from the unigram up
+    probability = models[0].get_ngram_probability(NgramExtractor.pack(text[-1]), language)
+    for ngram_size in range(2, len(text) + 1):
+        model = models[ngram_size - 1]
+        # the counts of the ngrams seen after the context, from the model's tree
+        node = model.ngram_frequencies[language]
+        for char in text[-ngram_size:-1]:
+            node = node.get(ord(char), dict())
+        counts = list(node.values())
+        if counts:
+            probability = (model.get_ngram_frequency(NgramExtractor.pack(text[-ngram_size:]), language) +
+                           len(counts) * probability) / (sum(counts) + len(counts))
+    return probability
+
+
+def get_reference_scores(models, languages, tweets, get_probability):
+    # the first char and the first two chars of every tweet, then every trigram, scored one at a time
+    scores = np.zeros((len(tweets), len(languages)))
+    for row, tweet in enumerate(tweets):
+        texts = [tweet[0], tweet[:2]] + [NgramExtractor.decode(trigram, 3)
+                                         for trigram in models[2].parse_tweet(tweet).tolist()]
+        for column, language in enumerate(languages):
+            scores[row, column] = log10(models[0].get_probability_of_language(language)) + \
+                sum(log10(get_probability(models, text, language)) for text in texts)
+    return scores
+
+
+def test_byom_single_pass_counts_and_scores_like_its_separate_models(get_byom_classifier, training_file, test_tweets):
+    tweets = [tweet for tweet in test_tweets[0] if len(tweet) >= 2]
+    for backend in ('dict', 'sparse'):
+        model = get_byom_classifier(backend=backend).training_model
+        separate_models = get_separate_models(model, training_file)
+        for sub_model, separate_model in zip(model.get_sub_models().values(), separate_models):
+            for array, separate_array in zip(sub_model.get_ngram_counts(), separate_model.get_ngram_counts()):
+                assert np.array_equal(array, separate_array)
+
+        expected_scores = get_reference_scores(separate_models, model.languages, tweets, get_witten_bell_probability)
+        assert np.allclose(model.score_matrix(tweets), expected_scores, rtol=1e-12)
+        model.unfreeze()
+        assert np.allclose(model.score_matrix(tweets), expected_scores, rtol=1e-12)
+
+
+def test_byom_is_at_least_as_accurate_as_dividing_by_the_smoothing_mass(get_byom_classifier, tmp_path):
+    # a generated corpus large enough for most contexts of a test tweet to have been seen in training
+    training_file = str(tmp_path / 'training.txt')
+    test_file = str(tmp_path / 'test.txt')
+    generator = CorpusGenerator()
+    generator.write(training_file, 6000)
+    generator.write(test_file, 1000, first_id=6000, seed_offset=1)
+
+    model = get_byom_classifier(training_file=training_file).training_model
+    tweets, languages = HyperparameterSweep.read_test_file(test_file)
+    additive_scores = get_reference_scores(get_separate_models(model, training_file), model.languages, tweets,
+                                           get_additive_probability)
+    accuracies = [np.mean(np.array(model.languages)[np.argmax(scores, axis=1)] == np.array(languages))
+                  for scores in (model.score_matrix(tweets), additive_scores)]
+    assert accuracies[0] >= accuracies[1]
+
+
+def test_trie_byom_of_order_3_scores_like_byom(get_byom_classifier, test_tweets):
+    tweets = [tweet for tweet in test_tweets[0] if len(tweet) >= 2]
+    model = get_byom_classifier().training_model
+    trie_model = get_byom_classifier(backend='trie').training_model
+    assert trie_model.languages == model.languages
+    expected_scores = model.score_matrix(tweets)
+    assert np.allclose(trie_model.score_matrix(tweets), expected_scores, rtol=1e-12)
+    trie_model.unfreeze()
+    assert np.allclose(trie_model.score_matrix(tweets), expected_scores, rtol=1e-12)
+
+
+# words the languages share, words with the same chars, bigrams and trigrams in both languages which only their
+# 4-grams tell apart, and words of each language's own. A tweet ending a context only one language has seen with a
+# char never seen after it is still that language's, as the char was seen after the end of the context
+CONTEXT_WORDS = {'l1': ['hello', 'xaby', 'zabw', 'mnop', 'anoq'], 'l2': ['hello', 'xabw', 'zaby', 'mnrs', 'bnrt']}
+CONTEXT_TEST_TWEETS = [('l1', 'xaby zabw'), ('l1', 'hello mnoq'), ('l2', 'xabw zaby'), ('l2', 'hello mnrt')]
+
+
+def test_trie_byom_of_order_4_is_at_least_as_accurate_as_order_3(get_byom_classifier, tmp_path):
+    training_file = tmp_path / 'training.txt'
+    # every word as often in every position of the tweets of its language
+    lines = ['{}\tuser\t{}\t{}\n'.format(index, language, ' '.join(words[index:] + words[:index]))
+             for language, words in CONTEXT_WORDS.items() for index in range(len(words))]
+    training_file.write_text(''.join(lines), encoding='utf-8')
+    languages, tweets = zip(*CONTEXT_TEST_TWEETS)
+
+    accuracies = dict()
+    for ngram_size in (3, 4):
+        model = get_byom_classifier(ngram_size, str(training_file), backend='trie').training_model
+        predictions = np.array(model.languages)[np.argmax(model.score_matrix(list(tweets)), axis=1)]
+        accuracies[ngram_size] = np.mean(predictions == np.array(languages))
+    assert accuracies[4] >= accuracies[3]
+    assert accuracies[4] == 1